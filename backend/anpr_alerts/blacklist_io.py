@@ -0,0 +1,253 @@
+"""
+Bulk blacklist import and export
+
+Feeds are parsed as a stream (CSV or NDJSON) and written in batches with
+a single upsert per batch, so a 100k-plate feed takes seconds instead of
+one save, log line and alert check per plate. Listeners of
+``blacklist_changed`` (caches, plate search index) are notified once per
+batch.
+"""
+import io
+import re
+import csv
+import json
+import logging
+from django.db import transaction
+from django.dispatch import Signal
+from .models import Blacklist
+
+logger = logging.getLogger(__name__)
+
+IMPORT_BATCH_SIZE = 1000
+EXPORT_CHUNK_SIZE = 2000
+MAX_REPORTED_REJECTS = 100
+PLATE_MIN_LENGTH = 4
+PLATE_MAX_LENGTH = Blacklist._meta.get_field('plate_number').max_length
+FILE_TYPES = ('csv', 'ndjson')
+EXPORT_COLUMNS = ['plate_number', 'reason', 'is_active', 'added_at']
+
+# Sent once per written batch with the affected plate numbers
+blacklist_changed = Signal()
+
+
+def normalize_plate(value):
+    """
+    Canonical plate form: uppercase letters and digits only
+
+    Returns:
+        Normalized plate, or None if it is not a plausible plate number
+    """
+    plate = re.sub(r'[^A-Z0-9]', '', str(value or '').upper())
+    if not PLATE_MIN_LENGTH <= len(plate) <= PLATE_MAX_LENGTH:
+        return None
+    return plate
+
+
+def _parse_bool(value, default=True):
+    if value is None or value == '':
+        return default
+    if isinstance(value, bool):
+        return value
+    value = str(value).strip().lower()
+    if value in ('1', 'true', 'yes', 'y', 'active'):
+        return True
+    if value in ('0', 'false', 'no', 'n', 'inactive'):
+        return False
+    raise ValueError(f"invalid is_active value: {value}")
+
+
+def read_records(stream, file_type):
+    """
+    Stream-parse a feed into raw records
+
+    Args:
+        stream: Binary file-like object
+        file_type: 'csv' (header row required) or 'ndjson' (one JSON object per line)
+
+    Yields:
+        Tuple of (line number, record dict or None, error message or None)
+    """
+    text = io.TextIOWrapper(stream, encoding='utf-8-sig', newline='')
+    if file_type == 'csv':
+        reader = csv.DictReader(text)
+        for record in reader:
+            yield reader.line_num, {k.strip().lower(): v for k, v in record.items() if k}, None
+    elif file_type == 'ndjson':
+        for line_num, line in enumerate(text, start=1):
+            if not line.strip():
+                continue
+            try:
+                record = json.loads(line)
+            except ValueError as e:
+                yield line_num, None, f"invalid JSON: {str(e)}"
+                continue
+            if not isinstance(record, dict):
+                yield line_num, None, "expected a JSON object"
+                continue
+            yield line_num, {str(k).lower(): v for k, v in record.items()}, None
+    else:
+        raise ValueError(f"Unsupported file type: {file_type}")
+
+
+class ImportResult:
+    """Counters for one import run"""
+    def __init__(self):
+        self.inserted = 0
+        self.updated = 0
+        self.unchanged = 0
+        self.deactivated = 0
+        self.rejected = 0
+        self.rejects = []
+
+    def reject(self, line_num, error):
+        self.rejected += 1
+        if len(self.rejects) < MAX_REPORTED_REJECTS:
+            self.rejects.append({'line': line_num, 'error': error})
+
+    def as_dict(self):
+        return {
+            'inserted': self.inserted,
+            'updated': self.updated,
+            'unchanged': self.unchanged,
+            'deactivated': self.deactivated,
+            'rejected': self.rejected,
+            'rejects': self.rejects,
+        }
+
+
+def _clean(record):
+    """Validate one raw record, returning (plate, reason, is_active)"""
+    raw_plate = record.get('plate_number', record.get('plate'))
+    plate = normalize_plate(raw_plate)
+    if plate is None:
+        raise ValueError(f"invalid plate number: {raw_plate!r}")
+    reason = str(record.get('reason') or '').strip()
+    if not reason:
+        raise ValueError("reason is required")
+    return plate, reason, _parse_bool(record.get('is_active'))
+
+
+def _write_batch(batch, result, dry_run):
+    """Upsert one batch of {plate: (reason, is_active)}"""
+    existing = {
+        plate: (reason, is_active)
+        for plate, reason, is_active in Blacklist.objects.filter(
+            plate_number__in=batch.keys()
+        ).values_list('plate_number', 'reason', 'is_active')
+    }
+
+    changed = []
+    for plate, values in batch.items():
+        if plate not in existing:
+            result.inserted += 1
+        elif existing[plate] != values:
+            result.updated += 1
+        else:
+            result.unchanged += 1
+            continue
+        changed.append(Blacklist(plate_number=plate, reason=values[0], is_active=values[1]))
+
+    if dry_run or not changed:
+        return
+
+    with transaction.atomic():
+        Blacklist.objects.bulk_create(
+            changed,
+            update_conflicts=True,
+            unique_fields=['plate_number'],
+            update_fields=['reason', 'is_active'],
+        )
+    blacklist_changed.send(sender=Blacklist, plates=[entry.plate_number for entry in changed])
+
+
+def import_blacklist(stream, file_type, replace=False, batch_size=IMPORT_BATCH_SIZE, dry_run=False):
+    """
+    Import a blacklist feed
+
+    Args:
+        stream: Binary file-like object
+        file_type: 'csv' or 'ndjson'
+        replace: Treat the feed as the complete list; active plates missing
+            from it are deactivated (not deleted, which would also delete
+            their alert history)
+        batch_size: Plates upserted per statement
+        dry_run: Count what would change without writing
+
+    Returns:
+        ImportResult
+    """
+    result = ImportResult()
+    seen = set()
+    batch = {}
+
+    for line_num, record, error in read_records(stream, file_type):
+        if error is None:
+            try:
+                plate, reason, is_active = _clean(record)
+            except ValueError as e:
+                error = str(e)
+        if error is not None:
+            result.reject(line_num, error)
+            continue
+
+        if plate in batch:
+            # Later rows win within a batch
+            del batch[plate]
+        batch[plate] = (reason, is_active)
+        if replace:
+            seen.add(plate)
+
+        if len(batch) >= batch_size:
+            _write_batch(batch, result, dry_run)
+            batch = {}
+
+    if batch:
+        _write_batch(batch, result, dry_run)
+
+    if replace:
+        missing = [
+            entry_id for entry_id, plate in
+            Blacklist.objects.filter(is_active=True).values_list('id', 'plate_number').iterator()
+            if plate not in seen
+        ]
+        result.deactivated = len(missing)
+        if not dry_run:
+            for start in range(0, len(missing), batch_size):
+                chunk = missing[start:start + batch_size]
+                Blacklist.objects.filter(id__in=chunk).update(is_active=False)
+                blacklist_changed.send(
+                    sender=Blacklist,
+                    plates=list(Blacklist.objects.filter(id__in=chunk).values_list('plate_number', flat=True)),
+                )
+
+    logger.info(
+        f"Blacklist import{' (dry run)' if dry_run else ''}: {result.inserted} inserted, "
+        f"{result.updated} updated, {result.unchanged} unchanged, {result.deactivated} deactivated, "
+        f"{result.rejected} rejected"
+    )
+    return result
+
+
+def export_rows(chunk_size=EXPORT_CHUNK_SIZE):
+    """Yield blacklist rows as lists matching EXPORT_COLUMNS, in keyset chunks on id"""
+    last_id = 0
+    while True:
+        chunk = list(Blacklist.objects.filter(id__gt=last_id).order_by('id').values_list(
+            'id', 'plate_number', 'reason', 'is_active', 'added_at')[:chunk_size])
+        for _, plate, reason, is_active, added_at in chunk:
+            yield [plate, reason, is_active, added_at.isoformat()]
+        if len(chunk) < chunk_size:
+            break
+        last_id = chunk[-1][0]
+
+
+def iter_ndjson(rows, columns=EXPORT_COLUMNS, rows_per_write=500):
+    """Encode rows as NDJSON, yielding UTF-8 chunks of several rows each"""
+    pending = []
+    for row in rows:
+        pending.append(json.dumps(dict(zip(columns, row))))
+        if len(pending) >= rows_per_write:
+            yield ('\n'.join(pending) + '\n').encode('utf-8')
+            pending = []
+    if pending:
+        yield ('\n'.join(pending) + '\n').encode('utf-8')
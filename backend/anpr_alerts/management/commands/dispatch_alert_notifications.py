@@ -0,0 +1,40 @@
+"""
+Management command to deliver queued alert notifications
+"""
+import time
+import logging
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+from anpr_alerts.notifications import NotificationDispatcher
+
+logger = logging.getLogger(__name__)
+
+class Command(BaseCommand):
+    help = 'Deliver queued alert notifications (runs until interrupted unless --once is given)'
+    
+    def add_arguments(self, parser):
+        parser.add_argument('--once', action='store_true', help='Deliver one batch per channel and exit')
+        
+    def handle(self, *args, **options):
+        dispatcher = NotificationDispatcher()
+        
+        if options['once']:
+            self._report(dispatcher.dispatch_once())
+            return
+            
+        self.stdout.write(f"Dispatching notifications for channels: {', '.join(dispatcher.config['CHANNELS'])}")
+        try:
+            while True:
+                results = dispatcher.dispatch_once()
+                close_old_connections()
+                if any(sent or failed for sent, failed in results.values()):
+                    self._report(results)
+                else:
+                    time.sleep(dispatcher.config['POLL_INTERVAL'])
+        except KeyboardInterrupt:
+            self.stdout.write("Stopped")
+            
+    def _report(self, results):
+        for channel, (sent, failed) in results.items():
+            style = self.style.ERROR if failed else self.style.SUCCESS
+            self.stdout.write(style(f"{channel}: {sent} delivered, {failed} failed"))
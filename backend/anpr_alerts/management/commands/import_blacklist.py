@@ -0,0 +1,53 @@
+"""
+Management command to bulk import a blacklist feed
+"""
+import os
+import time
+import logging
+from django.core.management.base import BaseCommand, CommandError
+from anpr_alerts.blacklist_io import import_blacklist, FILE_TYPES, IMPORT_BATCH_SIZE
+
+logger = logging.getLogger(__name__)
+
+class Command(BaseCommand):
+    help = 'Import blacklisted plates from a CSV (plate_number,reason[,is_active]) or NDJSON feed'
+    
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='Feed file')
+        parser.add_argument('--file-type', choices=FILE_TYPES, help='Defaults from the file extension')
+        parser.add_argument('--replace', action='store_true',
+                            help='Deactivate active plates that are not in the feed')
+        parser.add_argument('--batch-size', type=int, default=IMPORT_BATCH_SIZE, help='Plates upserted per statement')
+        parser.add_argument('--dry-run', action='store_true', help='Only report what would change')
+        
+    def handle(self, *args, **options):
+        file_type = options['file_type'] or os.path.splitext(options['path'])[1].lstrip('.').lower()
+        if file_type == 'jsonl':
+            file_type = 'ndjson'
+        if file_type not in FILE_TYPES:
+            raise CommandError(f"Cannot infer the file type of {options['path']}; pass --file-type")
+            
+        started = time.perf_counter()
+        try:
+            with open(options['path'], 'rb') as stream:
+                result = import_blacklist(
+                    stream,
+                    file_type,
+                    replace=options['replace'],
+                    batch_size=options['batch_size'],
+                    dry_run=options['dry_run'],
+                )
+        except OSError as e:
+            raise CommandError(str(e))
+        elapsed = time.perf_counter() - started
+        
+        for reject in result.rejects:
+            self.stdout.write(self.style.WARNING(f"Line {reject['line']}: {reject['error']}"))
+            
+        processed = result.inserted + result.updated + result.unchanged
+        prefix = 'Dry run: ' if options['dry_run'] else ''
+        self.stdout.write(self.style.SUCCESS(
+            f"{prefix}{result.inserted} inserted, {result.updated} updated, {result.unchanged} unchanged, "
+            f"{result.deactivated} deactivated, {result.rejected} rejected "
+            f"in {elapsed:.1f}s ({processed / max(elapsed, 1e-9):.0f} plates/s)"
+        ))
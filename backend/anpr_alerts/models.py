@@ -1,7 +1,6 @@
-from django.db import models
+from django.db import models, transaction
+from django.utils import timezone
 import logging
-from django.core.mail import send_mail
-from django.conf import settings
 
 logger = logging.getLogger(__name__)
 
@@ -24,6 +23,13 @@ class Blacklist(models.Model):
             logger.info(f"New plate added to blacklist: {self.plate_number}, Reason: {self.reason}")
         else:
             logger.info(f"Blacklist entry updated: {self.plate_number}")
+        
+        # Make the plate findable by partial search
+        try:
+            from anpr_detection.plate_search import index_plates
+            index_plates([self.plate_number])
+        except Exception as e:
+            logger.error(f"Failed to index plate {self.plate_number} for search: {str(e)}")
             
     class Meta:
         verbose_name = "Blacklisted Plate"
@@ -41,36 +47,72 @@ class Alert(models.Model):
         return f"Alert: {self.blacklist_entry.plate_number} at {self.timestamp}"
     
     def save(self, *args, **kwargs):
-        # Log and send email when a new alert is created
+        # Log and queue notifications when a new alert is created
         is_new = self.pk is None
-        super().save(*args, **kwargs)
+        with transaction.atomic():
+            super().save(*args, **kwargs)
+            if is_new:
+                self.queue_notifications()
+                from anpr_detection.events import publish_alert
+                transaction.on_commit(lambda: publish_alert(self))
         
         if is_new:
             logger.warning(f"ALERT: Blacklisted plate detected - {self.blacklist_entry.plate_number}")
-            self.send_notification()
     
-    def send_notification(self):
-        """Send email notification about the alert"""
-        try:
-            # In a real system, you'd send to security personnel or admins
-            # For now, just log it
-            subject = f"ANPR Alert: Blacklisted plate {self.blacklist_entry.plate_number} detected"
-            message = f"""
-            Alert Details:
-            - Plate Number: {self.blacklist_entry.plate_number}
-            - Reason for Blacklisting: {self.blacklist_entry.reason}
-            - Detection Time: {self.timestamp}
-            - Camera: {self.detection.camera.name}
-            - Location: {self.detection.camera.location}
-            """
-            
-            # Uncomment in production with real email addresses
-            # from_email = settings.DEFAULT_FROM_EMAIL
-            # recipient_list = ['security@example.com']
-            # send_mail(subject, message, from_email, recipient_list)
-            
-            logger.info(f"Alert notification sent for plate {self.blacklist_entry.plate_number}")
-            self.notified = True
-            self.save(update_fields=['notified'])
-        except Exception as e:
-            logger.error(f"Failed to send alert notification: {str(e)}")
+    def queue_notifications(self):
+        """
+        Add outbox entries for every configured notification channel
+        
+        Runs in the same transaction as the alert insert, so an alert is
+        never committed without its notifications (or vice versa). Delivery
+        happens later in the notification dispatcher, off the detection path.
+        """
+        from .notifications import get_notification_settings, NotificationDispatcher
+        
+        channels = get_notification_settings()['CHANNELS']
+        if not channels:
+            return
+        NotificationOutbox.objects.bulk_create([
+            NotificationOutbox(alert=self, channel=channel) for channel in channels
+        ])
+        transaction.on_commit(NotificationDispatcher.notify)
+    
+    class Meta:
+        indexes = [
+            models.Index(fields=['-timestamp', '-id']),  # Cursor pagination
+        ]
+
+
+class NotificationOutbox(models.Model):
+    """
+    Pending notification for one alert on one channel (transactional outbox)
+    
+    Rows are written with the alert and delivered by the notification
+    dispatcher, which retries failures with exponential backoff.
+    """
+    STATUS_CHOICES = [
+        ('pending', 'Pending'),
+        ('sending', 'Sending'),
+        ('sent', 'Sent'),
+        ('failed', 'Failed'),
+    ]
+    
+    alert = models.ForeignKey(Alert, on_delete=models.CASCADE, related_name='notifications')
+    channel = models.CharField(max_length=20)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='pending')
+    attempts = models.PositiveIntegerField(default=0)
+    next_attempt_at = models.DateTimeField(default=timezone.now)
+    claim_token = models.CharField(max_length=32, blank=True, default='')
+    claimed_at = models.DateTimeField(null=True, blank=True)
+    last_error = models.TextField(blank=True, default='')
+    created_at = models.DateTimeField(auto_now_add=True)
+    sent_at = models.DateTimeField(null=True, blank=True)
+    
+    def __str__(self):
+        return f"{self.channel} notification for alert {self.alert_id} ({self.status})"
+    
+    class Meta:
+        indexes = [
+            models.Index(fields=['status', 'channel', 'next_attempt_at']),  # Due entries per channel
+            models.Index(fields=['claim_token']),
+        ]
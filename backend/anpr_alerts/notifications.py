@@ -0,0 +1,354 @@
+"""
+Alert notification delivery from the NotificationOutbox
+
+Alerts only write outbox rows on the detection path. The dispatcher
+claims due rows in batches and delivers them per channel, subject to a
+per-channel token-bucket rate limit. When many alerts are due at once
+(an alert storm) or the rate limit would be exceeded, they are coalesced
+into one digest message. Failed deliveries are retried with exponential
+backoff until MAX_ATTEMPTS, and delivered alerts are marked ``notified``
+in one bulk update.
+"""
+import json
+import time
+import uuid
+import random
+import logging
+import threading
+import urllib.request
+from datetime import timedelta
+from django.conf import settings
+from django.core.mail import EmailMessage, get_connection
+from django.db import close_old_connections
+from django.utils import timezone
+from anpr_backend.caching import invalidate
+from .models import Alert, NotificationOutbox
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_NOTIFICATION_SETTINGS = {
+    'CHANNELS': ['email'],
+    'EMAIL_RECIPIENTS': [],
+    'EMAIL_FROM': None,  # Defaults to DEFAULT_FROM_EMAIL
+    'WEBHOOK_URL': '',
+    'WEBHOOK_TIMEOUT': 5.0,
+    'BATCH_SIZE': 100,
+    'POLL_INTERVAL': 5.0,
+    'MAX_ATTEMPTS': 8,
+    'BACKOFF_BASE': 2.0,
+    'BACKOFF_MAX': 600.0,
+    'CLAIM_TIMEOUT': 300,
+    'RATE_LIMITS': {'email': 20, 'webhook': 120},  # Messages per minute
+    'DIGEST_THRESHOLD': 5,
+    'DISPATCH_IN_PROCESS': True,
+}
+
+
+def get_notification_settings():
+    """Return ANPR_NOTIFICATIONS settings merged over the defaults"""
+    config = dict(DEFAULT_NOTIFICATION_SETTINGS)
+    config.update(getattr(settings, 'ANPR_NOTIFICATIONS', {}))
+    return config
+
+
+class DeliveryError(Exception):
+    """Raised by a channel when a message could not be delivered"""
+
+
+def alert_context(alert):
+    """Plain-data description of an alert shared by all channels"""
+    camera = alert.detection.camera
+    return {
+        'alert_id': alert.id,
+        'detection_id': alert.detection_id,
+        'plate_number': alert.blacklist_entry.plate_number,
+        'reason': alert.blacklist_entry.reason,
+        'timestamp': alert.timestamp.isoformat(),
+        'camera': camera.name,
+        'location': camera.location,
+    }
+
+
+class EmailChannel:
+    """Email through Django's configured EMAIL_BACKEND"""
+    name = 'email'
+
+    def __init__(self, config):
+        self.recipients = list(config['EMAIL_RECIPIENTS'])
+        self.from_email = config['EMAIL_FROM'] or settings.DEFAULT_FROM_EMAIL
+        self.connection = None
+
+    def open(self):
+        # One connection for the whole batch instead of one per message
+        self.connection = get_connection(fail_silently=False)
+        self.connection.open()
+
+    def close(self):
+        if self.connection:
+            self.connection.close()
+            self.connection = None
+
+    def _send(self, subject, body):
+        if not self.recipients:
+            logger.info(f"No EMAIL_RECIPIENTS configured, logging notification only: {subject}")
+            return
+        try:
+            EmailMessage(subject, body, self.from_email, self.recipients, connection=self.connection).send()
+        except Exception as e:
+            raise DeliveryError(str(e))
+
+    def send(self, context):
+        subject = f"ANPR Alert: Blacklisted plate {context['plate_number']} detected"
+        body = f"""
+            Alert Details:
+            - Plate Number: {context['plate_number']}
+            - Reason for Blacklisting: {context['reason']}
+            - Detection Time: {context['timestamp']}
+            - Camera: {context['camera']}
+            - Location: {context['location']}
+            """
+        self._send(subject, body)
+
+    def send_digest(self, contexts):
+        subject = f"ANPR Alert digest: {len(contexts)} blacklisted plate detections"
+        lines = [
+            f"- {c['timestamp']} {c['plate_number']} at {c['camera']} ({c['location']}): {c['reason']}"
+            for c in contexts
+        ]
+        self._send(subject, "Alert Details:\n" + "\n".join(lines))
+
+
+class WebhookChannel:
+    """JSON POST to ANPR_NOTIFICATIONS['WEBHOOK_URL']"""
+    name = 'webhook'
+
+    def __init__(self, config):
+        self.url = config['WEBHOOK_URL']
+        self.timeout = config['WEBHOOK_TIMEOUT']
+
+    def open(self):
+        if not self.url:
+            raise DeliveryError("No WEBHOOK_URL configured")
+
+    def close(self):
+        pass
+
+    def _post(self, payload):
+        request = urllib.request.Request(
+            self.url,
+            data=json.dumps(payload).encode('utf-8'),
+            headers={'Content-Type': 'application/json'},
+            method='POST',
+        )
+        try:
+            with urllib.request.urlopen(request, timeout=self.timeout) as response:
+                if not 200 <= response.status < 300:
+                    raise DeliveryError(f"Webhook returned HTTP {response.status}")
+        except DeliveryError:
+            raise
+        except Exception as e:
+            raise DeliveryError(str(e))
+
+    def send(self, context):
+        self._post({'event': 'alert', 'alert': context})
+
+    def send_digest(self, contexts):
+        self._post({'event': 'alert_digest', 'count': len(contexts), 'alerts': contexts})
+
+
+CHANNELS = {
+    'email': EmailChannel,
+    'webhook': WebhookChannel,
+}
+
+
+class RateLimiter:
+    """Token bucket allowing `per_minute` messages with bursts up to the same amount"""
+    def __init__(self, per_minute):
+        self.rate = per_minute / 60.0
+        self.capacity = max(1.0, float(per_minute))
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def available(self):
+        with self.lock:
+            now = time.monotonic()
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            return int(self.tokens)
+
+    def take(self, count):
+        with self.lock:
+            self.tokens -= count
+
+
+class NotificationDispatcher:
+    """
+    Deliver outbox entries in batches
+
+    Runs as a background thread in the web process (started on the first
+    committed alert when DISPATCH_IN_PROCESS is set) or in the foreground
+    via the dispatch_alert_notifications command. Rows are claimed with a
+    token before delivery, so several dispatchers can run side by side.
+    """
+    _instance = None
+    _instance_lock = threading.Lock()
+
+    def __new__(cls):
+        with cls._instance_lock:
+            if cls._instance is None:
+                instance = super(NotificationDispatcher, cls).__new__(cls)
+                instance.config = get_notification_settings()
+                instance.limiters = {
+                    name: RateLimiter(instance.config['RATE_LIMITS'].get(name, 60))
+                    for name in instance.config['CHANNELS']
+                }
+                instance.wake = threading.Event()
+                instance.stopping = threading.Event()
+                instance.thread = None
+                cls._instance = instance
+        return cls._instance
+
+    @classmethod
+    def notify(cls):
+        """Wake the in-process dispatcher after an alert is committed"""
+        dispatcher = cls()
+        if not dispatcher.config['DISPATCH_IN_PROCESS']:
+            return
+        dispatcher.start()
+        dispatcher.wake.set()
+
+    def start(self):
+        with self._instance_lock:
+            if self.thread is None or not self.thread.is_alive():
+                self.stopping.clear()
+                self.thread = threading.Thread(target=self.run_forever, name='anpr-notifications', daemon=True)
+                self.thread.start()
+
+    def stop(self):
+        self.stopping.set()
+        self.wake.set()
+
+    def run_forever(self):
+        """Dispatch until stopped, sleeping POLL_INTERVAL between idle rounds"""
+        while not self.stopping.is_set():
+            try:
+                self.dispatch_once()
+            except Exception as e:
+                logger.error(f"Notification dispatch failed: {str(e)}")
+            finally:
+                close_old_connections()
+            self.wake.wait(self.config['POLL_INTERVAL'])
+            self.wake.clear()
+
+    def dispatch_once(self):
+        """
+        Deliver one batch per channel
+
+        Returns:
+            Dictionary of channel name -> (delivered, failed) entry counts
+        """
+        self._release_stale_claims()
+        return {name: self._dispatch_channel(name) for name in self.config['CHANNELS']}
+
+    def _release_stale_claims(self):
+        """Return entries claimed by a dispatcher that died mid-batch to the queue"""
+        cutoff = timezone.now() - timedelta(seconds=self.config['CLAIM_TIMEOUT'])
+        NotificationOutbox.objects.filter(status='sending', claimed_at__lt=cutoff).update(
+            status='pending', claim_token='')
+
+    def _claim(self, name, limit):
+        now = timezone.now()
+        due = list(NotificationOutbox.objects.filter(
+            status='pending', channel=name, next_attempt_at__lte=now
+        ).order_by('next_attempt_at', 'id').values_list('id', flat=True)[:limit])
+        if not due:
+            return []
+
+        token = uuid.uuid4().hex
+        NotificationOutbox.objects.filter(id__in=due, status='pending').update(
+            status='sending', claim_token=token, claimed_at=now)
+        return list(NotificationOutbox.objects.filter(claim_token=token, status='sending').select_related(
+            'alert__blacklist_entry', 'alert__detection__camera'
+        ).order_by('id'))
+
+    def _dispatch_channel(self, name):
+        channel_class = CHANNELS.get(name)
+        if channel_class is None:
+            logger.error(f"Unknown notification channel: {name}")
+            return (0, 0)
+
+        limiter = self.limiters[name]
+        tokens = limiter.available()
+        if tokens < 1:
+            return (0, 0)
+
+        entries = self._claim(name, self.config['BATCH_SIZE'])
+        if not entries:
+            return (0, 0)
+
+        channel = channel_class(self.config)
+        sent, failed = [], []
+        try:
+            channel.open()
+            contexts = [alert_context(entry.alert) for entry in entries]
+
+            if len(entries) >= self.config['DIGEST_THRESHOLD'] or len(entries) > tokens:
+                limiter.take(1)
+                try:
+                    channel.send_digest(contexts)
+                    sent = entries
+                except DeliveryError as e:
+                    failed = [(entry, str(e)) for entry in entries]
+            else:
+                limiter.take(len(entries))
+                for entry, context in zip(entries, contexts):
+                    try:
+                        channel.send(context)
+                        sent.append(entry)
+                    except DeliveryError as e:
+                        failed.append((entry, str(e)))
+        except Exception as e:
+            done = set(id(entry) for entry in sent)
+            failed = [(entry, str(e)) for entry in entries if id(entry) not in done]
+        finally:
+            channel.close()
+
+        self._finish(sent, failed)
+        if failed:
+            logger.warning(f"{len(failed)} {name} notifications failed: {failed[0][1]}")
+        return (len(sent), len(failed))
+
+    def backoff(self, attempts):
+        """Delay before retry number `attempts`, with jitter so retries spread out"""
+        delay = min(self.config['BACKOFF_BASE'] * (2 ** (attempts - 1)), self.config['BACKOFF_MAX'])
+        return timedelta(seconds=delay * random.uniform(0.8, 1.2))
+
+    def _finish(self, sent, failed):
+        now = timezone.now()
+        for entry in sent:
+            entry.status = 'sent'
+            entry.sent_at = now
+            entry.attempts += 1
+            entry.claim_token = ''
+        for entry, error in failed:
+            entry.attempts += 1
+            entry.status = 'failed' if entry.attempts >= self.config['MAX_ATTEMPTS'] else 'pending'
+            entry.next_attempt_at = now + self.backoff(entry.attempts)
+            entry.last_error = error[:1000]
+            entry.claim_token = ''
+
+        entries = sent + [entry for entry, _ in failed]
+        if entries:
+            NotificationOutbox.objects.bulk_update(
+                entries, ['status', 'sent_at', 'attempts', 'next_attempt_at', 'last_error', 'claim_token'])
+
+        if sent:
+            # An alert is notified once no channel still has it outstanding
+            Alert.objects.filter(
+                id__in={entry.alert_id for entry in sent}, notified=False
+            ).exclude(
+                notifications__status__in=['pending', 'sending', 'failed']
+            ).update(notified=True)
+            invalidate('alerts')
@@ -1,5 +1,6 @@
 from rest_framework import serializers
 from .models import Blacklist, Alert
+from .blacklist_io import normalize_plate
 
 class BlacklistSerializer(serializers.ModelSerializer):
     """Serializer for Blacklist model"""
@@ -8,6 +9,13 @@ class BlacklistSerializer(serializers.ModelSerializer):
         model = Blacklist
         fields = ['id', 'plate_number', 'reason', 'added_at', 'is_active']
         read_only_fields = ['added_at']
+    
+    def validate_plate_number(self, value):
+        # Store plates in the same canonical form as bulk imports and OCR output
+        plate = normalize_plate(value)
+        if plate is None:
+            raise serializers.ValidationError("Enter a plate number of 4-20 letters and digits")
+        return plate
 
 
 class AlertSerializer(serializers.ModelSerializer):
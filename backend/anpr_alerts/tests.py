@@ -1,3 +1,207 @@
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.db import connection
 from django.test import TestCase
+from django.utils import timezone
+from django.test.utils import CaptureQueriesContext
+from anpr_cameras.models import Camera
+from anpr_detection.models import Detection
+from .models import Blacklist, Alert, NotificationOutbox
+from .notifications import NotificationDispatcher
 
-# Create your tests here.
+
+class AlertListQueryCountTests(TestCase):
+    """The alert list must run a fixed number of queries whatever the page size"""
+
+    def setUp(self):
+        self.cameras = [
+            Camera.objects.create(name=f"Camera {i}", rtsp_url='rtsp://test/stream', location=f"Gate {i}")
+            for i in range(3)
+        ]
+        self.created = 0
+
+    def _create_alerts(self, count):
+        for _ in range(count):
+            self.created += 1
+            plate = f"AB{self.created:04d}"
+            entry = Blacklist.objects.create(plate_number=plate, reason='Stolen vehicle')
+            detection = Detection.objects.create(
+                plate_number=plate,
+                camera=self.cameras[self.created % len(self.cameras)],
+                confidence=0.9,
+                processed=True,
+            )
+            Alert.objects.create(detection=detection, blacklist_entry=entry)
+
+    def _count_queries(self, url):
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return len(context.captured_queries), response.json()
+
+    def test_list_query_count_is_constant(self):
+        self._create_alerts(2)
+        small_count, small = self._count_queries('/api/alerts/')
+        self.assertEqual(len(small['results']), 2)
+
+        self._create_alerts(15)
+        large_count, large = self._count_queries('/api/alerts/')
+        self.assertEqual(len(large['results']), 17)
+        self.assertEqual(small_count, large_count)
+
+    def test_list_includes_joined_fields(self):
+        self._create_alerts(1)
+        _, data = self._count_queries('/api/alerts/')
+        alert = data['results'][0]
+        self.assertEqual(alert['plate_number'], 'AB0001')
+        self.assertEqual(alert['reason'], 'Stolen vehicle')
+        self.assertEqual(alert['camera_name'], 'Camera 1')
+        self.assertEqual(alert['camera_location'], 'Gate 1')
+
+    def test_search_query_count_is_constant(self):
+        self._create_alerts(2)
+        small_count, _ = self._count_queries('/api/alerts/?search=AB')
+        self._create_alerts(10)
+        large_count, data = self._count_queries('/api/alerts/?search=AB')
+        self.assertEqual(len(data['results']), 12)
+        self.assertEqual(small_count, large_count)
+
+
+class WebhookReceiver(BaseHTTPRequestHandler):
+    """Local stand-in for a webhook endpoint; fails while `failures` is positive"""
+    payloads = []
+    failures = 0
+
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers['Content-Length']))
+        if WebhookReceiver.failures > 0:
+            WebhookReceiver.failures -= 1
+            self.send_response(500)
+        else:
+            WebhookReceiver.payloads.append(json.loads(body))
+            self.send_response(204)
+        self.end_headers()
+
+    def log_message(self, *args):
+        pass
+
+
+class NotificationOutboxTests(TestCase):
+    """Alerts queue notifications that the dispatcher delivers in batches"""
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.server = HTTPServer(('127.0.0.1', 0), WebhookReceiver)
+        threading.Thread(target=cls.server.serve_forever, daemon=True).start()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.shutdown()
+        cls.server.server_close()
+        super().tearDownClass()
+
+    def setUp(self):
+        WebhookReceiver.payloads = []
+        WebhookReceiver.failures = 0
+        self.camera = Camera.objects.create(name='Gate', rtsp_url='rtsp://test/stream', location='North')
+        self.config = {
+            'CHANNELS': ['webhook'],
+            'WEBHOOK_URL': f"http://127.0.0.1:{self.server.server_port}/hook",
+            'DIGEST_THRESHOLD': 3,
+            'RATE_LIMITS': {'webhook': 600},
+            'DISPATCH_IN_PROCESS': False,
+        }
+        NotificationDispatcher._instance = None
+        self.addCleanup(setattr, NotificationDispatcher, '_instance', None)
+
+    def _create_alerts(self, count):
+        for i in range(count):
+            entry = Blacklist.objects.create(plate_number=f"WH{i:04d}", reason='Stolen vehicle')
+            Detection.objects.create(plate_number=entry.plate_number, camera=self.camera, confidence=0.9)
+
+    def test_alerts_are_queued_not_sent_inline(self):
+        with self.settings(ANPR_NOTIFICATIONS=self.config):
+            self._create_alerts(2)
+        self.assertEqual(NotificationOutbox.objects.filter(status='pending').count(), 2)
+        self.assertEqual(WebhookReceiver.payloads, [])
+
+    def test_dispatch_delivers_and_marks_notified(self):
+        with self.settings(ANPR_NOTIFICATIONS=self.config):
+            self._create_alerts(2)
+            results = NotificationDispatcher().dispatch_once()
+        self.assertEqual(results['webhook'], (2, 0))
+        self.assertEqual([p['event'] for p in WebhookReceiver.payloads], ['alert', 'alert'])
+        self.assertEqual(Alert.objects.filter(notified=True).count(), 2)
+
+    def test_storm_is_coalesced_into_digest(self):
+        with self.settings(ANPR_NOTIFICATIONS=self.config):
+            self._create_alerts(5)
+            NotificationDispatcher().dispatch_once()
+        self.assertEqual(len(WebhookReceiver.payloads), 1)
+        self.assertEqual(WebhookReceiver.payloads[0]['event'], 'alert_digest')
+        self.assertEqual(WebhookReceiver.payloads[0]['count'], 5)
+
+    def test_failures_are_retried_with_backoff(self):
+        WebhookReceiver.failures = 1
+        with self.settings(ANPR_NOTIFICATIONS=self.config):
+            self._create_alerts(1)
+            dispatcher = NotificationDispatcher()
+            self.assertEqual(dispatcher.dispatch_once()['webhook'], (0, 1))
+
+            entry = NotificationOutbox.objects.get()
+            self.assertEqual((entry.status, entry.attempts), ('pending', 1))
+            self.assertGreater(entry.next_attempt_at, timezone.now())
+
+            # Not due yet, then delivered once the backoff has passed
+            self.assertEqual(dispatcher.dispatch_once()['webhook'], (0, 0))
+            NotificationOutbox.objects.update(next_attempt_at=timezone.now())
+            self.assertEqual(dispatcher.dispatch_once()['webhook'], (1, 0))
+        self.assertTrue(Alert.objects.get().notified)
+
+
+class BlacklistImportTests(TestCase):
+    """Bulk import upserts, rejects bad rows and can replace the whole list"""
+
+    def _import(self, content, file_type='csv', **params):
+        upload = SimpleUploadedFile(f"feed.{file_type}", content.encode('utf-8'))
+        response = self.client.post('/api/blacklist/import/', {'file': upload, **params})
+        self.assertEqual(response.status_code, 200)
+        return response.json()
+
+    def test_csv_upsert(self):
+        Blacklist.objects.create(plate_number='MH12AB1234', reason='Old reason')
+        result = self._import(
+            "plate_number,reason\n"
+            "mh-12-ab-1234,Stolen vehicle\n"
+            "KA 01 XY 9999,Unpaid fines\n"
+            "x,Too short\n"
+            "DL05CD5555,\n"
+        )
+        self.assertEqual((result['inserted'], result['updated'], result['rejected']), (1, 1, 2))
+        self.assertEqual(Blacklist.objects.get(plate_number='MH12AB1234').reason, 'Stolen vehicle')
+        self.assertTrue(Blacklist.objects.filter(plate_number='KA01XY9999').exists())
+        # Imported plates are searchable straight away
+        results = self.client.get('/api/blacklist/', {'search': 'XY99'}).json()['results']
+        self.assertEqual([row['plate_number'] for row in results], ['KA01XY9999'])
+
+    def test_ndjson_replace_deactivates_missing(self):
+        Blacklist.objects.create(plate_number='MH12AB1234', reason='Stolen vehicle')
+        Blacklist.objects.create(plate_number='KA01XY9999', reason='Unpaid fines')
+        result = self._import('{"plate": "KA01XY9999", "reason": "Unpaid fines"}\n', file_type='ndjson',
+                              replace='true')
+        self.assertEqual((result['unchanged'], result['deactivated']), (1, 1))
+        self.assertFalse(Blacklist.objects.get(plate_number='MH12AB1234').is_active)
+
+    def test_dry_run_writes_nothing(self):
+        result = self._import("plate_number,reason\nMH12AB1234,Stolen vehicle\n", dry_run='true')
+        self.assertEqual(result['inserted'], 1)
+        self.assertFalse(Blacklist.objects.exists())
+
+    def test_export_streams_all_rows(self):
+        Blacklist.objects.create(plate_number='MH12AB1234', reason='Stolen vehicle')
+        response = self.client.get('/api/blacklist/export/', {'file_type': 'ndjson'})
+        rows = [json.loads(line) for line in b''.join(response.streaming_content).decode().splitlines()]
+        self.assertEqual([row['plate_number'] for row in rows], ['MH12AB1234'])
@@ -1,9 +1,17 @@
-from rest_framework import viewsets, filters
+from rest_framework import viewsets
 from rest_framework.decorators import action
+from rest_framework.parsers import MultiPartParser
 from rest_framework.response import Response
+from django.http import StreamingHttpResponse
 import logging
+import os
 from .models import Blacklist, Alert
 from .serializers import BlacklistSerializer, AlertSerializer
+from .blacklist_io import import_blacklist, export_rows, iter_ndjson, EXPORT_COLUMNS, FILE_TYPES
+from anpr_reports.exports import iter_csv
+from anpr_detection.pagination import TimestampCursorPagination
+from anpr_detection.plate_search import PlateSearchFilter
+from anpr_backend.caching import cached_response
 
 logger = logging.getLogger(__name__)
 
@@ -11,8 +19,16 @@ class BlacklistViewSet(viewsets.ModelViewSet):
     """ViewSet for viewing and editing Blacklist instances"""
     queryset = Blacklist.objects.all()
     serializer_class = BlacklistSerializer
-    filter_backends = [filters.SearchFilter]
-    search_fields = ['plate_number']
+    # ?search= takes partial/wildcard plates, resolved through the plate search index
+    filter_backends = [PlateSearchFilter]
+    
+    @cached_response('blacklist')
+    def list(self, request, *args, **kwargs):
+        return super().list(request, *args, **kwargs)
+    
+    @cached_response('blacklist')
+    def retrieve(self, request, *args, **kwargs):
+        return super().retrieve(request, *args, **kwargs)
     
     def perform_create(self, serializer):
         logger.info(f"Adding plate to blacklist: {serializer.validated_data.get('plate_number')}")
@@ -25,14 +41,72 @@ class BlacklistViewSet(viewsets.ModelViewSet):
     def perform_destroy(self, instance):
         logger.info(f"Removing plate from blacklist: {instance.plate_number}")
         instance.delete()
+    
+    @action(detail=False, methods=['post'], url_path='import', parser_classes=[MultiPartParser])
+    def bulk_import(self, request):
+        """
+        Bulk import a CSV or NDJSON feed uploaded as ``file``
+        
+        Parameters:
+            file_type: csv or ndjson (defaults from the file extension)
+            replace: true to deactivate active plates missing from the feed
+            dry_run: true to only report what would change
+        """
+        upload = request.FILES.get('file')
+        if upload is None:
+            return Response({'error': 'Upload the feed as "file"'}, status=400)
+        
+        file_type = request.data.get('file_type') or os.path.splitext(upload.name)[1].lstrip('.').lower()
+        if file_type == 'jsonl':
+            file_type = 'ndjson'
+        if file_type not in FILE_TYPES:
+            return Response({'error': f"file_type must be one of: {', '.join(FILE_TYPES)}"}, status=400)
+        
+        result = import_blacklist(
+            upload,
+            file_type,
+            replace=_is_true(request.data.get('replace')),
+            dry_run=_is_true(request.data.get('dry_run')),
+        )
+        return Response(result.as_dict())
+    
+    @action(detail=False, methods=['get'])
+    def export(self, request):
+        """Stream the whole blacklist as CSV (default) or NDJSON (?file_type=ndjson)"""
+        file_type = request.query_params.get('file_type', 'csv')
+        if file_type not in FILE_TYPES:
+            return Response({'error': f"file_type must be one of: {', '.join(FILE_TYPES)}"}, status=400)
+        
+        if file_type == 'csv':
+            response = StreamingHttpResponse(iter_csv(export_rows(), header=EXPORT_COLUMNS), content_type='text/csv')
+        else:
+            response = StreamingHttpResponse(iter_ndjson(export_rows()), content_type='application/x-ndjson')
+        response['Content-Disposition'] = f'attachment; filename="blacklist.{file_type}"'
+        return response
+
+
+def _is_true(value):
+    return str(value).lower() in ('1', 'true', 'yes')
 
 
 class AlertViewSet(viewsets.ReadOnlyModelViewSet):
     """ViewSet for viewing Alert instances (read-only)"""
-    queryset = Alert.objects.all().order_by('-timestamp')
+    # Serializer reads blacklist_entry and detection.camera fields, so join them up front
+    queryset = Alert.objects.select_related(
+        'blacklist_entry', 'detection__camera'
+    ).order_by('-timestamp', '-id')
     serializer_class = AlertSerializer
-    filter_backends = [filters.SearchFilter]
-    search_fields = ['blacklist_entry__plate_number']
+    pagination_class = TimestampCursorPagination
+    filter_backends = [PlateSearchFilter]
+    plate_search_field = 'blacklist_entry__plate_number'
+    
+    @cached_response('alerts')
+    def list(self, request, *args, **kwargs):
+        return super().list(request, *args, **kwargs)
+    
+    @cached_response('alerts')
+    def retrieve(self, request, *args, **kwargs):
+        return super().retrieve(request, *args, **kwargs)
     
     @action(detail=True, methods=['post'])
     def mark_as_notified(self, request, pk=None):
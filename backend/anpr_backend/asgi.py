@@ -3,6 +3,11 @@ ASGI config for anpr_backend project.
 
 It exposes the ASGI callable as a module-level variable named ``application``.
 
+Serve with an ASGI server (e.g. ``uvicorn anpr_backend.asgi:application``) to
+use the async image-processing endpoint at /api/process-image/async/ and the
+live detection/alert event stream at /api/events/. Events are published
+in-process, so run camera streams in the same process as the event stream.
+
 For more information on this file, see
 https://docs.djangoproject.com/en/4.2/howto/deployment/asgi/
 """
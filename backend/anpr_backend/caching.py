@@ -0,0 +1,223 @@
+"""
+Response caching for hot read endpoints with write-driven invalidation
+
+Every cached response belongs to one or more namespaces (cameras,
+blacklist, alerts, detections). Each namespace has a version stamp in the
+cache, bumped by model signals whenever its data changes. Cache keys and
+ETags are derived from those stamps, so:
+
+- a write invalidates every cached page of the affected namespaces at once,
+  in every process sharing the cache backend;
+- conditional requests (If-None-Match) are answered with 304 from the
+  stamps alone, before any query runs.
+
+Last-Modified is sent for information only: with one-second resolution it
+cannot tell apart two writes within the same second, so If-Modified-Since
+on its own never yields a 304.
+
+Writes that bypass model signals (bulk_create, QuerySet.update, raw
+deletes) must call ``invalidate`` themselves.
+"""
+import time
+import hashlib
+import logging
+import threading
+from collections import Counter
+from functools import wraps
+from django.conf import settings
+from django.core.cache import caches
+from django.db import transaction
+from django.db.models.signals import post_save, post_delete
+from django.utils.http import http_date
+from rest_framework.response import Response
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_CACHE_SETTINGS = {
+    'ALIAS': 'default',
+    'TIMEOUT': 300,
+    'ENABLED': True,
+}
+
+# Namespaces whose cached responses depend on each model
+MODEL_NAMESPACES = {
+    'anpr_cameras.Camera': ('cameras', 'detections', 'alerts'),
+    'anpr_alerts.Blacklist': ('blacklist', 'alerts'),
+    'anpr_alerts.Alert': ('alerts',),
+    'anpr_detection.Detection': ('detections', 'alerts'),
+}
+
+# Namespaces a new row affects, where fewer than for updates and deletes
+MODEL_CREATE_NAMESPACES = {
+    # A new detection's alert, if it raises one, invalidates alerts itself
+    'anpr_detection.Detection': ('detections',),
+}
+
+_stats_lock = threading.Lock()
+_stats = Counter()
+
+# Per thread and database: the transaction's commit hooks and the namespaces
+# already queued for a bump on commit
+_queued = threading.local()
+
+
+def get_cache_settings():
+    """Return ANPR_CACHE settings merged over the defaults"""
+    config = dict(DEFAULT_CACHE_SETTINGS)
+    config.update(getattr(settings, 'ANPR_CACHE', {}))
+    return config
+
+
+def _cache():
+    return caches[get_cache_settings()['ALIAS']]
+
+
+def _stamp_key(namespace):
+    return f"anpr:ns:{namespace}"
+
+
+def namespace_stamps(namespaces):
+    """
+    Current version stamps (ns since epoch) of the given namespaces
+
+    Missing stamps (first use or evicted) are created, which also
+    invalidates anything cached under the old one.
+    """
+    cache = _cache()
+    keys = {namespace: _stamp_key(namespace) for namespace in namespaces}
+    found = cache.get_many(keys.values())
+    stamps = {}
+    for namespace, key in keys.items():
+        stamp = found.get(key)
+        if stamp is None:
+            cache.add(key, time.time_ns(), timeout=None)
+            stamp = cache.get(key)
+        stamps[namespace] = stamp
+    return stamps
+
+
+def invalidate(*namespaces):
+    """Bump namespace stamps, invalidating their cached responses"""
+    now = time.time_ns()
+    _cache().set_many({_stamp_key(namespace): now for namespace in namespaces}, timeout=None)
+    _count('invalidations', len(namespaces))
+
+
+def _count(name, amount=1):
+    with _stats_lock:
+        _stats[name] += amount
+
+
+def cache_stats():
+    """In-process hit/miss counters since startup"""
+    with _stats_lock:
+        stats = dict(_stats)
+    lookups = stats.get('hits', 0) + stats.get('misses', 0)
+    stats['hit_ratio'] = round(stats.get('hits', 0) / lookups, 4) if lookups else None
+    stats['backend'] = settings.CACHES[get_cache_settings()['ALIAS']]['BACKEND']
+    return stats
+
+
+def _not_modified(request, etag):
+    if_none_match = request.META.get('HTTP_IF_NONE_MATCH')
+    if not if_none_match:
+        return False
+    return etag in [tag.strip() for tag in if_none_match.split(',')] or if_none_match.strip() == '*'
+
+
+def cached_response(*namespaces):
+    """
+    Cache a DRF view method's response data under the given namespaces
+
+    Only GET responses with status 200 are cached. The rendered format still
+    follows each request's content negotiation, since ``response.data`` is
+    cached rather than the rendered bytes.
+    """
+    def decorator(view_method):
+        @wraps(view_method)
+        def wrapper(self, request, *args, **kwargs):
+            config = get_cache_settings()
+            if request.method != 'GET' or not config['ENABLED']:
+                return view_method(self, request, *args, **kwargs)
+
+            stamps = namespace_stamps(namespaces)
+            version = '-'.join(str(stamps[namespace]) for namespace in namespaces)
+            digest = hashlib.sha1(f"{version}|{request.build_absolute_uri()}".encode('utf-8')).hexdigest()
+            etag = f'"{digest}"'
+            last_modified = max(stamps.values()) // 1_000_000_000
+
+            if _not_modified(request, etag):
+                _count('not_modified')
+                response = Response(status=304)
+            else:
+                cache = _cache()
+                key = f"anpr:resp:{digest}"
+                data = cache.get(key)
+                if data is not None:
+                    _count('hits')
+                    response = Response(data)
+                else:
+                    _count('misses')
+                    response = view_method(self, request, *args, **kwargs)
+                    if response.status_code != 200:
+                        return response
+                    cache.set(key, response.data, config['TIMEOUT'])
+
+            response['ETag'] = etag
+            response['Last-Modified'] = http_date(last_modified)
+            # Clients may keep copies but must revalidate (cheaply, via 304)
+            response['Cache-Control'] = 'private, no-cache'
+            return response
+        return wrapper
+    return decorator
+
+
+def _safe_invalidate(namespaces):
+    try:
+        invalidate(*namespaces)
+    except Exception as e:
+        logger.error(f"Failed to invalidate cache namespaces {namespaces}: {str(e)}")
+
+
+def _queued_namespaces(connection):
+    """Namespaces with a bump queued for the commit of the connection's current transaction"""
+    # Django replaces run_on_commit whenever a transaction ends (or a savepoint
+    # holding hooks is rolled back), which starts a new set
+    state = getattr(_queued, connection.alias, None)
+    if state is None or state[0] is not connection.run_on_commit:
+        state = (connection.run_on_commit, set())
+        setattr(_queued, connection.alias, state)
+    return state[1]
+
+
+def _invalidate_for(namespaces, created_namespaces=None):
+    def receiver(sender, created=False, using=None, **kwargs):
+        changed = created_namespaces if created and created_namespaces is not None else namespaces
+        # Bump now so the writing request sees its own changes
+        _safe_invalidate(changed)
+        connection = transaction.get_connection(using)
+        if not connection.in_atomic_block:
+            # Autocommit: the write is already visible to everyone
+            return
+        # And once more per transaction on commit: another request reading
+        # before then would otherwise cache the pre-commit data under the new stamp
+        queued = _queued_namespaces(connection)
+        pending = tuple(namespace for namespace in changed if namespace not in queued)
+        if pending:
+            queued.update(pending)
+            transaction.on_commit(lambda: _safe_invalidate(pending), using=connection.alias)
+    return receiver
+
+
+def connect_signals():
+    """Invalidate namespaces on model writes; called from AppConfig.ready()"""
+    from anpr_alerts.blacklist_io import blacklist_changed
+
+    for model, namespaces in MODEL_NAMESPACES.items():
+        receiver = _invalidate_for(namespaces, MODEL_CREATE_NAMESPACES.get(model))
+        post_save.connect(receiver, sender=model, weak=False, dispatch_uid=f"anpr-cache-save-{model}")
+        post_delete.connect(receiver, sender=model, weak=False, dispatch_uid=f"anpr-cache-delete-{model}")
+
+    # Bulk blacklist imports bypass post_save; they signal once per batch
+    blacklist_changed.connect(_invalidate_for(MODEL_NAMESPACES['anpr_alerts.Blacklist']),
+                              weak=False, dispatch_uid='anpr-cache-blacklist-import')
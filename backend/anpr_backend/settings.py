@@ -64,6 +64,7 @@ TEMPLATES = [
 ]
 
 WSGI_APPLICATION = 'anpr_backend.wsgi.application'
+ASGI_APPLICATION = 'anpr_backend.asgi.application'
 
 # Database
 DATABASES = {
@@ -132,6 +133,143 @@ REST_FRAMEWORK = {
     ],
 }
 
+# Cache for hot API reads (see anpr_backend/caching.py). The default
+# local-memory cache is per process; point ANPR_CACHE_BACKEND at a shared
+# backend (e.g. django.core.cache.backends.redis.RedisCache or
+# django.core.cache.backends.filebased.FileBasedCache) when running several
+# workers, so invalidations reach all of them.
+CACHES = {
+    'default': {
+        'BACKEND': os.environ.get('ANPR_CACHE_BACKEND', 'django.core.cache.backends.locmem.LocMemCache'),
+        'LOCATION': os.environ.get('ANPR_CACHE_LOCATION', 'anpr-api'),
+        'OPTIONS': {'MAX_ENTRIES': 2000} if 'ANPR_CACHE_BACKEND' not in os.environ else {},
+    }
+}
+
+ANPR_CACHE = {
+    'ALIAS': 'default',
+    'TIMEOUT': int(os.environ.get('ANPR_CACHE_TIMEOUT', 300)),
+    'ENABLED': os.environ.get('ANPR_CACHE_ENABLED', 'true').lower() == 'true',
+}
+
+# Async image-processing endpoint (/api/process-image/async/)
+ANPR_INFERENCE = {
+    'WORKERS': int(os.environ.get('ANPR_INFERENCE_WORKERS', 2)),
+    'MAX_IN_FLIGHT': int(os.environ.get('ANPR_INFERENCE_MAX_IN_FLIGHT', 8)),
+    'MAX_QUEUE_WAIT': float(os.environ.get('ANPR_INFERENCE_MAX_QUEUE_WAIT', 5.0)),
+}
+
+# Plate detector backend (see anpr_detection/backends.py): mock, classical,
+# opencv or onnxruntime. MODEL/CONFIG are resolved against anpr_detection/ml_models;
+# the thread counts only apply to onnxruntime (0 = its own default). Cameras
+# can override INPUT_SIZE and enable tiling (inference_size, tile_size).
+ANPR_DETECTOR = {
+    'BACKEND': os.environ.get('ANPR_DETECTOR_BACKEND', 'mock'),
+    'MODEL': os.environ.get('ANPR_DETECTOR_MODEL', ''),
+    'CONFIG': os.environ.get('ANPR_DETECTOR_CONFIG', ''),
+    'OUTPUT_FORMAT': os.environ.get('ANPR_DETECTOR_OUTPUT_FORMAT', 'auto'),
+    'INPUT_SIZE': int(os.environ.get('ANPR_DETECTOR_INPUT_SIZE', 416)),
+    'CONFIDENCE_THRESHOLD': float(os.environ.get('ANPR_DETECTOR_CONFIDENCE', 0.5)),
+    'NMS_THRESHOLD': float(os.environ.get('ANPR_DETECTOR_NMS', 0.4)),
+    'INTRA_OP_THREADS': int(os.environ.get('ANPR_DETECTOR_INTRA_OP_THREADS', 0)),
+    'INTER_OP_THREADS': int(os.environ.get('ANPR_DETECTOR_INTER_OP_THREADS', 0)),
+    # Cameras' frames/tiles are batched per forward pass; a window > 0 also
+    # batches concurrent cameras together
+    'MAX_BATCH': int(os.environ.get('ANPR_DETECTOR_MAX_BATCH', 16)),
+    'BATCH_WINDOW_MS': float(os.environ.get('ANPR_DETECTOR_BATCH_WINDOW_MS', 0)),
+    'TILE_FULL_FRAME': os.environ.get('ANPR_DETECTOR_TILE_FULL_FRAME', 'true').lower() == 'true',
+}
+
+# Classical plate-candidate prefilter (see anpr_detection/prefilter.py).
+# MODE 'frame' skips the detector on frames without candidates, 'regions'
+# runs it only around candidates; every AUDIT_EVERY-th gated frame also
+# runs the full detector to measure misses and CPU saved.
+ANPR_PREFILTER = {
+    'MODE': os.environ.get('ANPR_PREFILTER_MODE', 'off'),
+    'WIDTH': int(os.environ.get('ANPR_PREFILTER_WIDTH', 640)),
+    'MIN_EDGE_DENSITY': float(os.environ.get('ANPR_PREFILTER_MIN_EDGE_DENSITY', 0.2)),
+    'AUDIT_EVERY': int(os.environ.get('ANPR_PREFILTER_AUDIT_EVERY', 50)),
+}
+
+# Plate crop quality gate ahead of OCR (see anpr_detection/quality.py).
+# Crops below BORDERLINE times a threshold skip OCR; crops between that
+# and the threshold are deskewed and upscaled first.
+ANPR_QUALITY = {
+    'ENABLED': os.environ.get('ANPR_QUALITY_ENABLED', 'true').lower() == 'true',
+    'MIN_SHARPNESS': float(os.environ.get('ANPR_QUALITY_MIN_SHARPNESS', 80)),
+    'MIN_HEIGHT': int(os.environ.get('ANPR_QUALITY_MIN_HEIGHT', 16)),
+    'MIN_CONTRAST': float(os.environ.get('ANPR_QUALITY_MIN_CONTRAST', 25)),
+}
+
+# OCR result cache keyed by a perceptual hash of the plate crop (see
+# anpr_detection/ocr_cache.py). Entries are per camera and expire after
+# TTL seconds; MAX_DISTANCE is the Hamming distance, of 255 bits, within
+# which two crops count as the same plate.
+ANPR_OCR_CACHE = {
+    'ENABLED': os.environ.get('ANPR_OCR_CACHE_ENABLED', 'true').lower() == 'true',
+    'TTL': float(os.environ.get('ANPR_OCR_CACHE_TTL', 10)),
+    'MAX_ENTRIES': int(os.environ.get('ANPR_OCR_CACHE_MAX_ENTRIES', 64)),
+    'MAX_DISTANCE': int(os.environ.get('ANPR_OCR_CACHE_MAX_DISTANCE', 48)),
+}
+
+# Plate OCR (see anpr_detection/ocr.py). With BATCH, all plate crops of a
+# frame are stacked into one image and read in a single Tesseract call.
+ANPR_OCR = {
+    'BATCH': os.environ.get('ANPR_OCR_BATCH', 'true').lower() == 'true',
+    'MAX_BATCH': int(os.environ.get('ANPR_OCR_MAX_BATCH', 16)),
+    'LINE_HEIGHT': int(os.environ.get('ANPR_OCR_LINE_HEIGHT', 48)),
+}
+
+# Plate format grammars (see anpr_detection/plate_format.py). Reads that fit
+# none of a camera's regions (Camera.plate_regions, else REGIONS) are dropped
+# or, with ACTION 'downgrade', kept at a reduced confidence.
+ANPR_PLATE_FORMAT = {
+    'ACTION': os.environ.get('ANPR_PLATE_FORMAT_ACTION', 'drop'),
+    'REGIONS': [r.strip() for r in os.environ.get('ANPR_PLATE_REGIONS', 'GENERIC').split(',') if r.strip()],
+    'MAX_CORRECTIONS': int(os.environ.get('ANPR_PLATE_FORMAT_MAX_CORRECTIONS', 2)),
+}
+
+# Multi-frame OCR consensus for camera streams (see anpr_detection/consensus.py).
+# Reads of one plate vote until MIN_READS agree on every character by at
+# least MIN_AGREEMENT of the weight; the plate is then saved once and no
+# longer OCR'd while it stays in view.
+ANPR_CONSENSUS = {
+    'ENABLED': os.environ.get('ANPR_CONSENSUS_ENABLED', 'true').lower() == 'true',
+    'WINDOW': float(os.environ.get('ANPR_CONSENSUS_WINDOW', 5)),
+    'MIN_READS': int(os.environ.get('ANPR_CONSENSUS_MIN_READS', 3)),
+    'MIN_AGREEMENT': float(os.environ.get('ANPR_CONSENSUS_MIN_AGREEMENT', 0.6)),
+}
+
+# Per-camera ring of reused frame buffers for streams (see
+# anpr_detection/frame_buffer.py). Each camera holds at most SLOTS decoded
+# frames, fewer when they would exceed MAX_BYTES.
+ANPR_FRAME_BUFFER = {
+    'SLOTS': int(os.environ.get('ANPR_FRAME_BUFFER_SLOTS', 4)),
+    'MAX_BYTES': int(os.environ.get('ANPR_FRAME_BUFFER_MAX_MB', 64)) * 1024 * 1024,
+}
+
+# Frame pipeline stages (see anpr_detection/pipeline.py). Cameras without
+# skip_stages pass the optional stages in SKIP (roi, quality, match,
+# persist, annotate) through; stages whose output nobody uses never run.
+ANPR_PIPELINE = {
+    'SKIP': [s.strip() for s in os.environ.get('ANPR_PIPELINE_SKIP', '').split(',') if s.strip()],
+}
+
+# Background report jobs (files are written to MEDIA_ROOT/reports)
+ANPR_REPORTS = {
+    'WORKERS': int(os.environ.get('ANPR_REPORT_WORKERS', 2)),
+}
+
+# Detection retention (see the prune_detections management command). Cameras
+# can override DAYS with their own retention_days.
+ANPR_RETENTION = {
+    'DAYS': int(os.environ.get('ANPR_RETENTION_DAYS', 90)),
+    'ARCHIVE': os.environ.get('ANPR_RETENTION_ARCHIVE', 'true').lower() == 'true',
+    'ARCHIVE_DIR': os.environ.get('ANPR_RETENTION_ARCHIVE_DIR', os.path.join(BASE_DIR, 'archive')),
+    'BATCH_SIZE': int(os.environ.get('ANPR_RETENTION_BATCH_SIZE', 5000)),
+    'BATCH_PAUSE': float(os.environ.get('ANPR_RETENTION_BATCH_PAUSE', 0.0)),
+}
+
 # CORS settings
 CORS_ALLOW_ALL_ORIGINS = True  # Allow all origins temporarily
 CORS_ALLOWED_ORIGINS = [
@@ -160,6 +298,21 @@ EMAIL_BACKEND = 'django.core.mail.backends.console.EmailBackend'  # For developm
 # EMAIL_HOST_USER = 'your-email@example.com'
 # EMAIL_HOST_PASSWORD = 'your-password'
 
+# Alert notification outbox (see anpr_alerts/notifications.py). Set
+# DISPATCH_IN_PROCESS to False when running dispatch_alert_notifications
+# as a separate worker.
+ANPR_NOTIFICATIONS = {
+    'CHANNELS': [c for c in os.environ.get('ANPR_NOTIFICATION_CHANNELS', 'email').split(',') if c],
+    'EMAIL_RECIPIENTS': [r for r in os.environ.get('ANPR_ALERT_EMAIL_RECIPIENTS', '').split(',') if r],
+    'WEBHOOK_URL': os.environ.get('ANPR_ALERT_WEBHOOK_URL', ''),
+    'RATE_LIMITS': {
+        'email': int(os.environ.get('ANPR_ALERT_EMAIL_PER_MINUTE', 20)),
+        'webhook': int(os.environ.get('ANPR_ALERT_WEBHOOK_PER_MINUTE', 120)),
+    },
+    'DIGEST_THRESHOLD': int(os.environ.get('ANPR_ALERT_DIGEST_THRESHOLD', 5)),
+    'DISPATCH_IN_PROCESS': os.environ.get('ANPR_ALERT_DISPATCH_IN_PROCESS', 'true').lower() == 'true',
+}
+
 # Logging configuration
 LOGGING = {
     'version': 1,
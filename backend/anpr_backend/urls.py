@@ -6,7 +6,10 @@ from django.views.generic import RedirectView
 from rest_framework import routers
 from anpr_cameras.views import CameraViewSet
 from anpr_alerts.views import BlacklistViewSet, AlertViewSet
-from anpr_detection.views import DetectionViewSet
+from anpr_detection.views import (
+    DetectionViewSet, StatsView, process_image, process_image_async, event_stream, event_stream_stats,
+    cache_stats_view, pipeline_stats,
+)
 from anpr_reports.views import ReportViewSet
 
 # Create a router and register our viewsets with it
@@ -21,6 +24,13 @@ urlpatterns = [
     path('', RedirectView.as_view(url='/api/', permanent=False)),
     path('admin/', admin.site.urls),
     path('api/', include(router.urls)),
+    path('api/stats/', StatsView.as_view(), name='stats'),
+    path('api/process-image/', process_image, name='process-image'),
+    path('api/process-image/async/', process_image_async, name='process-image-async'),
+    path('api/events/', event_stream, name='events'),
+    path('api/events/stats/', event_stream_stats, name='events-stats'),
+    path('api/cache/stats/', cache_stats_view, name='cache-stats'),
+    path('api/pipeline/stats/', pipeline_stats, name='pipeline-stats'),
     path('api-auth/', include('rest_framework.urls', namespace='rest_framework')),
 ]
 
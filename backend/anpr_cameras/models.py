@@ -1,3 +1,4 @@
+from django.core.validators import MinValueValidator, MaxValueValidator
 from django.db import models
 import logging
 
@@ -9,6 +10,35 @@ class Camera(models.Model):
     rtsp_url = models.CharField(max_length=255)
     location = models.CharField(max_length=200)
     is_active = models.BooleanField(default=True)
+    retention_days = models.PositiveIntegerField(
+        null=True, blank=True,
+        help_text="Days to keep this camera's detections; empty uses ANPR_RETENTION['DAYS']"
+    )
+    inference_size = models.PositiveIntegerField(
+        null=True, blank=True,
+        help_text="Detector input size in pixels (rounded to a multiple of 32); empty uses ANPR_DETECTOR['INPUT_SIZE']"
+    )
+    tile_size = models.PositiveIntegerField(
+        null=True, blank=True,
+        help_text="Split larger frames into tiles of this many pixels; empty disables tiling"
+    )
+    tile_overlap = models.FloatField(
+        default=0.2,
+        validators=[MinValueValidator(0.0), MaxValueValidator(0.5)],
+        help_text="Fraction of each tile shared with its neighbours"
+    )
+    plate_regions = models.CharField(
+        max_length=100, blank=True, default='',
+        help_text="Comma-separated plate formats to accept, e.g. GB,FR; empty uses ANPR_PLATE_FORMAT['REGIONS']"
+    )
+    roi = models.CharField(
+        max_length=50, blank=True, default='',
+        help_text="Region of interest as x,y,w,h fractions of the frame, e.g. 0,0.4,1,0.6; empty uses the whole frame"
+    )
+    skip_stages = models.CharField(
+        max_length=100, blank=True, default='',
+        help_text="Comma-separated optional pipeline stages to skip (roi, quality, match, persist, annotate); empty uses ANPR_PIPELINE['SKIP']"
+    )
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
     
@@ -1,4 +1,6 @@
 from rest_framework import serializers
+from anpr_detection.plate_format import available_regions, parse_regions
+from anpr_detection.pipeline import OPTIONAL_STAGES, parse_roi, parse_stages
 from .models import Camera
 
 class CameraSerializer(serializers.ModelSerializer):
@@ -6,5 +8,42 @@ class CameraSerializer(serializers.ModelSerializer):
     
     class Meta:
         model = Camera
-        fields = ['id', 'name', 'rtsp_url', 'location', 'is_active', 'created_at', 'updated_at']
-        read_only_fields = ['created_at', 'updated_at']
\ No newline at end of file
+        fields = ['id', 'name', 'rtsp_url', 'location', 'is_active', 'retention_days',
+                  'inference_size', 'tile_size', 'tile_overlap', 'plate_regions', 'roi', 'skip_stages',
+                  'created_at', 'updated_at']
+        read_only_fields = ['created_at', 'updated_at']
+    
+    def validate_inference_size(self, value):
+        if value is not None and not 32 <= value <= 2048:
+            raise serializers.ValidationError("Must be between 32 and 2048 pixels")
+        return value
+    
+    def validate_tile_size(self, value):
+        if value is not None and value < 128:
+            raise serializers.ValidationError("Must be at least 128 pixels")
+        return value
+    
+    def validate_plate_regions(self, value):
+        regions = parse_regions(value)
+        unknown = [region for region in regions if region not in available_regions()]
+        if unknown:
+            raise serializers.ValidationError(
+                f"Unknown plate regions: {', '.join(unknown)}. Known: {', '.join(available_regions())}"
+            )
+        return ','.join(regions)
+    
+    def validate_roi(self, value):
+        try:
+            roi = parse_roi(value)
+        except ValueError as e:
+            raise serializers.ValidationError(str(e))
+        return ','.join(f"{part:g}" for part in roi) if roi else ''
+    
+    def validate_skip_stages(self, value):
+        stages = parse_stages(value)
+        unknown = [stage for stage in stages if stage not in OPTIONAL_STAGES]
+        if unknown:
+            raise serializers.ValidationError(
+                f"Cannot skip stages: {', '.join(unknown)}. Optional: {', '.join(OPTIONAL_STAGES)}"
+            )
+        return ','.join(stages)
@@ -1,3 +1,68 @@
+from django.core.cache import cache
+from django.db import connection
 from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from anpr_backend.caching import cache_stats, namespace_stamps
+from anpr_detection.models import Detection
+from .models import Camera
 
-# Create your tests here.
+
+class CachedReadTests(TestCase):
+    """Hot list endpoints are served from cache until a write invalidates them"""
+
+    def setUp(self):
+        cache.clear()
+        self.camera = Camera.objects.create(name='Gate', rtsp_url='rtsp://test/stream', location='North')
+
+    def test_second_read_is_served_from_cache(self):
+        first = self.client.get('/api/cameras/')
+        hits = cache_stats().get('hits', 0)
+        with CaptureQueriesContext(connection) as context:
+            second = self.client.get('/api/cameras/')
+        self.assertEqual(len(context.captured_queries), 0)
+        self.assertEqual(second.json(), first.json())
+        self.assertEqual(cache_stats()['hits'], hits + 1)
+
+    def test_write_invalidates(self):
+        self.client.get('/api/cameras/')
+        self.client.patch(f'/api/cameras/{self.camera.id}/', {'name': 'Renamed'}, content_type='application/json')
+        names = [camera['name'] for camera in self.client.get('/api/cameras/').json()['results']]
+        self.assertEqual(names, ['Renamed'])
+
+    def test_detection_invalidates_recent(self):
+        self.assertEqual(self.client.get('/api/detections/recent/').json(), [])
+        Detection.objects.create(plate_number='MH12AB1234', camera=self.camera, confidence=0.9)
+        recent = self.client.get('/api/detections/recent/').json()
+        self.assertEqual([row['plate_number'] for row in recent], ['MH12AB1234'])
+
+    def test_detection_inserts_bump_stamps_once_per_transaction(self):
+        alerts = namespace_stamps(['alerts'])
+        invalidations = cache_stats().get('invalidations', 0)
+        with self.captureOnCommitCallbacks(execute=True):
+            for plate in ('AB12CDE', 'XY34ZZZ', 'CD56EFG'):
+                Detection.objects.create(plate_number=plate, camera=self.camera, confidence=0.9)
+        # detections only, bumped once per insert; its bump on commit was
+        # already queued by setUp's camera write in the same transaction
+        self.assertEqual(cache_stats()['invalidations'], invalidations + 3)
+        self.assertEqual(namespace_stamps(['alerts']), alerts)
+
+    def test_conditional_get(self):
+        response = self.client.get('/api/cameras/')
+        etag = response['ETag']
+        with CaptureQueriesContext(connection) as context:
+            not_modified = self.client.get('/api/cameras/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(not_modified.status_code, 304)
+        self.assertEqual(len(context.captured_queries), 0)
+
+        Camera.objects.create(name='Exit', rtsp_url='rtsp://test/exit', location='South')
+        changed = self.client.get('/api/cameras/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(changed.status_code, 200)
+        self.assertNotEqual(changed['ETag'], etag)
+
+    def test_if_modified_since_alone_is_not_trusted(self):
+        response = self.client.get('/api/cameras/')
+        # Usually lands in the same second, so Last-Modified cannot show the change
+        Camera.objects.create(name='Exit', rtsp_url='rtsp://test/exit', location='South')
+        since = self.client.get('/api/cameras/', HTTP_IF_MODIFIED_SINCE=response['Last-Modified'])
+        self.assertEqual(since.status_code, 200)
+        self.assertEqual(len(since.json()['results']), 2)
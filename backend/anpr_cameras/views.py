@@ -9,6 +9,7 @@ import base64
 from .models import Camera
 from .serializers import CameraSerializer
 from anpr_detection.stream_processor import StreamManager
+from anpr_backend.caching import cached_response
 
 logger = logging.getLogger('anpr_cameras')
 
@@ -17,6 +18,14 @@ class CameraViewSet(viewsets.ModelViewSet):
     queryset = Camera.objects.all()
     serializer_class = CameraSerializer
     
+    @cached_response('cameras')
+    def list(self, request, *args, **kwargs):
+        return super().list(request, *args, **kwargs)
+    
+    @cached_response('cameras')
+    def retrieve(self, request, *args, **kwargs):
+        return super().retrieve(request, *args, **kwargs)
+    
     def perform_create(self, serializer):
         logger.info(f"Creating new camera: {serializer.validated_data.get('name')}")
         serializer.save()
@@ -86,5 +95,6 @@ class CameraViewSet(viewsets.ModelViewSet):
         # Check if stream is active
         stream_manager = StreamManager()
         is_active = camera.id in stream_manager.streams and stream_manager.streams[camera.id].is_running
+        frame_buffer = stream_manager.streams[camera.id].frames.stats() if is_active else None
         
-        return Response({'active': is_active})
+        return Response({'active': is_active, 'frame_buffer': frame_buffer})
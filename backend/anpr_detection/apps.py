@@ -1,6 +1,20 @@
 from django.apps import AppConfig
+from django.db.models.signals import post_migrate
 
 
 class AnprDetectionConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'anpr_detection'
+
+    def ready(self):
+        # pg_trgm plate search indexes are created outside the migration graph
+        from .plate_search import ensure_trigram_indexes, index_blacklist_batch
+        post_migrate.connect(ensure_trigram_indexes, sender=self)
+        
+        # Bulk blacklist imports bypass Blacklist.save; index each batch at once
+        from anpr_alerts.blacklist_io import blacklist_changed
+        blacklist_changed.connect(index_blacklist_batch)
+        
+        # API response cache invalidation on model writes
+        from anpr_backend.caching import connect_signals
+        connect_signals()
@@ -0,0 +1,616 @@
+"""
+Plate detector backends
+
+ANPRDetector delegates plate localisation to one of these backends, picked
+per deployment with ANPR_DETECTOR['BACKEND']:
+
+- ``opencv``: cv2.dnn (Darknet or ONNX models) on the OpenCV CPU backend
+- ``onnxruntime``: ONNX Runtime on the CPU execution provider, with
+  configurable intra/inter-op thread pools. Int8 models produced by
+  quantize_detector_model (QDQ format) load like any other model and run
+  on ONNX Runtime's integer kernels.
+- ``classical``: the model-free edge/morphology localiser from
+  prefilter.py, for hosts without a model or with little CPU to spare
+- ``mock``: a fixed box in the centre of the frame, for development
+
+Backends are loaded once per process and shared. A backend that cannot be
+loaded (missing model files or onnxruntime not installed) falls back to
+the classical backend with a warning, so a deployment missing its model
+still reads real plates instead of inventing them.
+"""
+import os
+import time
+import logging
+import threading
+from collections import deque
+import cv2
+import numpy as np
+from django.conf import settings
+from .prefilter import find_candidates, get_prefilter_settings
+
+# Configure logger
+logger = logging.getLogger('anpr_detection')
+
+MODEL_DIR = os.path.join(settings.BASE_DIR, 'anpr_detection', 'ml_models')
+
+DEFAULT_DETECTOR_SETTINGS = {
+    'BACKEND': 'mock',
+    'MODEL': '',             # Relative paths are resolved against MODEL_DIR
+    'CONFIG': '',            # Darknet .cfg for .weights models
+    'OUTPUT_FORMAT': 'auto',  # darknet, yolov5, yolov8 or auto
+    'INPUT_SIZE': 416,
+    'CONFIDENCE_THRESHOLD': 0.5,
+    'NMS_THRESHOLD': 0.4,
+    'INTRA_OP_THREADS': 0,   # 0 lets ONNX Runtime choose (one per physical core)
+    'INTER_OP_THREADS': 0,
+    'MAX_BATCH': 16,         # Images per forward pass
+    'BATCH_WINDOW_MS': 0,    # Wait to batch frames across cameras; 0 disables
+    'TILE_FULL_FRAME': True,  # Also infer the whole frame when tiling
+}
+
+DEFAULT_MODELS = {
+    'opencv': ('yolov4-plate.weights', 'yolov4-plate.cfg'),
+    'onnxruntime': ('plate-detector.onnx', ''),
+}
+
+OUTPUT_FORMATS = ('auto', 'darknet', 'yolov5', 'yolov8')
+
+
+def get_detector_settings(**overrides):
+    """Return ANPR_DETECTOR settings merged over the defaults, then `overrides`"""
+    config = dict(DEFAULT_DETECTOR_SETTINGS)
+    config.update(getattr(settings, 'ANPR_DETECTOR', {}))
+    config.update({key: value for key, value in overrides.items() if value is not None})
+    return config
+
+
+def resolve_model_paths(config):
+    """
+    Model and config file paths for a backend
+
+    Returns:
+        Tuple of (model path, config path or '')
+    """
+    default_model, default_config = DEFAULT_MODELS.get(config['BACKEND'], ('', ''))
+    model = config['MODEL'] or default_model
+    model_config = config['CONFIG'] or (default_config if not config['MODEL'] else '')
+    return _model_path(model), _model_path(model_config)
+
+
+def _model_path(path):
+    return path if not path or os.path.isabs(path) else os.path.join(MODEL_DIR, path)
+
+
+class BackendUnavailable(Exception):
+    """Raised when a backend's dependency or model files are missing"""
+
+
+def letterbox(image, size):
+    """
+    Resize keeping the aspect ratio and pad to a square input
+
+    Returns:
+        Tuple of (padded image, scale, pad x, pad y)
+    """
+    height, width = image.shape[:2]
+    scale = min(size / width, size / height)
+    new_w, new_h = int(round(width * scale)), int(round(height * scale))
+    pad_x, pad_y = (size - new_w) // 2, (size - new_h) // 2
+    resized = cv2.resize(image, (new_w, new_h), interpolation=cv2.INTER_LINEAR)
+    padded = cv2.copyMakeBorder(resized, pad_y, size - new_h - pad_y, pad_x, size - new_w - pad_x,
+                                cv2.BORDER_CONSTANT, value=(114, 114, 114))
+    return padded, scale, pad_x, pad_y
+
+
+def make_blob(image, size, output_format):
+    """
+    NCHW float32 RGB input in [0, 1] for a square model input
+
+    Darknet models are trained on stretched inputs, YOLOv5/v8 exports on
+    letterboxed ones.
+
+    Returns:
+        Tuple of (blob, (scale x, scale y, pad x, pad y)) mapping input
+        pixels back to image pixels
+    """
+    height, width = image.shape[:2]
+    if output_format == 'darknet':
+        blob = cv2.dnn.blobFromImage(image, 1/255.0, (size, size), swapRB=True, crop=False)
+        return blob, (size / width, size / height, 0, 0)
+    padded, scale, pad_x, pad_y = letterbox(image, size)
+    blob = cv2.dnn.blobFromImage(padded, 1/255.0, (size, size), swapRB=True, crop=False)
+    return blob, (scale, scale, pad_x, pad_y)
+
+
+def decode_outputs(outputs, output_format, input_size):
+    """
+    Candidate boxes from raw YOLO outputs
+
+    Args:
+        outputs: List of output arrays
+        output_format: darknet (rows of normalised cx, cy, w, h, objectness,
+            class scores per output layer), yolov5 (1 x N x 5+C in input
+            pixels) or yolov8 (1 x 4+C x N in input pixels, no objectness)
+        input_size: Model input size in pixels
+
+    Returns:
+        Tuple of (N x 4 array of cx, cy, w, h in input pixels, N scores)
+    """
+    if output_format == 'darknet':
+        rows = np.concatenate([output.reshape(-1, output.shape[-1]) for output in outputs])
+        # Darknet class scores already include objectness
+        return rows[:, :4] * input_size, rows[:, 5:].max(axis=1)
+
+    output = outputs[0]
+    if output_format == 'yolov8':
+        rows = output.reshape(output.shape[-2], output.shape[-1]).T
+        return rows[:, :4], rows[:, 4:].max(axis=1)
+    rows = output.reshape(-1, output.shape[-1])
+    return rows[:, :4], rows[:, 4] * rows[:, 5:].max(axis=1)
+
+
+def detect_output_format(outputs):
+    """Guess yolov5 vs yolov8 layout from the output shape (v8 puts the few channels first)"""
+    shape = outputs[0].shape
+    return 'yolov8' if len(shape) == 3 and shape[1] < shape[2] else 'yolov5'
+
+
+def postprocess(boxes, scores, transform, image_shape, confidence_threshold, nms_threshold):
+    """
+    Threshold, map back to image pixels and apply NMS
+
+    Returns:
+        List of (x, y, w, h, confidence)
+    """
+    keep = scores > confidence_threshold
+    if not keep.any():
+        return []
+    boxes, scores = boxes[keep], scores[keep]
+
+    scale_x, scale_y, pad_x, pad_y = transform
+    height, width = image_shape[:2]
+    x = (boxes[:, 0] - boxes[:, 2] / 2 - pad_x) / scale_x
+    y = (boxes[:, 1] - boxes[:, 3] / 2 - pad_y) / scale_y
+    w = boxes[:, 2] / scale_x
+    h = boxes[:, 3] / scale_y
+    rects = np.stack([x, y, w, h], axis=1).astype(int)
+    rects[:, 0] = np.clip(rects[:, 0], 0, width - 1)
+    rects[:, 1] = np.clip(rects[:, 1], 0, height - 1)
+
+    indices = cv2.dnn.NMSBoxes(rects.tolist(), scores.astype(float).tolist(), confidence_threshold, nms_threshold)
+    return [
+        (int(rects[i][0]), int(rects[i][1]), int(rects[i][2]), int(rects[i][3]), float(scores[i]))
+        for i in np.array(indices).flatten()
+    ]
+
+
+def split_outputs(outputs, count):
+    """
+    Per-image outputs of a batched forward pass
+
+    YOLOv5/v8 outputs carry the batch as their first axis. Darknet region
+    layers return 2-D rows, with the images' rows stacked in order.
+    """
+    per_image = [[] for _ in range(count)]
+    for output in outputs:
+        if output.ndim >= 3:
+            parts = [output[i:i + 1] for i in range(count)]
+        else:
+            parts = np.split(output, count)
+        for i, part in enumerate(parts):
+            per_image[i].append(part)
+    return per_image
+
+
+class DetectorBackend:
+    """Base class: subclasses load a model and implement `forward`"""
+    name = None
+    # Whether detections on tiles are meaningful (see tiling.py)
+    supports_tiling = True
+
+    def __init__(self, config):
+        self.config = config
+        self.input_size = int(config['INPUT_SIZE'])
+        self.confidence_threshold = float(config['CONFIDENCE_THRESHOLD'])
+        self.nms_threshold = float(config['NMS_THRESHOLD'])
+        self.output_format = config['OUTPUT_FORMAT']
+        self.model_path = ''
+        self.fixed_input_size = None
+        self.max_batch = int(config['MAX_BATCH'])
+
+    def forward(self, blob):
+        """Run the model on an NCHW blob and return its outputs"""
+        raise NotImplementedError
+
+    def resolve_input_size(self, input_size=None):
+        """Input size actually used for a requested one (multiple of 32, or the model's fixed size)"""
+        if self.fixed_input_size:
+            return self.fixed_input_size
+        return max(32, int(round((input_size or self.input_size) / 32.0)) * 32)
+
+    def detect(self, image, input_size=None):
+        """
+        Detect license plates in an image
+
+        Args:
+            image: BGR image (numpy array)
+            input_size: Square model input size (defaults to INPUT_SIZE)
+
+        Returns:
+            List of detected plate regions (x, y, w, h, confidence)
+        """
+        return self.detect_batch([image], input_size)[0]
+
+    def detect_batch(self, images, input_size=None):
+        """
+        Detect license plates in several images with batched forward passes
+
+        Returns:
+            One list of (x, y, w, h, confidence) per image
+        """
+        size = self.resolve_input_size(input_size)
+        results = []
+        for start in range(0, len(images), self.max_batch):
+            chunk = images[start:start + self.max_batch]
+            prepared = [make_blob(image, size, self.output_format) for image in chunk]
+            per_image = self._forward_batch([blob for blob, _ in prepared])
+            if self.output_format == 'auto':
+                # Resolved once from the first outputs (both candidates letterbox)
+                self.output_format = detect_output_format(per_image[0])
+                logger.info(f"{self.name} detector output format: {self.output_format}")
+            for image, (_, transform), outputs in zip(chunk, prepared, per_image):
+                boxes, scores = decode_outputs(outputs, self.output_format, size)
+                results.append(postprocess(boxes, scores, transform, image.shape,
+                                           self.confidence_threshold, self.nms_threshold))
+        return results
+
+    def _forward_batch(self, blobs):
+        if len(blobs) == 1:
+            return [self.forward(blobs[0])]
+        try:
+            return split_outputs(self.forward(np.concatenate(blobs)), len(blobs))
+        except Exception as e:
+            # Models exported with a fixed batch of 1
+            logger.info(f"{self.name} detector does not accept batches ({str(e)}), inferring one image at a time")
+            self.max_batch = 1
+            return [self.forward(blob) for blob in blobs]
+
+    def info(self):
+        return {
+            'backend': self.name,
+            'model': os.path.basename(self.model_path) if self.model_path else None,
+            'input_size': self.resolve_input_size(),
+            'output_format': self.output_format,
+            'max_batch': self.max_batch,
+        }
+
+
+class MockBackend(DetectorBackend):
+    """Fake plate in the centre of the image"""
+    name = 'mock'
+    supports_tiling = False
+
+    def detect_batch(self, images, input_size=None):
+        results = []
+        for image in images:
+            h, w = image.shape[:2]
+            plate_w = int(w * 0.2)
+            plate_h = int(h * 0.1)
+            x = int((w - plate_w) / 2)
+            y = int((h - plate_h) / 2)
+            results.append([(x, y, plate_w, plate_h, 0.95)])
+        return results
+
+
+class ClassicalBackend(DetectorBackend):
+    """Prefilter candidates reported as detections; no model needed"""
+    name = 'classical'
+    supports_tiling = False
+
+    def __init__(self, config):
+        super().__init__(config)
+        self.prefilter_config = get_prefilter_settings()
+
+    def detect_batch(self, images, input_size=None):
+        # Edge density doubles as the confidence
+        return [
+            [(x, y, w, h, min(1.0, score)) for x, y, w, h, score in find_candidates(image, self.prefilter_config)]
+            for image in images
+        ]
+
+
+class OpenCVBackend(DetectorBackend):
+    """cv2.dnn on DNN_BACKEND_OPENCV / DNN_TARGET_CPU"""
+    name = 'opencv'
+
+    def __init__(self, config):
+        super().__init__(config)
+        self.model_path, config_path = resolve_model_paths(config)
+        if not os.path.exists(self.model_path) or (config_path and not os.path.exists(config_path)):
+            raise BackendUnavailable(f"model files not found: {self.model_path}")
+
+        self.net = cv2.dnn.readNet(self.model_path, config_path) if config_path else cv2.dnn.readNet(self.model_path)
+        self.net.setPreferableBackend(cv2.dnn.DNN_BACKEND_OPENCV)
+        self.net.setPreferableTarget(cv2.dnn.DNN_TARGET_CPU)
+        self.output_layers = self.net.getUnconnectedOutLayersNames()
+        if self.output_format == 'auto' and self.model_path.endswith('.weights'):
+            self.output_format = 'darknet'
+        # cv2.dnn.Net is not thread-safe; OpenCV parallelises inside each forward pass
+        self.lock = threading.Lock()
+
+    def forward(self, blob):
+        with self.lock:
+            self.net.setInput(blob)
+            return list(self.net.forward(self.output_layers))
+
+
+class ONNXRuntimeBackend(DetectorBackend):
+    """ONNX Runtime on the CPU execution provider"""
+    name = 'onnxruntime'
+
+    def __init__(self, config):
+        super().__init__(config)
+        try:
+            import onnxruntime
+        except ImportError:
+            raise BackendUnavailable("onnxruntime is not installed")
+
+        self.model_path, _ = resolve_model_paths(config)
+        if not os.path.exists(self.model_path):
+            raise BackendUnavailable(f"model file not found: {self.model_path}")
+
+        options = onnxruntime.SessionOptions()
+        options.graph_optimization_level = onnxruntime.GraphOptimizationLevel.ORT_ENABLE_ALL
+        options.intra_op_num_threads = int(config['INTRA_OP_THREADS'])
+        options.inter_op_num_threads = int(config['INTER_OP_THREADS'])
+        if int(config['INTER_OP_THREADS']) > 1:
+            options.execution_mode = onnxruntime.ExecutionMode.ORT_PARALLEL
+        # InferenceSession.run is thread-safe, so one session serves every stream
+        self.session = onnxruntime.InferenceSession(
+            self.model_path, sess_options=options, providers=['CPUExecutionProvider'])
+
+        model_input = self.session.get_inputs()[0]
+        self.input_name = model_input.name
+        self.input_dtype = np.float16 if model_input.type == 'tensor(float16)' else np.float32
+        if isinstance(model_input.shape[-1], int):
+            # Fixed-size exports only accept their own input size
+            self.fixed_input_size = model_input.shape[-1]
+        if model_input.shape[0] == 1:
+            self.max_batch = 1
+        self.output_names = [output.name for output in self.session.get_outputs()]
+
+    def forward(self, blob):
+        return self.session.run(self.output_names, {self.input_name: blob.astype(self.input_dtype, copy=False)})
+
+    def info(self):
+        info = super().info()
+        info['threads'] = {
+            'intra_op': int(self.config['INTRA_OP_THREADS']),
+            'inter_op': int(self.config['INTER_OP_THREADS']),
+        }
+        return info
+
+
+BACKENDS = {
+    'mock': MockBackend,
+    'classical': ClassicalBackend,
+    'opencv': OpenCVBackend,
+    'onnxruntime': ONNXRuntimeBackend,
+}
+
+_loaded = {}
+_loaded_lock = threading.Lock()
+
+
+def load_backend(config):
+    """
+    Construct a backend for `config` (not cached)
+
+    Raises:
+        BackendUnavailable: Unknown backend, missing dependency or model files
+    """
+    backend_class = BACKENDS.get(config['BACKEND'])
+    if backend_class is None:
+        raise BackendUnavailable(f"unknown detector backend: {config['BACKEND']}")
+    if config['OUTPUT_FORMAT'] not in OUTPUT_FORMATS:
+        raise BackendUnavailable(f"unknown output format: {config['OUTPUT_FORMAT']}")
+    return backend_class(config)
+
+
+def get_backend(**overrides):
+    """
+    The shared backend for the configured (or overridden) settings
+
+    Falls back to the classical backend, with a warning, if the configured
+    one cannot be loaded.
+    """
+    config = get_detector_settings(**overrides)
+    key = tuple(sorted((name, str(value)) for name, value in config.items()))
+    with _loaded_lock:
+        backend = _loaded.get(key)
+        if backend is None:
+            try:
+                backend = load_backend(config)
+                logger.info(f"Loaded {backend.name} detector backend: {backend.info()}")
+            except BackendUnavailable as e:
+                logger.warning(f"{config['BACKEND']} detector backend unavailable ({str(e)}), "
+                               f"using the classical detector")
+                backend = ClassicalBackend(config)
+            except Exception as e:
+                logger.error(f"Error loading {config['BACKEND']} detector backend: {str(e)}, "
+                             f"using the classical detector")
+                backend = ClassicalBackend(config)
+            _loaded[key] = backend
+    return backend
+
+
+class _BatchRequest:
+    __slots__ = ('images', 'input_size', 'done', 'results', 'error')
+
+    def __init__(self, images, input_size):
+        self.images = images
+        self.input_size = input_size
+        self.done = threading.Event()
+        self.results = None
+        self.error = None
+
+
+class BatchScheduler:
+    """
+    Coalesce detection requests from several threads into shared batches
+
+    Each camera's stream thread submits its frame (or its frame's tiles)
+    and blocks. A worker waits up to BATCH_WINDOW_MS after the first
+    request for others with the same input size, then runs them as one
+    batch of at most MAX_BATCH images, so concurrent cameras share forward
+    passes instead of queueing for the model one by one.
+    """
+    def __init__(self, backend, window_ms, max_batch):
+        self.backend = backend
+        self.window = window_ms / 1000.0
+        self.max_batch = max_batch
+        self.pending = deque()
+        self.condition = threading.Condition()
+        self.thread = None
+        self.batches = 0
+        self.images = 0
+
+    def detect_batch(self, images, input_size=None):
+        """Same contract as DetectorBackend.detect_batch"""
+        request = _BatchRequest(images, self.backend.resolve_input_size(input_size))
+        with self.condition:
+            if self.thread is None or not self.thread.is_alive():
+                self.thread = threading.Thread(target=self._run, name='anpr-detector-batch', daemon=True)
+                self.thread.start()
+            self.pending.append(request)
+            self.condition.notify()
+        request.done.wait()
+        if request.error is not None:
+            raise request.error
+        return request.results
+
+    def _take(self):
+        """Wait for requests and pop one batch's worth with a common input size"""
+        with self.condition:
+            while not self.pending:
+                self.condition.wait()
+            deadline = time.monotonic() + self.window
+            while sum(len(r.images) for r in self.pending) < self.max_batch:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                self.condition.wait(remaining)
+
+            size = self.pending[0].input_size
+            taken, count = [], 0
+            for request in list(self.pending):
+                if request.input_size != size:
+                    continue
+                if taken and count + len(request.images) > self.max_batch:
+                    break
+                taken.append(request)
+                count += len(request.images)
+            for request in taken:
+                self.pending.remove(request)
+            return taken, size
+
+    def _run(self):
+        while True:
+            requests, size = self._take()
+            images = [image for request in requests for image in request.images]
+            try:
+                results = self.backend.detect_batch(images, size)
+                offset = 0
+                for request in requests:
+                    request.results = results[offset:offset + len(request.images)]
+                    offset += len(request.images)
+            except Exception as e:
+                for request in requests:
+                    request.error = e
+            self.batches += 1
+            self.images += len(images)
+            for request in requests:
+                request.done.set()
+
+    def stats(self):
+        return {
+            'batches': self.batches,
+            'images': self.images,
+            'mean_batch_size': round(self.images / self.batches, 2) if self.batches else None,
+        }
+
+
+_schedulers = {}
+
+
+def get_detector(**overrides):
+    """
+    The shared backend, wrapped in a BatchScheduler when BATCH_WINDOW_MS is set
+
+    Returns:
+        Object with detect_batch(images, input_size)
+    """
+    backend = get_backend(**overrides)
+    window = float(backend.config['BATCH_WINDOW_MS'])
+    if window <= 0 or backend.name in ('mock', 'classical'):
+        return backend
+    with _loaded_lock:
+        scheduler = _schedulers.get(id(backend))
+        if scheduler is None:
+            scheduler = BatchScheduler(backend, window, backend.max_batch)
+            _schedulers[id(backend)] = scheduler
+    return scheduler
+
+
+def quantize_onnx_model(model_path, output_path, calibration_images, input_size=None, per_channel=True):
+    """
+    Write a static int8 (QDQ) copy of an ONNX detector
+
+    Activations are calibrated on `calibration_images`, preprocessed exactly
+    as ONNXRuntimeBackend does at inference time.
+
+    Args:
+        model_path: fp32 ONNX model
+        output_path: Destination for the int8 model
+        calibration_images: Iterable of BGR images (a few hundred representative frames)
+        input_size: Model input size (read from the model when it is fixed)
+        per_channel: Per-channel weight scales (more accurate for convolutions)
+
+    Returns:
+        Number of calibration images used
+    """
+    try:
+        import onnxruntime
+        from onnxruntime.quantization import (
+            CalibrationDataReader, QuantFormat, QuantType, quantize_static
+        )
+    except ImportError:
+        raise BackendUnavailable("onnxruntime is not installed")
+
+    session = onnxruntime.InferenceSession(model_path, providers=['CPUExecutionProvider'])
+    model_input = session.get_inputs()[0]
+    size = model_input.shape[-1] if isinstance(model_input.shape[-1], int) else (input_size or 640)
+
+    class Reader(CalibrationDataReader):
+        def __init__(self):
+            self.images = iter(calibration_images)
+            self.count = 0
+
+        def get_next(self):
+            image = next(self.images, None)
+            if image is None:
+                return None
+            self.count += 1
+            blob, _ = make_blob(image, size, 'yolov5')
+            return {model_input.name: blob}
+
+    reader = Reader()
+    quantize_static(
+        model_path, output_path, reader,
+        quant_format=QuantFormat.QDQ,
+        activation_type=QuantType.QUInt8,
+        weight_type=QuantType.QInt8,
+        per_channel=per_channel,
+    )
+    logger.info(f"Quantized {model_path} to {output_path} using {reader.count} calibration images")
+    return reader.count
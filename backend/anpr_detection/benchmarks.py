@@ -0,0 +1,205 @@
+"""
+Seed data and frame replay helpers for ANPR benchmark management commands
+"""
+import os
+import json
+import random
+import logging
+import cv2
+import numpy as np
+from datetime import timedelta
+from django.utils import timezone
+from anpr_cameras.models import Camera
+from .models import Detection
+from .tiling import box_iou
+
+# Configure logger
+logger = logging.getLogger('anpr_detection')
+
+BENCHMARK_CAMERA_PREFIX = 'Benchmark Camera'
+LETTERS = 'ABCDEFGHIJKLMNOPQRSTUVWXYZ'
+DIGITS = '0123456789'
+
+
+def random_plate(rng):
+    """Generate a plate number like MH12AB1234"""
+    return (
+        ''.join(rng.choice(LETTERS) for _ in range(2)) +
+        ''.join(rng.choice(DIGITS) for _ in range(2)) +
+        ''.join(rng.choice(LETTERS) for _ in range(2)) +
+        ''.join(rng.choice(DIGITS) for _ in range(4))
+    )
+
+
+def get_or_create_benchmark_cameras(count):
+    """Return `count` benchmark cameras, creating any that are missing"""
+    cameras = []
+    for i in range(count):
+        camera, _ = Camera.objects.get_or_create(
+            name=f"{BENCHMARK_CAMERA_PREFIX} {i + 1}",
+            defaults={'rtsp_url': 'rtsp://benchmark.invalid/stream', 'location': f"Benchmark Lane {i + 1}"}
+        )
+        cameras.append(camera)
+    return cameras
+
+
+def seed_detections(rows, cameras=10, days=30, plates=None, blacklist_ratio=0.01,
+                    batch_size=10000, seed=42, stdout=None):
+    """
+    Bulk insert synthetic detections for benchmarking
+
+    Rows are inserted with bulk_create, bypassing Detection.save so no
+    blacklist lookups or alerts are triggered.
+
+    Args:
+        rows: Number of detections to insert
+        cameras: Number of benchmark cameras to spread detections over
+        days: Detections are spread uniformly over the last `days` days
+        plates: Size of the plate population (defaults to rows // 5)
+        blacklist_ratio: Fraction of detections flagged as blacklisted
+        batch_size: Rows per bulk_create call
+        seed: Random seed for reproducible data
+        stdout: Optional stream for progress output
+
+    Returns:
+        List of benchmark Camera objects
+    """
+    rng = random.Random(seed)
+    camera_objs = get_or_create_benchmark_cameras(cameras)
+    population = [random_plate(rng) for _ in range(max(1, plates or rows // 5))]
+    now = timezone.now()
+    span = days * 86400
+
+    inserted = 0
+    while inserted < rows:
+        batch = []
+        for _ in range(min(batch_size, rows - inserted)):
+            batch.append(Detection(
+                plate_number=rng.choice(population),
+                timestamp=now - timedelta(seconds=rng.random() * span),
+                camera=rng.choice(camera_objs),
+                confidence=round(rng.uniform(0.5, 1.0), 3),
+                blacklist_flag=rng.random() < blacklist_ratio,
+                processed=True,
+            ))
+        Detection.objects.bulk_create(batch, batch_size=batch_size)
+        inserted += len(batch)
+        if stdout:
+            stdout.write(f"Seeded {inserted}/{rows} detections")
+
+    logger.info(f"Seeded {rows} benchmark detections over {cameras} cameras")
+    return camera_objs
+
+
+def clear_benchmark_data():
+    """Delete benchmark cameras and (by cascade) their detections"""
+    deleted, _ = Camera.objects.filter(name__startswith=BENCHMARK_CAMERA_PREFIX).delete()
+    return deleted
+
+
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.bmp')
+
+
+def synthetic_frames(count, width=1280, height=720, seed=42):
+    """
+    Generate labelled frames with one rendered plate each
+
+    Backgrounds are smooth shading with a few hard-edged shapes (vehicle
+    bodies, lane markings) so candidate filters see some clutter.
+
+    Yields:
+        Tuple of (frame name, BGR image, list of ground-truth (x, y, w, h) boxes)
+    """
+    rng = random.Random(seed)
+    noise = np.random.default_rng(seed)
+    for i in range(count):
+        shading = noise.integers(40, 140, size=(height // 40, width // 40, 3), dtype=np.uint8)
+        frame = cv2.resize(shading, (width, height), interpolation=cv2.INTER_CUBIC)
+        for _ in range(rng.randint(2, 6)):
+            x0, y0 = rng.randint(0, width - 1), rng.randint(0, height - 1)
+            color = tuple(rng.randint(0, 255) for _ in range(3))
+            cv2.rectangle(frame, (x0, y0), (x0 + rng.randint(50, 400), y0 + rng.randint(50, 300)), color, -1)
+
+        plate_w = rng.randint(width // 10, width // 4)
+        plate_h = plate_w // 4
+        x = rng.randint(0, width - plate_w - 1)
+        y = rng.randint(height // 3, height - plate_h - 1)
+        cv2.rectangle(frame, (x, y), (x + plate_w, y + plate_h), (235, 235, 235), -1)
+        cv2.rectangle(frame, (x, y), (x + plate_w, y + plate_h), (20, 20, 20), 2)
+
+        text = random_plate(rng)
+        thickness = max(1, plate_h // 15)
+        (text_w, text_h), _ = cv2.getTextSize(text, cv2.FONT_HERSHEY_SIMPLEX, 1.0, thickness)
+        font_scale = min(plate_w * 0.9 / text_w, plate_h * 0.6 / text_h)
+        (text_w, text_h), _ = cv2.getTextSize(text, cv2.FONT_HERSHEY_SIMPLEX, font_scale, thickness)
+        cv2.putText(frame, text, (x + (plate_w - text_w) // 2, y + (plate_h + text_h) // 2),
+                    cv2.FONT_HERSHEY_SIMPLEX, font_scale, (10, 10, 10), thickness)
+        yield f"synthetic_{i:06d}", frame, [(x, y, plate_w, plate_h)]
+
+
+def replay_frames(images_dir=None, video=None, labels=None, limit=None):
+    """
+    Load recorded frames for replay
+
+    Args:
+        images_dir: Directory of still images (sorted by name)
+        video: Video file; frames are named frame_000000, frame_000001, ...
+        labels: Optional JSON file mapping frame name (image file name
+            without extension, or video frame name) to [[x, y, w, h], ...]
+        limit: Maximum frames to load
+
+    Returns:
+        List of (frame name, BGR image, ground-truth boxes or None if unlabelled)
+    """
+    truth = {}
+    if labels:
+        with open(labels) as f:
+            truth = {name: [tuple(box) for box in boxes] for name, boxes in json.load(f).items()}
+
+    frames = []
+    if images_dir:
+        for filename in sorted(os.listdir(images_dir)):
+            if limit and len(frames) >= limit:
+                break
+            if not filename.lower().endswith(IMAGE_EXTENSIONS):
+                continue
+            image = cv2.imread(os.path.join(images_dir, filename))
+            if image is None:
+                continue
+            name = os.path.splitext(filename)[0]
+            frames.append((name, image, truth.get(name) if labels else None))
+    elif video:
+        cap = cv2.VideoCapture(video)
+        try:
+            while not limit or len(frames) < limit:
+                ret, image = cap.read()
+                if not ret:
+                    break
+                name = f"frame_{len(frames):06d}"
+                frames.append((name, image, truth.get(name) if labels else None))
+        finally:
+            cap.release()
+    return frames
+
+
+def match_boxes(predicted, truth, iou_threshold=0.5):
+    """
+    Greedily match predictions (highest IoU first) to ground truth
+
+    Returns:
+        Tuple of (true positives, false positives, false negatives)
+    """
+    pairs = sorted(
+        ((box_iou(p, t), i, j) for i, p in enumerate(predicted) for j, t in enumerate(truth)),
+        reverse=True,
+    )
+    used_p, used_t = set(), set()
+    for iou, i, j in pairs:
+        if iou < iou_threshold:
+            break
+        if i in used_p or j in used_t:
+            continue
+        used_p.add(i)
+        used_t.add(j)
+    return len(used_p), len(predicted) - len(used_p), len(truth) - len(used_t)
+
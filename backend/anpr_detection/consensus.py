@@ -0,0 +1,310 @@
+"""
+Multi-frame OCR consensus per tracked plate
+
+A plate stays in view for several processed frames, and each OCR read of
+it is slightly different (AB12CD, A812CD, AB12C0). Rather than saving every
+read, reads of the same plate are gathered into a track and vote per
+character position, weighted by read confidence (detector x OCR). Reads
+of different lengths vote separately and the length with the most weight
+wins.
+
+Boxes join a track by overlap with its last box; reads whose box moved too
+far join by text instead (same length, at most MAX_TEXT_DISTANCE differing
+characters). Once a track has MIN_READS reads and every position's winner
+holds at least MIN_AGREEMENT of the weight, the consensus is stable: the
+track emits one detection and later boxes on it skip OCR while their crop
+stays within REOPEN_DISTANCE hash bits of the crop the track settled on. A
+crop that changed is read again: the same plate keeps the track, another
+plate (a new vehicle in the same spot) closes it and starts a new track. A
+track not seen for WINDOW seconds expires, emitting its best consensus if
+it never became stable.
+"""
+import time
+import logging
+import itertools
+import threading
+from collections import defaultdict
+from django.conf import settings
+from .tiling import box_iou
+from .metrics import PipelineMetrics
+from .ocr_cache import perceptual_hash, hamming
+
+# Configure logger
+logger = logging.getLogger('anpr_detection')
+
+DEFAULT_CONSENSUS_SETTINGS = {
+    'ENABLED': True,
+    'WINDOW': 5.0,            # Seconds a track lives after it was last seen
+    'MIN_READS': 3,           # Reads before a consensus can be stable
+    'MIN_AGREEMENT': 0.6,     # Weight share every position's winner needs
+    'IOU': 0.3,               # Box overlap that continues a track
+    'MAX_TEXT_DISTANCE': 2,   # Differing characters that still continue a track
+    'REOPEN_DISTANCE': 48,    # Hash bits a settled track's crop may change before it is read again
+}
+
+
+def get_consensus_settings():
+    """Return ANPR_CONSENSUS settings merged over the defaults"""
+    config = dict(DEFAULT_CONSENSUS_SETTINGS)
+    config.update(getattr(settings, 'ANPR_CONSENSUS', {}))
+    return config
+
+
+class PlateTrack:
+    """Votes for one plate seen across frames"""
+    _ids = itertools.count(1)
+
+    def __init__(self, box, now):
+        self.id = next(self._ids)
+        self.box = box
+        self.last_seen = now
+        self.reads = 0
+        # length -> reads and total weight, and length -> position -> char -> weight
+        self.length_reads = defaultdict(int)
+        self.length_weight = defaultdict(float)
+        self.votes = defaultdict(lambda: defaultdict(lambda: defaultdict(float)))
+        # Exact reads and their weight, the fallback when a mixed consensus is not a valid plate
+        self.read_weight = defaultdict(float)
+        self.text = ''
+        self.confidence = 0.0
+        self.agreement = 0.0
+        self.valid = True
+        self.stable = False
+        self.emitted = False
+        self.best_confidence = 0.0
+        self.best_box = box
+        self.snapshot = None
+        # Perceptual hash of the crop the consensus was last confirmed on
+        self.crop_hash = None
+        # Blacklist flag of the text it was last checked for
+        self.is_blacklisted = None
+        self.blacklist_text = None
+
+    def vote(self, text, confidence):
+        self.reads += 1
+        self.length_reads[len(text)] += 1
+        self.length_weight[len(text)] += confidence
+        self.read_weight[text] += confidence
+        positions = self.votes[len(text)]
+        for index, char in enumerate(text):
+            positions[index][char] += confidence
+
+    def tally(self, validate=None):
+        """Recompute the consensus text, its agreement and confidence"""
+        length = max(self.length_weight, key=self.length_weight.get)
+        chars, shares = [], []
+        for index in range(length):
+            weights = self.votes[length][index]
+            char = max(weights, key=weights.get)
+            chars.append(char)
+            shares.append(weights[char] / sum(weights.values()))
+        text = ''.join(chars)
+        if validate is not None and not validate(text):
+            text = max(self.read_weight, key=self.read_weight.get)
+        self.valid = validate is None or validate(text)
+        # Reads of other lengths disagree with every position
+        length_share = self.length_weight[length] / sum(self.length_weight.values())
+        self.text = text
+        self.agreement = min(shares) * length_share
+        # Mean confidence of the winning length's reads, scaled by how strongly they agree
+        self.confidence = self.length_weight[length] / self.length_reads[length] * self.agreement
+
+    def info(self):
+        return {
+            'track_id': self.id,
+            'reads': self.reads,
+            'agreement': round(self.agreement, 3),
+        }
+
+
+class ConsensusTracker:
+    """
+    Plate tracks for one camera
+
+    Owned by a stream's ANPRDetector; one-off images never form tracks.
+    """
+    def __init__(self, config=None, camera_id=None, validate=None):
+        self.config = config or get_consensus_settings()
+        self.camera_id = camera_id
+        self.validate = validate
+        self.metrics = PipelineMetrics()
+        self.tracks = []
+        self.lock = threading.Lock()
+
+    def match(self, boxes, now=None):
+        """
+        Existing track for each box by overlap, or None
+
+        Each track is matched to at most one box, best overlap first.
+        """
+        now = time.monotonic() if now is None else now
+        with self.lock:
+            live = [track for track in self.tracks if now - track.last_seen <= self.config['WINDOW']]
+            pairs = sorted(
+                ((box_iou(box, track.box), index, track) for index, box in enumerate(boxes) for track in live),
+                key=lambda pair: -pair[0],
+            )
+            matched = [None] * len(boxes)
+            used = set()
+            for iou, index, track in pairs:
+                if iou < self.config['IOU']:
+                    break
+                if matched[index] is None and track.id not in used:
+                    matched[index] = track
+                    used.add(track.id)
+            return matched
+
+    @staticmethod
+    def _text_distance(a, b):
+        """Differing characters between two texts, None if their lengths differ"""
+        if len(a) != len(b):
+            return None
+        return sum(x != y for x, y in zip(a, b))
+
+    def _match_text(self, text, exclude, now):
+        best, best_distance = None, self.config['MAX_TEXT_DISTANCE'] + 1
+        for track in self.tracks:
+            if track.id in exclude or now - track.last_seen > self.config['WINDOW']:
+                continue
+            distance = self._text_distance(track.text, text)
+            if distance is not None and distance < best_distance:
+                best, best_distance = track, distance
+        return best
+
+    def touch(self, track, box, now=None):
+        """Record a box on a settled track without a new read"""
+        with self.lock:
+            track.box = box
+            track.last_seen = time.monotonic() if now is None else now
+        self.metrics.increment(self.camera_id, 'ocr_skipped_consensus')
+
+    def changed(self, track, crop):
+        """Whether a settled track's box now holds a crop unlike the one it settled on"""
+        if track.crop_hash is None or crop is None:
+            return False
+        return hamming(perceptual_hash(crop), track.crop_hash) > self.config['REOPEN_DISTANCE']
+
+    def recheck(self, track, box, text, crop, now=None):
+        """
+        Compare a fresh read of a changed crop with a settled track
+
+        Args:
+            track: Settled track matched by overlap
+            box: (x, y, w, h) of the read
+            text: Validated plate text
+            crop: Crop that was read
+            now: Current monotonic time
+
+        Returns:
+            True if the read is still the track's plate (the box is recorded
+            on the track), False if the track was closed for another plate
+        """
+        now = time.monotonic() if now is None else now
+        with self.lock:
+            distance = self._text_distance(track.text, text)
+            if distance is not None and distance <= self.config['MAX_TEXT_DISTANCE']:
+                track.box = box
+                track.last_seen = now
+                track.crop_hash = perceptual_hash(crop)
+                return True
+            # It already reported; the plate now in its place gets a track of its own
+            self.tracks = [other for other in self.tracks if other is not track]
+        self.metrics.increment(self.camera_id, 'consensus_reopened')
+        return False
+
+    def observe(self, box, text, confidence, frame=None, track=None, exclude=(), now=None, crop=None):
+        """
+        Add one read to its track
+
+        Args:
+            box: (x, y, w, h) of the read
+            text: Validated plate text
+            confidence: Detector x OCR confidence
+            frame: Frame of the read, kept (copied) when it is the track's best
+            track: Track matched by overlap, if any
+            exclude: Track ids already matched in this frame
+            now: Current monotonic time
+            crop: Crop that was read; a stable track keeps its hash
+
+        Returns:
+            Tuple of (track, emit) where emit is True once, when the track's
+            consensus first becomes stable
+        """
+        now = time.monotonic() if now is None else now
+        with self.lock:
+            if track is None:
+                track = self._match_text(text, exclude, now)
+            if track is None:
+                track = PlateTrack(box, now)
+                self.tracks.append(track)
+                self.metrics.increment(self.camera_id, 'consensus_tracks')
+
+            track.box = box
+            track.last_seen = now
+            track.vote(text, confidence)
+            track.tally(self.validate)
+            if track.snapshot is None or confidence > track.best_confidence:
+                track.best_confidence = confidence
+                track.best_box = box
+                track.snapshot = frame.copy() if frame is not None else None
+            self.metrics.increment(self.camera_id, 'consensus_reads')
+
+            emit = False
+            if (not track.stable and track.reads >= self.config['MIN_READS']
+                    and track.agreement >= self.config['MIN_AGREEMENT']):
+                track.stable = True
+                track.crop_hash = perceptual_hash(crop) if crop is not None else None
+                if not track.emitted:
+                    track.emitted = emit = True
+                    self.metrics.increment(self.camera_id, 'consensus_emitted')
+            return track, emit
+
+    def expire(self, now=None, flush=False):
+        """
+        Remove tracks not seen within WINDOW (all tracks with flush)
+
+        Returns:
+            Expired tracks that never emitted; each now emits its consensus
+        """
+        now = time.monotonic() if now is None else now
+        with self.lock:
+            expired = [
+                track for track in self.tracks
+                if flush or now - track.last_seen > self.config['WINDOW']
+            ]
+            if not expired:
+                return []
+            expired_ids = {track.id for track in expired}
+            self.tracks = [track for track in self.tracks if track.id not in expired_ids]
+            pending = [track for track in expired if not track.emitted and track.reads]
+            for track in pending:
+                track.emitted = True
+            self.metrics.increment(self.camera_id, 'consensus_emitted_on_expiry', len(pending))
+            return pending
+
+
+def consensus_summary(camera_stats):
+    """
+    Derived consensus figures for one camera's PipelineMetrics snapshot
+
+    Returns:
+        Dictionary with tracks, reads, detections emitted, duplicate reads
+        suppressed, OCR calls saved and settled tracks reopened for another
+        plate, or None if no tracks were formed
+    """
+    counters = camera_stats['counters']
+    tracks = counters.get('consensus_tracks', 0)
+    if not tracks:
+        return None
+
+    reads = counters.get('consensus_reads', 0)
+    emitted = counters.get('consensus_emitted', 0) + counters.get('consensus_emitted_on_expiry', 0)
+    return {
+        'tracks': tracks,
+        'reads': reads,
+        'emitted': emitted,
+        'emitted_on_expiry': counters.get('consensus_emitted_on_expiry', 0),
+        'duplicates_suppressed': max(0, reads - emitted),
+        'ocr_calls_saved': counters.get('ocr_skipped_consensus', 0),
+        'reopened': counters.get('consensus_reopened', 0),
+    }
@@ -0,0 +1,265 @@
+"""
+Plate journey timelines and cross-camera correlation queries
+"""
+import heapq
+import logging
+from collections import deque
+from django.db.models import Q
+from anpr_cameras.models import Camera
+from .models import Detection
+
+# Configure logger
+logger = logging.getLogger('anpr_detection')
+
+# Rows fetched per database round trip when streaming a camera's detections
+CORRELATION_CHUNK_SIZE = 5000
+# Upper bound on camera A sightings held while waiting for a camera B match
+MAX_PENDING_SIGHTINGS = 200000
+HISTOGRAM_BINS = 20
+PERCENTILES = (50, 90, 95, 99)
+
+
+def plate_history(plate_number, since, limit=1000):
+    """
+    Chronological sightings of one plate, with a per-camera summary
+
+    Reads the newest `limit` rows through the (plate_number, -timestamp, -id)
+    index and returns them oldest first.
+
+    Args:
+        plate_number: Exact plate number
+        since: Only include sightings at or after this time
+        limit: Maximum number of sightings returned
+
+    Returns:
+        Dictionary with the timeline, per-camera stops and a truncated flag
+    """
+    rows = list(
+        Detection.objects.filter(plate_number=plate_number, timestamp__gte=since)
+        .order_by('-timestamp', '-id')
+        .values_list('id', 'timestamp', 'camera_id', 'confidence', 'blacklist_flag')[:limit + 1]
+    )
+    truncated = len(rows) > limit
+    rows = rows[:limit]
+    rows.reverse()
+
+    cameras = {
+        camera_id: (name, location)
+        for camera_id, name, location in Camera.objects.filter(
+            id__in={row[2] for row in rows}
+        ).values_list('id', 'name', 'location')
+    }
+
+    timeline = []
+    stops = {}
+    for detection_id, timestamp, camera_id, confidence, blacklist_flag in rows:
+        name, location = cameras.get(camera_id, ('', ''))
+        timeline.append({
+            'id': detection_id,
+            'timestamp': timestamp,
+            'camera': camera_id,
+            'camera_name': name,
+            'camera_location': location,
+            'confidence': confidence,
+            'blacklist_flag': blacklist_flag,
+        })
+
+        stop = stops.setdefault(camera_id, {
+            'camera': camera_id,
+            'camera_name': name,
+            'first_seen': timestamp,
+            'last_seen': timestamp,
+            'sightings': 0,
+        })
+        stop['last_seen'] = timestamp
+        stop['sightings'] += 1
+
+    return {
+        'plate_number': plate_number,
+        'since': since,
+        'sightings': len(timeline),
+        'truncated': truncated,
+        'cameras': sorted(stops.values(), key=lambda stop: stop['first_seen']),
+        'timeline': timeline,
+    }
+
+
+def camera_stream(camera_id, start, end, chunk_size=CORRELATION_CHUNK_SIZE):
+    """
+    Yield (timestamp, id, plate_number) for one camera in time order
+
+    Rows are read in keyset-paginated chunks on the (camera, timestamp, id)
+    index, so no cursor is held open and memory stays constant.
+    """
+    detections = Detection.objects.filter(
+        camera_id=camera_id,
+        timestamp__gte=start,
+        timestamp__lte=end,
+    ).order_by('timestamp', 'id').values_list('timestamp', 'id', 'plate_number')
+
+    last = None
+    while True:
+        page = detections
+        if last is not None:
+            page = page.filter(Q(timestamp__gt=last[0]) | Q(timestamp=last[0], id__gt=last[1]))
+        chunk = list(page[:chunk_size])
+        yield from chunk
+
+        if len(chunk) < chunk_size:
+            break
+        last = chunk[-1][:2]
+
+
+class TravelTimeHistogram:
+    """
+    Fixed-size histogram of travel times at one-second resolution
+
+    Memory is bounded by the window size rather than the number of matches;
+    percentiles are read from the cumulative counts.
+    """
+    def __init__(self, window_seconds):
+        self.counts = [0] * (int(window_seconds) + 1)
+        self.total = 0
+        self.sum = 0.0
+        self.min = None
+        self.max = None
+
+    def add(self, seconds):
+        self.counts[min(int(seconds), len(self.counts) - 1)] += 1
+        self.total += 1
+        self.sum += seconds
+        self.min = seconds if self.min is None else min(self.min, seconds)
+        self.max = seconds if self.max is None else max(self.max, seconds)
+
+    def percentile(self, percent):
+        if not self.total:
+            return None
+        target = self.total * percent / 100
+        running = 0
+        for second, count in enumerate(self.counts):
+            running += count
+            if running >= target:
+                return second
+        return len(self.counts) - 1
+
+    def buckets(self, bins=HISTOGRAM_BINS):
+        width = max(1, -(-len(self.counts) // bins))
+        return [
+            {
+                'from_seconds': start,
+                'to_seconds': min(start + width, len(self.counts)),
+                'count': sum(self.counts[start:start + width]),
+            }
+            for start in range(0, len(self.counts), width)
+        ]
+
+    def summary(self, bins=HISTOGRAM_BINS):
+        return {
+            'count': self.total,
+            'min_seconds': self.min,
+            'max_seconds': self.max,
+            'mean_seconds': round(self.sum / self.total, 2) if self.total else None,
+            'percentiles': {f"p{p}": self.percentile(p) for p in PERCENTILES},
+            'histogram': self.buckets(bins),
+        }
+
+
+def correlate_cameras(camera_a, camera_b, start, end, window, max_pairs=100,
+                      max_pending=MAX_PENDING_SIGHTINGS, chunk_size=CORRELATION_CHUNK_SIZE):
+    """
+    Find plates seen at camera A and then at camera B within `window`
+
+    Both cameras' detections are streamed in time order and merged, so the
+    join is a single pass. Camera A sightings are held until they fall out
+    of the window or are matched; each camera B sighting is paired with the
+    latest pending camera A sighting of the same plate, which is then
+    consumed so repeated reads at camera B are not counted twice.
+
+    Args:
+        camera_a: Camera ID where the journey starts
+        camera_b: Camera ID where the journey ends
+        start: Earliest camera B sighting considered
+        end: Latest camera B sighting considered
+        window: Maximum travel time (timedelta)
+        max_pairs: Matched pairs returned (all matches count toward the statistics)
+        max_pending: Cap on pending camera A sightings; the oldest are dropped beyond it
+        chunk_size: Rows fetched per database round trip
+
+    Returns:
+        Dictionary with travel time statistics and a sample of matched pairs
+    """
+    window_seconds = window.total_seconds()
+    stream_a = ((timestamp, 0, detection_id, plate) for timestamp, detection_id, plate
+                in camera_stream(camera_a, start - window, end, chunk_size))
+    stream_b = ((timestamp, 1, detection_id, plate) for timestamp, detection_id, plate
+                in camera_stream(camera_b, start, end, chunk_size))
+
+    # plate -> deque of (timestamp, detection id) for camera A sightings in the window
+    pending = {}
+    # All pending sightings in arrival order, for expiry
+    expiry = deque()
+    pending_count = 0
+    dropped = 0
+    scanned = 0
+
+    histogram = TravelTimeHistogram(window_seconds)
+    pairs = []
+
+    # Camera A sorts before camera B at equal timestamps
+    for timestamp, source, detection_id, plate in heapq.merge(stream_a, stream_b):
+        scanned += 1
+
+        # Expire camera A sightings that can no longer be matched
+        while expiry and ((timestamp - expiry[0][0]).total_seconds() > window_seconds or pending_count > max_pending):
+            expired_at, expired_id, expired_plate = expiry.popleft()
+            sightings = pending.get(expired_plate)
+            if sightings and sightings[0][1] == expired_id:
+                sightings.popleft()
+                pending_count -= 1
+                if (timestamp - expired_at).total_seconds() <= window_seconds:
+                    dropped += 1
+                if not sightings:
+                    del pending[expired_plate]
+
+        if source == 0:
+            pending.setdefault(plate, deque()).append((timestamp, detection_id))
+            expiry.append((timestamp, detection_id, plate))
+            pending_count += 1
+            continue
+
+        sightings = pending.get(plate)
+        if not sightings:
+            continue
+
+        seen_at, seen_id = sightings.pop()
+        pending_count -= 1
+        if not sightings:
+            del pending[plate]
+
+        travel_seconds = (timestamp - seen_at).total_seconds()
+        histogram.add(travel_seconds)
+        if len(pairs) < max_pairs:
+            pairs.append({
+                'plate_number': plate,
+                'detection_a': seen_id,
+                'seen_at_a': seen_at,
+                'detection_b': detection_id,
+                'seen_at_b': timestamp,
+                'travel_seconds': travel_seconds,
+            })
+
+    if dropped:
+        logger.warning(f"Correlation {camera_a}->{camera_b} dropped {dropped} pending sightings over the state cap")
+
+    return {
+        'camera_a': camera_a,
+        'camera_b': camera_b,
+        'start': start,
+        'end': end,
+        'window_seconds': window_seconds,
+        'detections_scanned': scanned,
+        'matches': histogram.total,
+        'dropped_sightings': dropped,
+        'travel_time': histogram.summary(),
+        'pairs': pairs,
+    }
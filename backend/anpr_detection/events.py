@@ -0,0 +1,219 @@
+"""
+In-process publish/subscribe for live detection and alert events
+
+Detections and alerts are published from the ingest path once their
+transaction commits. Subscribers are Server-Sent Events streams (see
+views.event_stream) served under ASGI in the same process. Each subscriber
+has a bounded buffer. A client that falls behind is disconnected and
+resumes from its Last-Event-ID out of a short in-memory history, so a slow
+browser never holds back ingest and no listing queries are re-run to keep
+dashboards fresh.
+"""
+import re
+import json
+import time
+import asyncio
+import logging
+import threading
+from collections import deque
+from django.core.serializers.json import DjangoJSONEncoder
+from .plate_search import compile_pattern
+
+# Configure logger
+logger = logging.getLogger('anpr_detection')
+
+EVENT_HISTORY_SIZE = 1000
+CLIENT_BUFFER_SIZE = 100
+EVENT_TYPES = ('detection', 'alert')
+
+
+class Event:
+    """A published event with its routing attributes"""
+    __slots__ = ('id', 'type', 'data', 'camera_id', 'blacklisted', 'plate_number', 'timestamp')
+
+    def __init__(self, event_id, event_type, data, camera_id=None, blacklisted=False,
+                 plate_number=None, timestamp=None):
+        self.id = event_id
+        self.type = event_type
+        self.data = data
+        self.camera_id = camera_id
+        self.blacklisted = blacklisted
+        self.plate_number = plate_number
+        self.timestamp = timestamp
+
+    def encode(self):
+        """Serialize as an SSE message"""
+        payload = json.dumps(self.data, cls=DjangoJSONEncoder)
+        return f"id: {self.id}\nevent: {self.type}\ndata: {payload}\n\n".encode('utf-8')
+
+
+class Subscription:
+    """
+    One client's filters and bounded buffer, owned by its event loop
+
+    The plate, status and date filters mirror the detection list's
+    (see filters.DetectionFilter), so a page can follow exactly the rows it
+    is showing. When the buffer overflows the subscription is marked
+    ``overflowed``; the stream drains what it has and closes so the client
+    reconnects and replays from the broker history.
+
+    Raises:
+        PlateSearchError: if plate_search has no letters or digits
+    """
+    def __init__(self, loop, camera_ids=None, blacklist_only=False, types=EVENT_TYPES,
+                 buffer_size=CLIENT_BUFFER_SIZE, blacklist_flag=None, plate_search=None,
+                 start_date=None, end_date=None):
+        self.loop = loop
+        self.camera_ids = set(camera_ids) if camera_ids else None
+        self.blacklist_only = blacklist_only
+        self.types = set(types)
+        self.blacklist_flag = blacklist_flag
+        self.plate_regex = re.compile(compile_pattern(plate_search)[0]) if plate_search else None
+        self.start_date = start_date
+        self.end_date = end_date
+        self.queue = asyncio.Queue(maxsize=buffer_size)
+        self.overflowed = False
+
+    def wants(self, event):
+        if event.type not in self.types:
+            return False
+        if self.blacklist_only and not event.blacklisted:
+            return False
+        if self.blacklist_flag is not None and event.blacklisted != self.blacklist_flag:
+            return False
+        if self.camera_ids is not None and event.camera_id not in self.camera_ids:
+            return False
+        if self.plate_regex is not None and not self.plate_regex.search(event.plate_number or ''):
+            return False
+        if self.start_date is not None and (event.timestamp is None or event.timestamp < self.start_date):
+            return False
+        if self.end_date is not None and (event.timestamp is None or event.timestamp > self.end_date):
+            return False
+        return True
+
+    def offer(self, event):
+        """Queue an event; runs on the subscriber's loop"""
+        if self.overflowed:
+            return
+        try:
+            self.queue.put_nowait(event)
+        except asyncio.QueueFull:
+            self.overflowed = True
+
+
+class EventBroker:
+    """
+    Thread-safe fan-out of events to subscribers on any event loop
+    """
+    _instance = None
+    _instance_lock = threading.Lock()
+
+    def __new__(cls):
+        with cls._instance_lock:
+            if cls._instance is None:
+                instance = super(EventBroker, cls).__new__(cls)
+                instance.lock = threading.Lock()
+                instance.subscribers = set()
+                instance.history = deque(maxlen=EVENT_HISTORY_SIZE)
+                # Start ids at the boot time in ms so they keep increasing across restarts
+                instance.last_id = int(time.time() * 1000)
+                instance.published = 0
+                instance.disconnected = 0
+                cls._instance = instance
+        return cls._instance
+
+    def publish(self, event_type, data, camera_id=None, blacklisted=False, plate_number=None,
+                timestamp=None):
+        """
+        Publish an event to all matching subscribers
+
+        Never blocks: each delivery is handed to the subscriber's loop.
+        """
+        with self.lock:
+            self.last_id += 1
+            event = Event(self.last_id, event_type, data, camera_id, blacklisted, plate_number, timestamp)
+            self.history.append(event)
+            self.published += 1
+            subscribers = list(self.subscribers)
+
+        for subscription in subscribers:
+            if not subscription.wants(event):
+                continue
+            try:
+                subscription.loop.call_soon_threadsafe(subscription.offer, event)
+            except RuntimeError:
+                # The subscriber's loop has closed
+                self.unsubscribe(subscription)
+        return event
+
+    def subscribe(self, subscription, last_event_id=None):
+        """
+        Register a subscription and collect the events it missed
+
+        Returns:
+            Tuple of (events to replay, reset) where reset is True when the
+            missed events are no longer in history and the client should
+            reload its data
+        """
+        with self.lock:
+            self.subscribers.add(subscription)
+            if last_event_id is None:
+                return [], False
+
+            reset = last_event_id > self.last_id or (
+                bool(self.history) and self.history[0].id > last_event_id + 1
+            )
+            replay = [event for event in self.history if event.id > last_event_id and subscription.wants(event)]
+            return replay, reset
+
+    def unsubscribe(self, subscription):
+        with self.lock:
+            if subscription in self.subscribers:
+                self.subscribers.discard(subscription)
+                if subscription.overflowed:
+                    self.disconnected += 1
+
+    def stats(self):
+        with self.lock:
+            return {
+                'subscribers': len(self.subscribers),
+                'last_event_id': self.last_id,
+                'published': self.published,
+                'history': len(self.history),
+                'overflow_disconnects': self.disconnected,
+            }
+
+
+def publish_detection(detection):
+    """Publish a committed detection"""
+    try:
+        _publish_detection(detection)
+    except Exception as e:
+        logger.error(f"Failed to publish detection {detection.id}: {str(e)}")
+
+
+def publish_alert(alert):
+    """Publish a committed alert"""
+    try:
+        _publish_alert(alert)
+    except Exception as e:
+        logger.error(f"Failed to publish alert {alert.id}: {str(e)}")
+
+
+def _publish_detection(detection):
+    # Same payload as the detection list so pages can insert it as-is
+    from .serializers import DetectionSerializer
+    EventBroker().publish(
+        'detection', DetectionSerializer(detection).data,
+        camera_id=detection.camera_id, blacklisted=detection.blacklist_flag,
+        plate_number=detection.plate_number, timestamp=detection.timestamp,
+    )
+
+
+def _publish_alert(alert):
+    from anpr_alerts.serializers import AlertSerializer
+    EventBroker().publish(
+        'alert', AlertSerializer(alert).data,
+        camera_id=alert.detection.camera_id, blacklisted=True,
+        plate_number=alert.blacklist_entry.plate_number, timestamp=alert.timestamp,
+    )
@@ -0,0 +1,44 @@
+"""
+Filter schema for detection listings
+"""
+import django_filters
+from rest_framework.exceptions import ValidationError
+from .models import Detection
+from .plate_search import filter_plates, PlateSearchError
+
+
+class DetectionFilter(django_filters.FilterSet):
+    """
+    Validated filters for the detection list
+
+    Invalid values (bad dates, non-numeric camera IDs, etc.) are rejected
+    with a 400 instead of being ignored. Each supported combination is
+    backed by an index on Detection:
+
+        camera + start_date/end_date         (camera, -timestamp, -id)
+        plate_number + start_date/end_date   (plate_number, -timestamp, -id)
+        blacklist_flag + start_date/end_date (-timestamp, -id) WHERE blacklist_flag
+        start_date/end_date                  (-timestamp, -id)
+
+    ``plate_search`` takes a partial or wildcard plate pattern (``MH12*``,
+    ``*4521``, ``MH*45?1``) and is resolved through the plate search index.
+    """
+    plate_number = django_filters.CharFilter(field_name='plate_number')
+    plate_search = django_filters.CharFilter(method='filter_plate_search')
+    camera = django_filters.NumberFilter(field_name='camera_id')
+    blacklist_flag = django_filters.BooleanFilter(field_name='blacklist_flag')
+    processed = django_filters.BooleanFilter(field_name='processed')
+    start_date = django_filters.DateTimeFilter(field_name='timestamp', lookup_expr='gte')
+    end_date = django_filters.DateTimeFilter(field_name='timestamp', lookup_expr='lte')
+    min_confidence = django_filters.NumberFilter(field_name='confidence', lookup_expr='gte')
+
+    class Meta:
+        model = Detection
+        fields = ['plate_number', 'plate_search', 'camera', 'blacklist_flag', 'processed',
+                  'start_date', 'end_date', 'min_confidence']
+
+    def filter_plate_search(self, queryset, name, value):
+        try:
+            return filter_plates(queryset, value)
+        except PlateSearchError as e:
+            raise ValidationError({name: str(e)})
@@ -0,0 +1,165 @@
+"""
+Per-camera ring of reusable frame buffers
+
+A stream decodes every frame but processes one a second and previews the
+latest on request. Rather than queueing freshly allocated frames, each
+camera owns a fixed set of slots that frames are decoded into in place
+(VideoCapture.read(image=...)), so a running stream allocates nothing per
+frame and holds at most SLOTS frames, fewer when that would exceed
+MAX_BYTES.
+
+The newest committed slot is the latest frame, tagged with a sequence
+number. Readers pin it while they use it; the capture thread never
+decodes into the latest slot or a pinned one, and when every slot is busy
+it skips the frame without decoding it. Frames read from the ring are
+only valid while pinned: anything kept longer (snapshots, annotated
+previews) must be copied.
+"""
+import logging
+import threading
+from contextlib import contextmanager
+from django.conf import settings
+
+# Configure logger
+logger = logging.getLogger('anpr_detection')
+
+DEFAULT_FRAME_BUFFER_SETTINGS = {
+    'SLOTS': 4,                     # Frames held per camera
+    'MAX_BYTES': 64 * 1024 * 1024,  # Per camera; large frames get fewer slots (never fewer than 2)
+}
+
+MIN_SLOTS = 2
+
+
+def get_frame_buffer_settings():
+    """Return ANPR_FRAME_BUFFER settings merged over the defaults"""
+    config = dict(DEFAULT_FRAME_BUFFER_SETTINGS)
+    config.update(getattr(settings, 'ANPR_FRAME_BUFFER', {}))
+    return config
+
+
+class FrameRing:
+    """
+    Preallocated frame slots for one camera, one writer and many readers
+
+    Args:
+        config: ANPR_FRAME_BUFFER settings
+        camera_id: Camera the frames come from, for logging
+    """
+    def __init__(self, config=None, camera_id=None):
+        self.config = config or get_frame_buffer_settings()
+        self.camera_id = camera_id
+        self.lock = threading.Lock()
+        self.slots = max(MIN_SLOTS, self.config['SLOTS'])
+        self.usable = self.slots
+        # Buffers are allocated by the first decode into each slot
+        self.buffers = [None] * self.slots
+        self.sequences = [0] * self.slots
+        self.pins = [0] * self.slots
+        self.latest_slot = None
+        self.sequence = 0
+        self.dropped = 0
+        self.reallocations = 0
+
+    def acquire(self):
+        """
+        Slot for the next frame to be decoded into
+
+        Returns:
+            Tuple of (slot, buffer) where buffer is None until the slot has
+            held a frame, or (None, None) when every slot is latest or pinned
+            and the frame should be skipped
+        """
+        with self.lock:
+            free = [
+                slot for slot in range(self.usable)
+                if slot != self.latest_slot and not self.pins[slot]
+            ]
+            if not free:
+                self.dropped += 1
+                return None, None
+            # Oldest first, so recently replaced frames stay readable longest
+            slot = min(free, key=self.sequences.__getitem__)
+            return slot, self.buffers[slot]
+
+    def commit(self, slot, frame):
+        """
+        Publish a decoded frame as the latest
+
+        Args:
+            slot: Slot from acquire
+            frame: Decoded frame; normally the slot's buffer, filled in place
+
+        Returns:
+            The frame's sequence number
+        """
+        with self.lock:
+            if frame is not self.buffers[slot]:
+                if self.buffers[slot] is not None:
+                    self.reallocations += 1
+                self.buffers[slot] = frame
+                self._fit(frame.nbytes)
+            self.sequence += 1
+            self.sequences[slot] = self.sequence
+            self.latest_slot = slot
+            return self.sequence
+
+    def _fit(self, frame_bytes):
+        """Limit the usable slots so their frames stay within MAX_BYTES"""
+        usable = max(MIN_SLOTS, min(self.slots, self.config['MAX_BYTES'] // max(1, frame_bytes)))
+        if usable != self.usable:
+            logger.info(f"Camera {self.camera_id}: {usable} of {self.slots} frame slots fit "
+                        f"{self.config['MAX_BYTES']} bytes at {frame_bytes} bytes per frame")
+            self.usable = usable
+        # Release buffers of slots no longer used (a pinned one goes once unpinned)
+        for slot in range(usable, self.slots):
+            if not self.pins[slot] and slot != self.latest_slot:
+                self.buffers[slot] = None
+
+    @contextmanager
+    def latest(self):
+        """
+        Pin the latest frame while it is used
+
+        Yields:
+            Tuple of (sequence, frame), or (0, None) before the first frame;
+            the frame must not be kept or modified after the block
+        """
+        with self.lock:
+            slot = self.latest_slot
+            if slot is None:
+                sequence, frame = 0, None
+            else:
+                self.pins[slot] += 1
+                sequence, frame = self.sequences[slot], self.buffers[slot]
+        try:
+            yield sequence, frame
+        finally:
+            if slot is not None:
+                with self.lock:
+                    self.pins[slot] -= 1
+                    if slot >= self.usable and not self.pins[slot] and slot != self.latest_slot:
+                        self.buffers[slot] = None
+
+    def stats(self):
+        """
+        Buffer occupancy and memory
+
+        Returns:
+            Dictionary with slots (usable and configured), bytes held,
+            MAX_BYTES, frame shape, latest sequence, frames skipped because
+            every slot was busy, and buffer reallocations
+        """
+        with self.lock:
+            buffers = [buffer for buffer in self.buffers if buffer is not None]
+            latest = self.buffers[self.latest_slot] if self.latest_slot is not None else None
+            return {
+                'slots': self.usable,
+                'configured_slots': self.slots,
+                'bytes': sum(buffer.nbytes for buffer in buffers),
+                'max_bytes': self.config['MAX_BYTES'],
+                'frame_shape': list(latest.shape) if latest is not None else None,
+                'sequence': self.sequence,
+                'dropped': self.dropped,
+                'reallocations': self.reallocations,
+            }
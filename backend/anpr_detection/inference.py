@@ -0,0 +1,155 @@
+"""
+Bounded inference executor for the async ANPR image processing endpoint
+"""
+import math
+import time
+import asyncio
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from django.conf import settings
+from django.db import close_old_connections
+
+# Configure logger
+logger = logging.getLogger('anpr_detection')
+
+DEFAULT_INFERENCE_SETTINGS = {
+    'WORKERS': 2,            # Threads running OpenCV/Tesseract work
+    'MAX_IN_FLIGHT': 8,      # Running + queued requests before answering 429
+    'MAX_QUEUE_WAIT': 5.0,   # Seconds a request may wait for a worker before answering 503
+}
+
+
+def get_inference_settings():
+    """Return ANPR_INFERENCE settings merged over the defaults"""
+    config = dict(DEFAULT_INFERENCE_SETTINGS)
+    config.update(getattr(settings, 'ANPR_INFERENCE', {}))
+    return config
+
+
+class InferenceRejected(Exception):
+    """Raised when a request cannot be admitted within the configured limits"""
+    def __init__(self, status, retry_after, message):
+        super().__init__(message)
+        self.status = status
+        self.retry_after = retry_after
+
+
+class InferenceExecutor:
+    """
+    Run CPU-heavy inference jobs on a dedicated thread pool with a bounded
+    number of in-flight requests and a queue-wait deadline
+    """
+    _instance = None
+    _instance_lock = threading.Lock()
+
+    def __new__(cls):
+        with cls._instance_lock:
+            if cls._instance is None:
+                instance = super(InferenceExecutor, cls).__new__(cls)
+                instance._setup(get_inference_settings())
+                cls._instance = instance
+        return cls._instance
+
+    def _setup(self, config):
+        self.workers = max(1, int(config['WORKERS']))
+        self.max_in_flight = max(self.workers, int(config['MAX_IN_FLIGHT']))
+        self.max_queue_wait = float(config['MAX_QUEUE_WAIT'])
+        self.pool = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='anpr-inference')
+        self.lock = threading.Lock()
+        self.in_flight = 0
+        self.avg_service_time = None  # Exponentially weighted moving average, seconds
+        self.rejected = 0
+        self.completed = 0
+
+    def estimated_queue_wait(self, in_flight=None):
+        """Estimate how long a new request would wait for a free worker"""
+        in_flight = self.in_flight if in_flight is None else in_flight
+        if self.avg_service_time is None or in_flight < self.workers:
+            return 0.0
+        ahead = in_flight - self.workers + 1
+        return ahead * self.avg_service_time / self.workers
+
+    def _admit(self):
+        """Reserve an in-flight slot or raise InferenceRejected"""
+        with self.lock:
+            estimated_wait = self.estimated_queue_wait()
+
+            if self.in_flight >= self.max_in_flight:
+                self.rejected += 1
+                raise InferenceRejected(429, self._retry_after(estimated_wait), "Too many requests in flight")
+
+            if estimated_wait > self.max_queue_wait:
+                self.rejected += 1
+                raise InferenceRejected(503, self._retry_after(estimated_wait), "Queue wait deadline would be exceeded")
+
+            self.in_flight += 1
+
+    def _release(self, service_time=None):
+        with self.lock:
+            self.in_flight -= 1
+            if service_time is not None:
+                self.completed += 1
+                if self.avg_service_time is None:
+                    self.avg_service_time = service_time
+                else:
+                    self.avg_service_time = 0.8 * self.avg_service_time + 0.2 * service_time
+
+    def _retry_after(self, estimated_wait):
+        return max(1, math.ceil(estimated_wait or self.avg_service_time or 1.0))
+
+    def _run_job(self, func, args, enqueued_at):
+        """Worker-side wrapper measuring queue wait and service time separately"""
+        started_at = time.monotonic()
+        queue_wait = started_at - enqueued_at
+
+        # Don't spend CPU on a request whose client has already been waiting too long
+        if queue_wait > self.max_queue_wait:
+            raise InferenceRejected(503, self._retry_after(self.estimated_queue_wait()),
+                                    "Queue wait deadline exceeded")
+
+        close_old_connections()
+        try:
+            result = func(*args)
+        finally:
+            close_old_connections()
+        return result, queue_wait, time.monotonic() - started_at
+
+    async def run(self, func, *args):
+        """
+        Run func(*args) on the inference pool
+
+        Returns:
+            Tuple of (result, queue_wait_seconds, service_seconds)
+
+        Raises:
+            InferenceRejected: if the request is over the in-flight limit or
+            would miss the queue-wait deadline
+        """
+        self._admit()
+        service_time = None
+        try:
+            loop = asyncio.get_running_loop()
+            result, queue_wait, service_time = await loop.run_in_executor(
+                self.pool, self._run_job, func, args, time.monotonic()
+            )
+            return result, queue_wait, service_time
+        except InferenceRejected:
+            with self.lock:
+                self.rejected += 1
+            raise
+        finally:
+            self._release(service_time)
+
+    def stats(self):
+        """Return a snapshot of executor load"""
+        with self.lock:
+            return {
+                'workers': self.workers,
+                'max_in_flight': self.max_in_flight,
+                'in_flight': self.in_flight,
+                'avg_service_ms': round(self.avg_service_time * 1000, 1) if self.avg_service_time else None,
+                'estimated_queue_wait_ms': round(self.estimated_queue_wait() * 1000, 1),
+                'completed': self.completed,
+                'rejected': self.rejected,
+            }
@@ -0,0 +1,96 @@
+"""
+Management command to check query plans and latency for detection filter combinations
+"""
+import time
+import statistics
+from datetime import timedelta
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.http import QueryDict
+from django.utils import timezone
+from anpr_detection.benchmarks import seed_detections, clear_benchmark_data
+from anpr_detection.filters import DetectionFilter
+from anpr_detection.models import Detection
+
+
+class Command(BaseCommand):
+    help = 'Show the query plan and first-page latency for every supported detection filter combination'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, default=2000000, help='Detections to seed (default 2,000,000)')
+        parser.add_argument('--no-seed', action='store_true', help='Reuse previously seeded data')
+        parser.add_argument('--repeat', type=int, default=5, help='Timed runs per combination (median is reported)')
+        parser.add_argument('--cleanup', action='store_true', help='Delete benchmark data afterwards')
+
+    def handle(self, *args, **options):
+        if not options['no_seed']:
+            self.stdout.write(f"Seeding {options['rows']} detections...")
+            seed_detections(options['rows'])
+
+        # Refresh planner statistics so plans reflect the seeded data
+        with connection.cursor() as cursor:
+            cursor.execute('ANALYZE')
+
+        sample = Detection.objects.order_by('-timestamp').values('camera_id', 'plate_number').first()
+        if sample is None:
+            self.stdout.write(self.style.ERROR("No detections to benchmark"))
+            return
+
+        now = timezone.now()
+        time_range = {
+            'start_date': (now - timedelta(days=7)).isoformat(),
+            'end_date': now.isoformat(),
+        }
+        combinations = [
+            ('time range', dict(time_range)),
+            ('camera', {'camera': sample['camera_id']}),
+            ('camera + time range', {'camera': sample['camera_id'], **time_range}),
+            ('plate', {'plate_number': sample['plate_number']}),
+            ('plate + time range', {'plate_number': sample['plate_number'], **time_range}),
+            ('blacklist_flag', {'blacklist_flag': 'true'}),
+            ('blacklist_flag + time range', {'blacklist_flag': 'true', **time_range}),
+        ]
+
+        for label, params in combinations:
+            query = QueryDict(mutable=True)
+            query.update(params)
+            filterset = DetectionFilter(query, queryset=Detection.objects.order_by('-timestamp', '-id'))
+            if not filterset.is_valid():
+                self.stdout.write(self.style.ERROR(f"{label}: invalid filters {filterset.errors}"))
+                continue
+
+            page = filterset.qs[:20]
+            plan = page.explain()
+            access = self._access_path(plan)
+
+            timings = []
+            for _ in range(options['repeat']):
+                started = time.perf_counter()
+                list(page.all())
+                timings.append((time.perf_counter() - started) * 1000)
+
+            style = self.style.ERROR if access == 'TABLE SCAN' else self.style.SUCCESS
+            self.stdout.write(style(f"{label:<28} {access:<11} {statistics.median(timings):8.2f} ms"))
+            for line in plan.splitlines():
+                self.stdout.write(f"    {line}")
+
+        if options['cleanup']:
+            clear_benchmark_data()
+            self.stdout.write("Benchmark data removed")
+
+    def _access_path(self, plan):
+        """Classify how the plan reads the detection table"""
+        if connection.vendor == 'postgresql':
+            if 'Seq Scan on anpr_detection_detection' in plan:
+                return 'TABLE SCAN'
+            return 'INDEX SCAN' if 'Index' in plan else 'OTHER'
+
+        # SQLite: SEARCH seeks into an index; SCAN ... USING INDEX walks a whole
+        # index, which is only cheap for small (partial) indexes
+        if 'SEARCH' in plan and 'INDEX' in plan:
+            return 'INDEX SEEK'
+        if 'USING INDEX detection_blacklisted_ts_idx' in plan:
+            return 'PARTIAL IDX'
+        if 'USING' in plan and 'INDEX' in plan:
+            return 'INDEX SCAN'
+        return 'TABLE SCAN'
@@ -0,0 +1,85 @@
+"""
+Management command to benchmark detection list pagination at increasing depth
+"""
+import time
+import statistics
+from urllib.parse import parse_qs, urlparse
+from django.core.management.base import BaseCommand
+from rest_framework.pagination import PageNumberPagination, Cursor
+from rest_framework.request import Request
+from rest_framework.test import APIRequestFactory
+from anpr_detection.benchmarks import seed_detections, clear_benchmark_data
+from anpr_detection.models import Detection
+from anpr_detection.pagination import TimestampCursorPagination
+
+
+class Command(BaseCommand):
+    help = 'Compare OFFSET/COUNT page-number pagination with keyset cursor pagination on seeded detections'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, default=1000000, help='Detections to seed (default 1,000,000)')
+        parser.add_argument('--no-seed', action='store_true', help='Reuse previously seeded data')
+        parser.add_argument('--repeat', type=int, default=5, help='Timed runs per measurement (median is reported)')
+        parser.add_argument('--cleanup', action='store_true', help='Delete benchmark data afterwards')
+
+    def handle(self, *args, **options):
+        if not options['no_seed']:
+            self.stdout.write(f"Seeding {options['rows']} detections...")
+            seed_detections(options['rows'])
+
+        factory = APIRequestFactory()
+        queryset = Detection.objects.all().order_by('-timestamp', '-id')
+        total = queryset.count()
+        page_size = TimestampCursorPagination.page_size
+
+        depths = [0]
+        depth = 1000
+        while depth < total:
+            depths.append(depth)
+            depth *= 10
+
+        self.stdout.write(f"{total} detections, page size {page_size}")
+        self.stdout.write(f"{'Depth':>10} {'Offset+count (ms)':>20} {'Cursor (ms)':>14} {'Cursor+estimate (ms)':>22}")
+
+        for depth in depths:
+            # Page-number pagination, as with the old global PageNumberPagination
+            page_number = depth // page_size + 1
+            offset_ms = self._time(options['repeat'], lambda: self._paginate(
+                PageNumberPagination(), queryset, factory.get('/', {'page': page_number}), page_size))
+
+            # Keyset pagination: build the cursor the client would hold at this depth
+            cursor_params = self._cursor_params(queryset.values_list('timestamp', 'id')[depth])
+            cursor_ms = self._time(options['repeat'], lambda: self._paginate(
+                TimestampCursorPagination(), queryset, factory.get('/', cursor_params), page_size))
+            estimate_ms = self._time(options['repeat'], lambda: self._paginate(
+                TimestampCursorPagination(), queryset, factory.get('/', {**cursor_params, 'count': 'estimated'}),
+                page_size, response=True))
+
+            self.stdout.write(f"{depth:>10} {offset_ms:>20.2f} {cursor_ms:>14.2f} {estimate_ms:>22.2f}")
+
+        if options['cleanup']:
+            clear_benchmark_data()
+            self.stdout.write("Benchmark data removed")
+
+    def _cursor_params(self, key):
+        paginator = TimestampCursorPagination()
+        paginator.base_url = '/'
+        url = paginator.encode_cursor(Cursor(offset=0, reverse=False, position=paginator.cursor_position(key)))
+        return {'cursor': parse_qs(urlparse(url).query)['cursor'][0]}
+
+    def _paginate(self, paginator, queryset, wsgi_request, page_size, response=False):
+        if isinstance(paginator, PageNumberPagination):
+            paginator.page_size = page_size
+        request = Request(wsgi_request)
+        page = paginator.paginate_queryset(queryset, request)
+        list(page)
+        if response:
+            paginator.get_paginated_response([])
+
+    def _time(self, repeat, func):
+        timings = []
+        for _ in range(repeat):
+            started = time.perf_counter()
+            func()
+            timings.append((time.perf_counter() - started) * 1000)
+        return statistics.median(timings)
@@ -0,0 +1,106 @@
+"""
+Management command to benchmark plate detector backends on replayed frames
+"""
+import time
+import statistics
+from django.core.management.base import BaseCommand, CommandError
+from anpr_detection.backends import BackendUnavailable, get_detector_settings, load_backend
+from anpr_detection.benchmarks import synthetic_frames, replay_frames, match_boxes
+from anpr_detection.tiling import InferenceProfile, detect_frame
+
+
+class Command(BaseCommand):
+    help = 'Replay frames through detector backends and report throughput and accuracy'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--backend', action='append', dest='backends', metavar='NAME[:MODEL]',
+                            help='Backend to benchmark, optionally with a model path; repeat to compare '
+                                 '(default: the configured backend)')
+        parser.add_argument('--images', help='Directory of frames to replay')
+        parser.add_argument('--video', help='Video file to replay')
+        parser.add_argument('--labels', help='JSON ground truth: {frame name: [[x, y, w, h], ...]}')
+        parser.add_argument('--frames', type=int, default=200, help='Frames to replay (default 200)')
+        parser.add_argument('--warmup', type=int, default=5, help='Untimed frames per backend first')
+        parser.add_argument('--iou', type=float, default=0.5, help='IoU for a detection to count as a match')
+        parser.add_argument('--input-size', type=int, help='Override INPUT_SIZE (as Camera.inference_size)')
+        parser.add_argument('--tile-size', type=int, help='Tile frames larger than this (as Camera.tile_size)')
+        parser.add_argument('--tile-overlap', type=float, default=0.2, help='Tile overlap fraction (default 0.2)')
+        parser.add_argument('--no-full-frame', action='store_true', help='Do not infer the whole frame alongside tiles')
+        parser.add_argument('--max-batch', type=int, help='Override MAX_BATCH')
+        parser.add_argument('--intra-op-threads', type=int, help='Override INTRA_OP_THREADS (onnxruntime)')
+        parser.add_argument('--inter-op-threads', type=int, help='Override INTER_OP_THREADS (onnxruntime)')
+
+    def handle(self, *args, **options):
+        if options['images'] or options['video']:
+            frames = replay_frames(options['images'], options['video'], options['labels'], options['frames'])
+            source = options['images'] or options['video']
+        else:
+            # Synthetic frames carry their own ground truth
+            frames = list(synthetic_frames(options['frames']))
+            source = 'synthetic frames'
+        if not frames:
+            raise CommandError("No frames to replay")
+        self.stdout.write(f"Replaying {len(frames)} frames from {source}")
+
+        specs = options['backends'] or [get_detector_settings()['BACKEND']]
+        if options['tile_size']:
+            self.stdout.write(f"Tiling frames into {options['tile_size']} px tiles "
+                              f"with {options['tile_overlap']:.0%} overlap")
+        self.stdout.write(
+            f"{'Backend':<12} {'Model':<28} {'FPS':>8} {'Mean ms':>8} {'p95 ms':>8} "
+            f"{'Precision':>9} {'Recall':>7} {'F1':>6}"
+        )
+        for spec in specs:
+            name, _, model = spec.partition(':')
+            config = get_detector_settings(
+                BACKEND=name,
+                MODEL=model or None,
+                INPUT_SIZE=options['input_size'],
+                MAX_BATCH=options['max_batch'],
+                INTRA_OP_THREADS=options['intra_op_threads'],
+                INTER_OP_THREADS=options['inter_op_threads'],
+            )
+            try:
+                backend = load_backend(config)
+            except BackendUnavailable as e:
+                self.stdout.write(self.style.WARNING(f"{spec}: unavailable ({str(e)})"))
+                continue
+            self._report(backend, frames, options)
+
+    def _report(self, backend, frames, options):
+        profile = InferenceProfile(options['input_size'], options['tile_size'], options['tile_overlap'])
+
+        def detect(image):
+            return detect_frame(backend, image, profile, backend.nms_threshold,
+                                full_frame=not options['no_full_frame'], supports_tiling=backend.supports_tiling)
+
+        for _, image, _ in frames[:options['warmup']]:
+            detect(image)
+
+        timings = []
+        tp = fp = fn = 0
+        labelled = False
+        for _, image, truth in frames:
+            started = time.perf_counter()
+            detections = detect(image)
+            timings.append(time.perf_counter() - started)
+            if truth is not None:
+                labelled = True
+                hits, false_hits, misses = match_boxes([d[:4] for d in detections], truth, options['iou'])
+                tp, fp, fn = tp + hits, fp + false_hits, fn + misses
+
+        total = sum(timings)
+        p95 = statistics.quantiles(timings, n=20)[-1] if len(timings) >= 2 else timings[0]
+        info = backend.info()
+        line = (
+            f"{backend.name:<12} {(info['model'] or '-')[:28]:<28} {len(timings) / total:>8.1f} "
+            f"{total / len(timings) * 1000:>8.2f} {p95 * 1000:>8.2f}"
+        )
+        if labelled:
+            precision = tp / (tp + fp) if tp + fp else 0.0
+            recall = tp / (tp + fn) if tp + fn else 0.0
+            f1 = 2 * precision * recall / (precision + recall) if precision + recall else 0.0
+            line += f" {precision:>9.3f} {recall:>7.3f} {f1:>6.3f}"
+        else:
+            line += f" {'-':>9} {'-':>7} {'-':>6}"
+        self.stdout.write(line)
@@ -0,0 +1,53 @@
+"""
+Management command to archive and delete detections past their retention window
+"""
+import logging
+from django.core.management.base import BaseCommand
+from anpr_detection.retention import prune_detections
+
+logger = logging.getLogger('anpr_detection')
+
+class Command(BaseCommand):
+    help = ('Archive and delete detections older than their camera\'s retention window, '
+            'along with their snapshot files. Intended to run from cron or a scheduler, e.g. nightly.')
+    
+    def add_arguments(self, parser):
+        parser.add_argument('--dry-run', action='store_true', help='Only report what would be removed')
+        parser.add_argument('--camera', type=int, action='append', dest='cameras',
+                            help='Only prune this camera ID (repeatable)')
+        parser.add_argument('--batch-size', type=int, help="Rows deleted per transaction (default ANPR_RETENTION['BATCH_SIZE'])")
+        parser.add_argument('--no-archive', action='store_true', help='Delete without writing archive files')
+        
+    def handle(self, *args, **options):
+        dry_run = options['dry_run']
+        
+        def progress(camera, deleted):
+            self.stdout.write(f"  {camera.name}: {deleted} deleted")
+            
+        result = prune_detections(
+            camera_ids=options['cameras'],
+            dry_run=dry_run,
+            archive=False if options['no_archive'] else None,
+            batch_size=options['batch_size'],
+            progress=None if dry_run else progress,
+        )
+        
+        verb = 'Would remove' if dry_run else 'Removed'
+        for camera in result['cameras']:
+            if camera['detections']:
+                self.stdout.write(
+                    f"{camera['camera_name']}: {verb.lower()} {camera['detections']} detections "
+                    f"older than {camera['retention_days']} days ({camera['cutoff']:%Y-%m-%d %H:%M})"
+                )
+                
+        self.stdout.write(
+            f"{verb} {result['snapshots']} snapshot files "
+            f"({result['orphan_snapshots']} orphaned), {result['bytes_freed'] / (1024 * 1024):.1f} MB"
+        )
+        if result['manifest']:
+            self.stdout.write(f"Archive manifest: {result['manifest']}")
+            
+        summary = f"{verb} {result['detections']} detections in {result['elapsed_seconds']:.1f}s"
+        if result['rows_per_second']:
+            summary += f" ({result['rows_per_second']:.0f} rows/s)"
+        self.stdout.write(self.style.SUCCESS(summary))
@@ -0,0 +1,39 @@
+"""
+Management command to produce an int8 copy of an ONNX plate detector
+"""
+import os
+from django.core.management.base import BaseCommand, CommandError
+from anpr_detection.backends import BackendUnavailable, quantize_onnx_model, resolve_model_paths, get_detector_settings
+from anpr_detection.benchmarks import synthetic_frames, replay_frames
+
+
+class Command(BaseCommand):
+    help = 'Statically quantize an ONNX detector to int8 (QDQ) for the onnxruntime backend'
+
+    def add_arguments(self, parser):
+        parser.add_argument('model', help='fp32 ONNX model (relative paths resolve against ml_models)')
+        parser.add_argument('--output', help='Output path (default: <model>.int8.onnx)')
+        parser.add_argument('--images', help='Directory of representative frames for calibration')
+        parser.add_argument('--video', help='Video file of representative frames for calibration')
+        parser.add_argument('--frames', type=int, default=200, help='Calibration frames (default 200)')
+        parser.add_argument('--per-tensor', action='store_true', help='Per-tensor instead of per-channel weights')
+
+    def handle(self, *args, **options):
+        model_path, _ = resolve_model_paths(get_detector_settings(BACKEND='onnxruntime', MODEL=options['model']))
+        if not os.path.exists(model_path):
+            raise CommandError(f"Model not found: {model_path}")
+        output = options['output'] or f"{os.path.splitext(model_path)[0]}.int8.onnx"
+
+        if options['images'] or options['video']:
+            images = [image for _, image, _ in replay_frames(options['images'], options['video'], limit=options['frames'])]
+        else:
+            self.stdout.write(self.style.WARNING(
+                "No calibration frames given; synthetic frames give a poorer int8 model than real footage"))
+            images = (image for _, image, _ in synthetic_frames(options['frames']))
+
+        try:
+            count = quantize_onnx_model(model_path, output, images, per_channel=not options['per_tensor'])
+        except BackendUnavailable as e:
+            raise CommandError(str(e))
+        self.stdout.write(self.style.SUCCESS(f"Wrote {output} (calibrated on {count} frames)"))
+        self.stdout.write(f"Use it with ANPR_DETECTOR_BACKEND=onnxruntime ANPR_DETECTOR_MODEL={output}")
@@ -0,0 +1,37 @@
+"""
+Management command to backfill or compact hourly detection rollups
+"""
+import time
+import logging
+from datetime import timedelta
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+from anpr_detection.rollups import rebuild_rollups
+
+logger = logging.getLogger('anpr_detection')
+
+class Command(BaseCommand):
+    help = 'Rebuild hourly detection rollups from the raw Detection table'
+    
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--hours',
+            type=int,
+            help='Only rebuild the last N hours (e.g. as a periodic compaction job); default rebuilds everything'
+        )
+        
+    def handle(self, *args, **options):
+        hours = options.get('hours')
+        start = end = None
+        if hours:
+            end = timezone.now()
+            start = end - timedelta(hours=hours)
+            self.stdout.write(f"Rebuilding rollups for the last {hours} hours")
+        else:
+            self.stdout.write("Rebuilding rollups for all detections")
+            
+        started = time.perf_counter()
+        written = rebuild_rollups(start, end)
+        elapsed = time.perf_counter() - started
+        
+        self.stdout.write(self.style.SUCCESS(f"Wrote {written} rollup rows in {elapsed:.1f}s"))
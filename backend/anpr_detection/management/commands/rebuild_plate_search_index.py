@@ -0,0 +1,25 @@
+"""
+Management command to rebuild the partial plate search index
+"""
+import time
+import logging
+from django.core.management.base import BaseCommand
+from anpr_detection.plate_search import rebuild_search_index, uses_native_index
+
+logger = logging.getLogger('anpr_detection')
+
+class Command(BaseCommand):
+    help = 'Rebuild the trigram plate search index from detection and blacklist plates'
+    
+    def handle(self, *args, **options):
+        if uses_native_index():
+            rebuild_search_index()
+            self.stdout.write(self.style.SUCCESS("pg_trgm plate search indexes are in place"))
+            return
+            
+        self.stdout.write("Rebuilding plate search index")
+        started = time.perf_counter()
+        indexed = rebuild_search_index()
+        elapsed = time.perf_counter() - started
+        
+        self.stdout.write(self.style.SUCCESS(f"Indexed {indexed} distinct plates in {elapsed:.1f}s"))
@@ -0,0 +1,96 @@
+"""
+Per-camera pipeline counters and stage timings
+
+Stages record what they did (frames gated, OCR calls skipped, cache hits,
+...) and how long they took, keyed by camera. Counters live in process
+memory and are served by the pipeline stats endpoint; they reset on
+restart.
+"""
+import time
+import threading
+from collections import Counter, defaultdict
+from contextlib import contextmanager
+
+UNASSIGNED = 'unassigned'
+
+
+class PipelineMetrics:
+    """
+    Thread-safe registry of per-camera counters and stage timers
+    """
+    _instance = None
+    _instance_lock = threading.Lock()
+
+    def __new__(cls):
+        with cls._instance_lock:
+            if cls._instance is None:
+                instance = super(PipelineMetrics, cls).__new__(cls)
+                instance.lock = threading.Lock()
+                instance.counters = defaultdict(Counter)
+                # camera -> stage -> [calls, total seconds]
+                instance.timers = defaultdict(lambda: defaultdict(lambda: [0, 0.0]))
+                instance.started = time.time()
+                cls._instance = instance
+        return cls._instance
+
+    @staticmethod
+    def _key(camera_id):
+        return camera_id if camera_id is not None else UNASSIGNED
+
+    def increment(self, camera_id, name, amount=1):
+        """Add to a camera's counter and return its new value"""
+        with self.lock:
+            counters = self.counters[self._key(camera_id)]
+            counters[name] += amount
+            return counters[name]
+
+    def observe(self, camera_id, stage, seconds):
+        with self.lock:
+            timer = self.timers[self._key(camera_id)][stage]
+            timer[0] += 1
+            timer[1] += seconds
+
+    @contextmanager
+    def timed(self, camera_id, stage):
+        """Time the enclosed block as one call of `stage`"""
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(camera_id, stage, time.perf_counter() - started)
+
+    def stage(self, camera_id, stage):
+        """Tuple of (calls, total seconds) for one camera's stage"""
+        with self.lock:
+            calls, total = self.timers.get(self._key(camera_id), {}).get(stage, (0, 0.0))
+            return calls, total
+
+    def snapshot(self):
+        """
+        Copy of all counters and timings
+
+        Returns:
+            Dictionary of camera -> {'counters': {...}, 'stages': {stage: {calls, total_ms, mean_ms}}}
+        """
+        with self.lock:
+            cameras = set(self.counters) | set(self.timers)
+            return {
+                str(camera): {
+                    'counters': dict(self.counters.get(camera, {})),
+                    'stages': {
+                        stage: {
+                            'calls': calls,
+                            'total_ms': round(total * 1000, 3),
+                            'mean_ms': round(total * 1000 / calls, 3) if calls else None,
+                        }
+                        for stage, (calls, total) in self.timers.get(camera, {}).items()
+                    },
+                }
+                for camera in cameras
+            }
+
+    def reset(self):
+        with self.lock:
+            self.counters.clear()
+            self.timers.clear()
+            self.started = time.time()
@@ -1,13 +1,18 @@
-from django.db import models
+from django.db import models, transaction
 import os
 import logging
+import threading
 import uuid
+from contextlib import contextmanager
 from django.utils import timezone
 from anpr_cameras.models import Camera
 from anpr_alerts.models import Blacklist
 
 logger = logging.getLogger(__name__)
 
+# Detections saved inside detection_batch(), per thread
+_batch = threading.local()
+
 def get_image_path(instance, filename):
     """Generate path for detection images"""
     ext = filename.split('.')[-1]
@@ -34,46 +39,168 @@ class Detection(models.Model):
     def __str__(self):
         return f"{self.plate_number} at {self.timestamp.strftime('%Y-%m-%d %H:%M:%S')}"
     
-    def save(self, *args, **kwargs):
+    def save(self, *args, blacklist_checked=False, **kwargs):
+        """
+        Save the detection, flag blacklisted plates and raise their alert
+        
+        Args:
+            blacklist_checked: blacklist_flag was set by a caller that already
+                checked the blacklist (the detection pipeline), so the
+                blacklist is only read again to raise an alert
+        """
+        is_new = self._state.adding
+        update_fields = kwargs.get('update_fields')
+        
         # Check if plate is in blacklist
-        try:
-            # This could be optimized with caching in a real system
-            blacklisted = Blacklist.objects.filter(
-                plate_number=self.plate_number, 
-                is_active=True
-            ).exists()
-            
-            if blacklisted and not self.blacklist_flag:
-                self.blacklist_flag = True
-                logger.warning(f"Blacklisted plate detected: {self.plate_number}")
-        except Exception as e:
-            # Don't let blacklist check failure prevent saving the detection
-            logger.error(f"Error checking blacklist for {self.plate_number}: {str(e)}")
+        blacklist_entry = None
+        if update_fields is None and not blacklist_checked:
+            try:
+                blacklist_entry = Blacklist.objects.filter(
+                    plate_number=self.plate_number, 
+                    is_active=True
+                ).first()
+                
+                if blacklist_entry and not self.blacklist_flag:
+                    self.blacklist_flag = True
+                    logger.warning(f"Blacklisted plate detected: {self.plate_number}")
+            except Exception as e:
+                # Don't let blacklist check failure prevent saving the detection
+                logger.error(f"Error checking blacklist for {self.plate_number}: {str(e)}")
+        
+        # The alert is raised below; mark the detection processed in the same write
+        raise_alert = self.blacklist_flag and not self.processed
+        if raise_alert:
+            self.processed = True
+            if update_fields is not None:
+                kwargs['update_fields'] = set(update_fields) | {'processed'}
         
         # Save the detection
         super().save(*args, **kwargs)
         
+        # Keep the hourly dashboard rollups and plate search index current
+        if is_new:
+            pending = getattr(_batch, 'detections', None)
+            if pending is not None:
+                pending.append(self)
+            else:
+                _index_detections([self])
+            
+            # Push to live subscribers once the row is visible to other connections
+            from .events import publish_detection
+            transaction.on_commit(lambda: publish_detection(self))
+        
         # If blacklisted, create an alert (but avoid circular import)
-        if self.blacklist_flag and not self.processed:
+        if raise_alert:
             try:
                 # We import here to avoid circular import issues
-                from anpr_alerts.models import Alert, Blacklist
+                from anpr_alerts.models import Alert
                 
-                blacklist_entry = Blacklist.objects.get(plate_number=self.plate_number)
+                if blacklist_entry is None:
+                    blacklist_entry = Blacklist.objects.get(plate_number=self.plate_number)
                 Alert.objects.create(
                     detection=self,
                     blacklist_entry=blacklist_entry
                 )
-                self.processed = True
-                self.save(update_fields=['processed'])
                 
             except Exception as e:
                 logger.error(f"Failed to create alert for blacklisted plate {self.plate_number}: {str(e)}")
+                # Leave the detection unprocessed so the alert can be raised again
+                self.processed = False
+                Detection.objects.filter(pk=self.pk).update(processed=False)
     
     class Meta:
         ordering = ['-timestamp']
+        # One index per supported DetectionFilter combination, each ending in
+        # the list ordering so filtered pages are read straight off the index
+        indexes = [
+            models.Index(fields=['-timestamp', '-id']),
+            models.Index(fields=['camera', '-timestamp', '-id']),
+            models.Index(fields=['plate_number', '-timestamp', '-id']),
+            # Blacklisted rows are rare, so a small partial index beats a
+            # low-selectivity boolean prefix the planner would ignore
+            models.Index(fields=['-timestamp', '-id'], condition=models.Q(blacklist_flag=True),
+                         name='detection_blacklisted_ts_idx'),
+        ]
+
+
+def _index_detections(detections):
+    """Add new detections to the hourly rollups and the plate search index"""
+    try:
+        from .rollups import record_detections
+        record_detections(detections)
+    except Exception as e:
+        logger.error(f"Failed to update rollups for {len(detections)} detections: {str(e)}")
+    try:
+        from .plate_search import index_plates
+        index_plates([detection.plate_number for detection in detections])
+    except Exception as e:
+        logger.error(f"Failed to index {len(detections)} detections for search: {str(e)}")
+
+
+@contextmanager
+def detection_batch():
+    """
+    Group the rollup and search index writes of the Detections saved in the
+    block (by this thread) into one write per camera and hour, and one index
+    update, when the block ends
+    """
+    if getattr(_batch, 'detections', None) is not None:
+        # Nested: the outer batch writes
+        yield
+        return
+    _batch.detections = []
+    try:
+        yield
+    finally:
+        detections, _batch.detections = _batch.detections, None
+        if detections:
+            _index_detections(detections)
+
+
+class DetectionRollup(models.Model):
+    """Hourly per-camera detection statistics, maintained incrementally on ingest"""
+    camera = models.ForeignKey(Camera, on_delete=models.CASCADE, related_name='rollups')
+    hour = models.DateTimeField()  # Start of the hour
+    total_detections = models.PositiveIntegerField(default=0)
+    unique_plates = models.PositiveIntegerField(default=0)
+    blacklist_hits = models.PositiveIntegerField(default=0)
+    confidence_sum = models.FloatField(default=0.0)
+    updated_at = models.DateTimeField(auto_now=True)
+    
+    def __str__(self):
+        return f"{self.camera_id} @ {self.hour.strftime('%Y-%m-%d %H:00')}: {self.total_detections}"
+    
+    @property
+    def average_confidence(self):
+        return self.confidence_sum / self.total_detections if self.total_detections else 0.0
+    
+    class Meta:
+        ordering = ['-hour']
+        constraints = [
+            models.UniqueConstraint(fields=['camera', 'hour'], name='unique_rollup_camera_hour'),
+        ]
+        indexes = [
+            models.Index(fields=['hour']),
+        ]
+
+
+class PlateTrigram(models.Model):
+    """
+    Trigram side index over distinct plate numbers (detections and blacklist)
+    
+    Used for partial plate search on databases without pg_trgm; on
+    PostgreSQL a GIN trigram index on the plate columns is used instead.
+    """
+    gram = models.CharField(max_length=3)
+    plate_number = models.CharField(max_length=20)
+    
+    def __str__(self):
+        return f"{self.gram} -> {self.plate_number}"
+    
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['gram', 'plate_number'], name='unique_plate_trigram'),
+        ]
         indexes = [
             models.Index(fields=['plate_number']),
-            models.Index(fields=['timestamp']),
-            models.Index(fields=['blacklist_flag']),
         ]
@@ -0,0 +1,175 @@
+"""
+Perceptual-hash cache of OCR results
+
+A parked car, or a queue at a barrier, shows the same plate in frame after
+frame; each crop differs by a pixel of jitter and sensor noise but OCRs to
+the same text. Crops are keyed by a DCT perceptual hash (pHash) of the
+normalised grey crop, and a crop whose hash lies within MAX_DISTANCE bits
+of a recent entry from the same camera reuses that entry's text and
+confidence instead of running Tesseract.
+
+Entries expire after TTL seconds so a new car in the same spot is read
+afresh, and each camera keeps at most MAX_ENTRIES (least recently used are
+evicted first). Hits and misses are counted per camera in PipelineMetrics.
+Detectors without a camera (one-off uploads) do not use the cache.
+"""
+import time
+import logging
+import threading
+from collections import OrderedDict
+import cv2
+import numpy as np
+from django.conf import settings
+from .metrics import PipelineMetrics
+from .ocr import ocr_ms_per_crop
+
+# Configure logger
+logger = logging.getLogger('anpr_detection')
+
+DEFAULT_OCR_CACHE_SETTINGS = {
+    'ENABLED': True,
+    'TTL': 10.0,            # Seconds an entry stays valid
+    'MAX_ENTRIES': 64,      # Per camera
+    'MAX_DISTANCE': 48,     # Hamming distance (of 255 hash bits) that still counts as the same crop
+}
+# On benchmark_detector's synthetic plates, a one-pixel shift plus sensor
+# noise moves a hash by 20-60 bits and distinct plates are 69 or more apart;
+# a false hit reports the wrong plate, so the default errs towards misses
+
+# Crops are normalised to 128x32 and the lowest 32x8 DCT coefficients,
+# less the DC term, give a 255-bit hash
+HASH_SIZE = (128, 32)
+HASH_BLOCK = (32, 8)
+# Borders of a crop shift the most with box jitter
+HASH_TRIM = 0.1
+
+
+def get_ocr_cache_settings():
+    """Return ANPR_OCR_CACHE settings merged over the defaults"""
+    config = dict(DEFAULT_OCR_CACHE_SETTINGS)
+    config.update(getattr(settings, 'ANPR_OCR_CACHE', {}))
+    return config
+
+
+def perceptual_hash(crop):
+    """
+    DCT perceptual hash of a plate crop
+
+    Args:
+        crop: BGR or greyscale crop
+
+    Returns:
+        Hash as an int (255 bits)
+    """
+    gray = crop if crop.ndim == 2 else cv2.cvtColor(crop, cv2.COLOR_BGR2GRAY)
+    height, width = gray.shape
+    trim_y, trim_x = int(height * HASH_TRIM), int(width * HASH_TRIM)
+    if height - 2 * trim_y > 0 and width - 2 * trim_x > 0:
+        gray = gray[trim_y:height - trim_y, trim_x:width - trim_x]
+    normalised = cv2.resize(gray, HASH_SIZE, interpolation=cv2.INTER_AREA).astype(np.float32)
+    block_w, block_h = HASH_BLOCK
+    coefficients = cv2.dct(normalised)[:block_h, :block_w].ravel()[1:]
+    bits = coefficients > np.median(coefficients)
+    return int.from_bytes(np.packbits(bits).tobytes(), 'big')
+
+
+def hamming(a, b):
+    """Number of differing bits between two hashes"""
+    return bin(a ^ b).count('1')
+
+
+class OCRResultCache:
+    """
+    Process-wide, per-camera LRU of OCR results keyed by perceptual hash
+    """
+    _instance = None
+    _instance_lock = threading.Lock()
+
+    def __new__(cls):
+        with cls._instance_lock:
+            if cls._instance is None:
+                instance = super(OCRResultCache, cls).__new__(cls)
+                instance.lock = threading.Lock()
+                instance.config = get_ocr_cache_settings()
+                # camera -> OrderedDict of hash -> (text, confidence, expires)
+                instance.entries = {}
+                instance.metrics = PipelineMetrics()
+                cls._instance = instance
+        return cls._instance
+
+    @property
+    def enabled(self):
+        return self.config['ENABLED']
+
+    def _camera_entries(self, camera_id, now):
+        entries = self.entries.setdefault(camera_id, OrderedDict())
+        # Hits reorder entries but do not extend their lifetime, so expiry
+        # order is not LRU order; a camera holds few entries, so scan them all
+        for key in [key for key, (_, _, expires) in entries.items() if expires <= now]:
+            del entries[key]
+        return entries
+
+    def lookup(self, camera_id, image_hash):
+        """
+        Cached (text, confidence) for a crop hash, or None
+
+        An exact hash is found directly; otherwise the nearest entry within
+        MAX_DISTANCE bits is used.
+        """
+        now = time.monotonic()
+        with self.lock:
+            entries = self._camera_entries(camera_id, now)
+            key = image_hash if image_hash in entries else None
+            if key is None:
+                best = self.config['MAX_DISTANCE'] + 1
+                for candidate in entries:
+                    distance = hamming(candidate, image_hash)
+                    if distance < best:
+                        key, best = candidate, distance
+            if key is None:
+                result = None
+            else:
+                entries.move_to_end(key)
+                result = entries[key][:2]
+
+        self.metrics.increment(camera_id, 'ocr_cache_misses' if result is None else 'ocr_cache_hits')
+        return result
+
+    def store(self, camera_id, image_hash, text, confidence):
+        """Remember an OCR result, evicting the least recently used entry when full"""
+        now = time.monotonic()
+        with self.lock:
+            entries = self._camera_entries(camera_id, now)
+            entries[image_hash] = (text, confidence, now + self.config['TTL'])
+            entries.move_to_end(image_hash)
+            while len(entries) > self.config['MAX_ENTRIES']:
+                entries.popitem(last=False)
+
+    def clear(self, config=None):
+        """Drop all entries, optionally replacing the settings"""
+        with self.lock:
+            self.entries.clear()
+            self.config = config or get_ocr_cache_settings()
+
+
+def ocr_cache_summary(camera_stats):
+    """
+    Derived OCR cache figures for one camera's PipelineMetrics snapshot
+
+    Returns:
+        Dictionary with hits, misses, hit ratio and the estimated OCR time
+        saved, or None if the cache has not been consulted
+    """
+    counters = camera_stats['counters']
+    hits = counters.get('ocr_cache_hits', 0)
+    misses = counters.get('ocr_cache_misses', 0)
+    if not hits + misses:
+        return None
+
+    ocr_ms = ocr_ms_per_crop(camera_stats)
+    return {
+        'hits': hits,
+        'misses': misses,
+        'hit_ratio': round(hits / (hits + misses), 4),
+        'estimated_ocr_saved_ms': round(hits * ocr_ms, 1) if ocr_ms is not None else None,
+    }
@@ -0,0 +1,159 @@
+"""
+Pagination classes for large, append-mostly ANPR tables
+"""
+import json
+import logging
+from collections import OrderedDict
+from datetime import datetime
+from django.core.exceptions import FieldDoesNotExist, ValidationError
+from django.db import connections
+from django.db.models import Q
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import CursorPagination, Cursor
+from rest_framework.response import Response
+
+# Configure logger
+logger = logging.getLogger('anpr_detection')
+
+# Upper bound on rows counted when no planner estimate is available
+ESTIMATE_COUNT_CAP = 10000
+
+
+def estimate_count(queryset, cap=ESTIMATE_COUNT_CAP):
+    """
+    Estimate the number of rows a queryset returns without a full COUNT(*)
+
+    On PostgreSQL the planner's row estimate is read from EXPLAIN. Elsewhere
+    the count is capped at `cap` rows, so its cost is bounded.
+
+    Returns:
+        Tuple of (count, is_lower_bound)
+    """
+    connection = connections[queryset.db]
+    if connection.vendor == 'postgresql':
+        try:
+            sql, params = queryset.order_by().query.sql_with_params()
+            with connection.cursor() as cursor:
+                cursor.execute(f"EXPLAIN (FORMAT JSON) {sql}", params)
+                plan = cursor.fetchone()[0]
+            if isinstance(plan, str):
+                plan = json.loads(plan)
+            return int(plan[0]['Plan']['Plan Rows']), False
+        except Exception as e:
+            logger.warning(f"Falling back to capped count, planner estimate failed: {str(e)}")
+
+    count = queryset.order_by()[:cap].count()
+    return count, count >= cap
+
+
+class TimestampCursorPagination(CursorPagination):
+    """
+    Keyset pagination on (timestamp, id), newest first
+
+    The cursor holds the (timestamp, id) of the row a page ended on, and the
+    next page is the rows strictly past that pair, fetched with an indexed
+    range scan instead of OFFSET; rows sharing a timestamp are split by id
+    rather than skipped over. No COUNT(*) is run, so latency stays flat
+    whatever the table size or page depth. An ordering chosen through the
+    view's OrderingFilter pages on (that field, id) the same way; the field
+    must not be null. Pass ``count=estimated`` to include an estimated total.
+    """
+    ordering = ('-timestamp', '-id')
+    page_size = 20
+    page_size_query_param = 'page_size'
+    max_page_size = 200
+    count_query_param = 'count'
+    # Separates the field values of a cursor position
+    position_separator = '|'
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.count_mode = request.query_params.get(self.count_query_param)
+        self.base_queryset = queryset
+        self.page_size = self.get_page_size(request)
+        if not self.page_size:
+            return None
+
+        self.request = request
+        self.base_url = request.build_absolute_uri()
+        self.ordering = self.get_ordering(request, queryset, view)
+        field = self.ordering[0].lstrip('-')
+        pk_name = queryset.model._meta.pk.name
+        if field == 'pk':
+            field = pk_name
+        # The primary key breaks ties, in the same direction as the field
+        self.key_fields = (field,) if field == pk_name else (field, pk_name)
+        self.cursor = self.decode_cursor(request)
+
+        reverse = self.cursor is not None and self.cursor.reverse
+        position = self.decode_position(queryset.model, self.cursor.position) if self.cursor else None
+        # Towards smaller values: forwards on a descending ordering, or backwards on an ascending one
+        descending = self.ordering[0].startswith('-') != reverse
+        prefix = '-' if descending else ''
+        queryset = queryset.order_by(*(prefix + name for name in self.key_fields))
+        if position is not None:
+            queryset = queryset.filter(self._past(position, 'lt' if descending else 'gt'))
+
+        results = list(queryset[:self.page_size + 1])
+        has_more = len(results) > self.page_size
+        self.page = results[:self.page_size]
+        if reverse:
+            self.page.reverse()
+            self.has_next, self.has_previous = position is not None, has_more
+        else:
+            self.has_next, self.has_previous = has_more, position is not None
+        return self.page
+
+    def _past(self, position, lookup):
+        """Rows whose key tuple lies past `position`: (a, b) < (x, y) is a < x or (a = x and b < y)"""
+        condition = Q(**{f'{self.key_fields[-1]}__{lookup}': position[-1]})
+        for name, value in zip(reversed(self.key_fields[:-1]), reversed(position[:-1])):
+            condition = Q(**{f'{name}__{lookup}': value}) | (Q(**{name: value}) & condition)
+        return condition
+
+    def cursor_position(self, values):
+        """Cursor position string for a row's key field values"""
+        return self.position_separator.join(
+            value.isoformat() if isinstance(value, datetime) else str(value) for value in values
+        )
+
+    def decode_position(self, model, position):
+        """Key field values of a cursor position, NotFound if it does not parse"""
+        parts = position.split(self.position_separator) if position else []
+        if len(parts) != len(self.key_fields):
+            raise NotFound(self.invalid_cursor_message)
+        try:
+            return tuple(model._meta.get_field(name).to_python(part) for name, part in zip(self.key_fields, parts))
+        except (ValidationError, ValueError, FieldDoesNotExist):
+            raise NotFound(self.invalid_cursor_message)
+
+    def _link(self, instance, reverse):
+        position = self.cursor_position(getattr(instance, name) for name in self.key_fields)
+        return self.encode_cursor(Cursor(offset=0, reverse=reverse, position=position))
+
+    def get_next_link(self):
+        if not (self.has_next and self.page):
+            return None
+        return self._link(self.page[-1], reverse=False)
+
+    def get_previous_link(self):
+        if not (self.has_previous and self.page):
+            return None
+        return self._link(self.page[0], reverse=True)
+
+    def get_paginated_response(self, data):
+        payload = OrderedDict([
+            ('next', self.get_next_link()),
+            ('previous', self.get_previous_link()),
+        ])
+        if self.count_mode == 'estimated':
+            count, is_lower_bound = estimate_count(self.base_queryset)
+            payload['count'] = count
+            payload['count_is_estimate'] = True
+            payload['count_is_lower_bound'] = is_lower_bound
+        payload['results'] = data
+        return Response(payload)
+
+    def get_paginated_response_schema(self, schema):
+        response_schema = super().get_paginated_response_schema(schema)
+        response_schema['properties']['count'] = {'type': 'integer', 'nullable': True}
+        return response_schema
@@ -0,0 +1,504 @@
+"""
+Frame processing as a graph of stages
+
+A frame passes through up to eight stages, each reading and writing
+attributes of a FrameContext:
+
+    source -> roi -> detect -> quality -> ocr -> match -> persist
+                                                      \\-> annotate
+
+Every stage declares what it requires and provides. A run names the
+outputs its caller consumes (detections, saved Detection rows, an
+annotated frame) and only the stages on the path to them run: the stream
+loop never copies or draws a frame, previews never write to the database,
+and a frame is copied for drawing only when a viewer or API response asks
+for the annotated image.
+
+Cameras configure their stages: Camera.roi restricts detection to part of
+the frame (a view, not a copy) and Camera.skip_stages turns optional
+stages off, in which case the stage passes its input through unchanged.
+Each stage that runs is timed in PipelineMetrics as pipeline.<stage>.
+"""
+import logging
+import cv2
+from django.conf import settings
+from .metrics import PipelineMetrics
+from .models import detection_batch
+
+# Configure logger
+logger = logging.getLogger('anpr_detection')
+
+DEFAULT_PIPELINE_SETTINGS = {
+    'SKIP': [],     # Optional stages skipped by cameras without skip_stages
+}
+
+# Stages a camera may skip; the rest are needed to read a plate at all
+OPTIONAL_STAGES = ('roi', 'quality', 'match', 'persist', 'annotate')
+
+# Outputs a run can ask for
+OUTPUTS = ('detections', 'saved', 'annotated')
+
+STAGE_TIMER_PREFIX = 'pipeline.'
+
+
+def get_pipeline_settings():
+    """Return ANPR_PIPELINE settings merged over the defaults"""
+    config = dict(DEFAULT_PIPELINE_SETTINGS)
+    config.update(getattr(settings, 'ANPR_PIPELINE', {}))
+    return config
+
+
+def parse_stages(value):
+    """Stage names from a comma-separated string such as Camera.skip_stages"""
+    return [stage.strip().lower() for stage in (value or '').split(',') if stage.strip()]
+
+
+def parse_roi(value):
+    """
+    Region of interest from a string such as Camera.roi
+
+    Args:
+        value: "x,y,w,h" as fractions of the frame width and height, or empty
+
+    Returns:
+        Tuple of (x, y, w, h), or None for the whole frame
+
+    Raises:
+        ValueError: If the value is not four fractions describing a region
+            inside the frame
+    """
+    if not value or not value.strip():
+        return None
+    parts = [float(part) for part in value.split(',')]
+    if len(parts) != 4:
+        raise ValueError("Expected four values: x,y,w,h")
+    x, y, w, h = parts
+    if not (0 <= x < 1 and 0 <= y < 1 and w > 0 and h > 0 and x + w <= 1 and y + h <= 1):
+        raise ValueError("x,y,w,h must be fractions describing a region inside the frame")
+    return x, y, w, h
+
+
+class FrameContext:
+    """
+    One frame's state as it passes through the stages
+    """
+    def __init__(self, frame, camera_id=None, consensus=True, outputs=('detections',)):
+        self.frame = frame
+        self.camera_id = camera_id
+        self.consensus = consensus
+        self.outputs = frozenset(outputs)
+        # Part of the frame detection runs on, and its origin in the frame
+        self.image = frame
+        self.offset = (0, 0)
+        # (x, y, w, h, confidence) in frame coordinates
+        self.boxes = []
+        # (box, crop) pairs worth reading
+        self.plates = []
+        # Every plate read or voted on in this frame, whether or not it is reported
+        self.reads = []
+        self.detections = []
+        self.saved = []
+        self.annotated = None
+
+
+class Stage:
+    """
+    One step of the frame pipeline
+
+    Subclasses name the FrameContext attributes they require and provide,
+    and implement run. Optional stages also implement bypass, which
+    provides the same attributes without doing the work.
+    """
+    name = None
+    requires = ()
+    provides = ()
+
+    def __init__(self, detector):
+        self.detector = detector
+
+    def run(self, context):
+        raise NotImplementedError
+
+    def bypass(self, context):
+        raise NotImplementedError(f"The {self.name} stage cannot be skipped")
+
+
+class SourceStage(Stage):
+    """Frame as BGR; greyscale and BGRA input is converted, BGR is used as is"""
+    name = 'source'
+    provides = ('frame',)
+
+    def run(self, context):
+        frame = context.frame
+        if frame.ndim == 2:
+            context.frame = cv2.cvtColor(frame, cv2.COLOR_GRAY2BGR)
+        elif frame.shape[2] == 4:
+            context.frame = cv2.cvtColor(frame, cv2.COLOR_BGRA2BGR)
+        context.image = context.frame
+
+
+class ROIStage(Stage):
+    """Restrict detection to the camera's region of interest"""
+    name = 'roi'
+    requires = ('frame',)
+    provides = ('image',)
+
+    def __init__(self, detector, roi=None):
+        super().__init__(detector)
+        self.roi = roi
+
+    def run(self, context):
+        if self.roi is None:
+            return self.bypass(context)
+        height, width = context.frame.shape[:2]
+        x, y, w, h = self.roi
+        left, top = int(x * width), int(y * height)
+        right, bottom = int(round((x + w) * width)), int(round((y + h) * height))
+        context.image = context.frame[top:bottom, left:right]
+        context.offset = (left, top)
+
+    def bypass(self, context):
+        context.image = context.frame
+        context.offset = (0, 0)
+
+
+class DetectStage(Stage):
+    """Plate boxes from the detector backend, in frame coordinates"""
+    name = 'detect'
+    requires = ('image',)
+    provides = ('boxes',)
+
+    def run(self, context):
+        left, top = context.offset
+        context.boxes = [
+            (x + left, y + top, w, h, confidence)
+            for x, y, w, h, confidence in self.detector.detect_plates(context.image)
+        ]
+
+
+class QualityStage(Stage):
+    """Crop each box and drop crops too blurred, small or flat to read"""
+    name = 'quality'
+    requires = ('boxes',)
+    provides = ('plates',)
+
+    def run(self, context):
+        self._crop(context, self.detector.quality.prepare)
+
+    def bypass(self, context):
+        self._crop(context, None)
+
+    @staticmethod
+    def _crop(context, prepare):
+        frame = context.frame
+        plates = []
+        for box in context.boxes:
+            x, y, w, h, _ = box
+            crop = frame[max(0, y):min(y+h, frame.shape[0]), max(0, x):min(x+w, frame.shape[1])]
+            if crop.size == 0:
+                continue
+            if prepare is not None:
+                crop = prepare(crop)
+                if crop is None:
+                    continue
+            plates.append((box, crop))
+        context.plates = plates
+
+
+class OCRStage(Stage):
+    """
+    Read the plates: cached, batched OCR, plate-format checks and, for
+    tracking detectors, multi-frame consensus
+    """
+    name = 'ocr'
+    requires = ('plates',)
+    provides = ('reads',)
+
+    def run(self, context):
+        detector = self.detector
+        plates = context.plates
+
+        # Plates on tracks whose consensus has settled need no more OCR while
+        # their crop still looks the same
+        tracker = detector.consensus if context.consensus else None
+        tracks = tracker.match([box[:4] for box, _ in plates]) if tracker else [None] * len(plates)
+        pending = [
+            index for index, track in enumerate(tracks)
+            if track is None or not track.stable or tracker.changed(track, plates[index][1])
+        ]
+
+        # Recognize the remaining plates of the frame together, except those
+        # this camera read recently
+        recognized = dict(zip(pending, detector._recognize_cached([plates[index][1] for index in pending])))
+
+        reads = []
+        matched_ids = {track.id for track in tracks if track is not None}
+        for index, ((x, y, w, h, confidence), crop) in enumerate(plates):
+            track = tracks[index]
+            emit = True
+            if index in recognized:
+                plate_number, ocr_confidence = recognized[index]
+
+                # Skip if no text recognized
+                if not plate_number:
+                    continue
+
+                # Drop (or downgrade) reads that fit none of the camera's plate
+                # formats, correcting commonly confused characters first
+                plate_number, ocr_confidence, format_valid = detector.plate_format.apply(plate_number, ocr_confidence)
+                if not plate_number:
+                    continue
+
+                # Calculate final confidence
+                final_confidence = confidence * ocr_confidence
+
+                # Vote with earlier reads of the same plate; a track reports once
+                if tracker:
+                    # A settled track's crop changed: the same plate keeps it,
+                    # another plate starts a new track
+                    if track is not None and track.stable and not tracker.recheck(track, (x, y, w, h),
+                                                                                  plate_number, crop):
+                        track = None
+                    if track is not None and track.stable:
+                        emit = False
+                    else:
+                        track, emit = tracker.observe((x, y, w, h), plate_number, final_confidence,
+                                                      context.frame, track, matched_ids, crop=crop)
+                        matched_ids.add(track.id)
+            else:
+                # Settled track: its consensus stands in for a new read
+                tracker.touch(track, (x, y, w, h))
+                emit = False
+
+            if track is not None:
+                plate_number, final_confidence, format_valid = track.text, track.confidence, track.valid
+
+            reads.append(self._read(plate_number, final_confidence, (x, y, w, h), format_valid, track, emit))
+
+        # Tracks that left the view before settling report their best consensus
+        if tracker:
+            for track in tracker.expire():
+                reads.append(self._read(track.text, track.confidence, track.best_box, track.valid, track,
+                                        emit=True, visible=False))
+        context.reads = reads
+
+    @staticmethod
+    def _read(plate_number, confidence, box, format_valid, track, emit, visible=True):
+        return {
+            'plate_number': plate_number,
+            'confidence': confidence,
+            'box': box,
+            'format_valid': format_valid,
+            'track': track,
+            'emit': emit,
+            'visible': visible,
+        }
+
+
+class MatchStage(Stage):
+    """Check reads against the blacklist and build the detections to report"""
+    name = 'match'
+    requires = ('reads',)
+    provides = ('detections',)
+
+    def run(self, context):
+        self._detections(context, self.detector._check_blacklist)
+
+    def bypass(self, context):
+        self._detections(context, None)
+
+    @staticmethod
+    def _detections(context, check_blacklist):
+        detections = []
+        # Reads that are not reported only need the flag to be drawn
+        annotating = 'annotated' in context.outputs
+        for read in context.reads:
+            if check_blacklist and (read['emit'] or annotating):
+                read['is_blacklisted'] = MatchStage._blacklisted(read, check_blacklist)
+            else:
+                # None: not checked (Detection.save checks it before saving)
+                read['is_blacklisted'] = None
+            if not read['emit']:
+                continue
+            detection = {
+                'plate_number': read['plate_number'],
+                'confidence': read['confidence'],
+                'box': read['box'],
+                'is_blacklisted': read['is_blacklisted'],
+                'camera_id': context.camera_id,
+                'format_valid': read['format_valid']
+            }
+            track = read['track']
+            if track is not None:
+                detection.update(consensus=track.info(), snapshot=track.snapshot)
+            detections.append(detection)
+        context.detections = detections
+
+    @staticmethod
+    def _blacklisted(read, check_blacklist):
+        """Blacklist flag for a read, checked once per track and consensus text"""
+        plate_number, track = read['plate_number'], read['track']
+        if track is None:
+            return check_blacklist(plate_number)
+        # Reported reads are always checked, so a detection sees the current blacklist
+        if read['emit'] or track.blacklist_text != plate_number:
+            track.is_blacklisted = check_blacklist(plate_number)
+            track.blacklist_text = plate_number
+        return track.is_blacklisted
+
+
+class PersistStage(Stage):
+    """Save the detections as Detection rows"""
+    name = 'persist'
+    requires = ('detections',)
+    provides = ('saved',)
+
+    def run(self, context):
+        # One rollup and search index write for all of the frame's detections
+        with detection_batch():
+            saved = [self.detector.save_detection(detection, context.frame) for detection in context.detections]
+        context.saved = [detection for detection in saved if detection is not None]
+
+    def bypass(self, context):
+        context.saved = []
+
+
+class AnnotateStage(Stage):
+    """Draw the plates read in this frame on a copy of it"""
+    name = 'annotate'
+    requires = ('detections',)
+    provides = ('annotated',)
+
+    def run(self, context):
+        annotated = context.frame.copy()
+        for read in context.reads:
+            if not read['visible']:
+                continue
+            x, y, w, h = read['box']
+
+            # Draw bounding box
+            color = (0, 0, 255) if read['is_blacklisted'] else (0, 255, 0)
+            cv2.rectangle(annotated, (x, y), (x+w, y+h), color, 2)
+
+            # Draw text
+            text = f"{read['plate_number']} ({read['confidence']:.2f})"
+            cv2.putText(annotated, text, (x, y-10), cv2.FONT_HERSHEY_SIMPLEX, 0.5, color, 2)
+        context.annotated = annotated
+
+    def bypass(self, context):
+        context.annotated = context.frame
+
+
+class Pipeline:
+    """
+    A detector's stages, planned per set of outputs and run per frame
+
+    Args:
+        detector: ANPRDetector whose models, gates and tracker the stages use
+        roi: Region of interest from parse_roi, or None for the whole frame
+        skip: Names of optional stages to pass through
+    """
+    def __init__(self, detector, roi=None, skip=None):
+        self.detector = detector
+        self.metrics = PipelineMetrics()
+        self.stages = [
+            SourceStage(detector),
+            ROIStage(detector, roi),
+            DetectStage(detector),
+            QualityStage(detector),
+            OCRStage(detector),
+            MatchStage(detector),
+            PersistStage(detector),
+            AnnotateStage(detector),
+        ]
+        unknown = [stage for stage in skip or () if stage not in OPTIONAL_STAGES]
+        if unknown:
+            logger.warning(f"Ignoring pipeline stages that cannot be skipped: {', '.join(unknown)}")
+        self.skip = frozenset(stage for stage in skip or () if stage in OPTIONAL_STAGES)
+        self._plans = {}
+
+    @classmethod
+    def for_camera(cls, detector, camera):
+        """Pipeline using a camera's roi and skip_stages (None uses ANPR_PIPELINE['SKIP'])"""
+        config = get_pipeline_settings()
+        if camera is None:
+            return cls(detector, skip=config['SKIP'])
+
+        try:
+            roi = parse_roi(camera.roi)
+        except ValueError as e:
+            logger.warning(f"Ignoring region of interest of camera {camera.id}: {str(e)}")
+            roi = None
+        skip = parse_stages(camera.skip_stages) if camera.skip_stages else config['SKIP']
+        return cls(detector, roi, skip)
+
+    def plan(self, outputs):
+        """
+        Stages needed for a set of outputs, in running order
+
+        Walks the stages backwards from the outputs, keeping a stage only
+        when a later one (or the caller) consumes what it provides.
+
+        Args:
+            outputs: Names from OUTPUTS
+
+        Returns:
+            List of stages
+        """
+        key = frozenset(outputs)
+        plan = self._plans.get(key)
+        if plan is None:
+            unknown = key.difference(OUTPUTS)
+            if unknown:
+                raise ValueError(f"Unknown pipeline outputs: {', '.join(sorted(unknown))}")
+            needed = set(key)
+            plan = []
+            for stage in reversed(self.stages):
+                if needed.intersection(stage.provides):
+                    plan.append(stage)
+                    needed.update(stage.requires)
+            plan.reverse()
+            self._plans[key] = plan
+        return plan
+
+    def run(self, frame, camera_id=None, outputs=('detections',), consensus=True):
+        """
+        Process one frame
+
+        Args:
+            frame: Input BGR frame; it is not modified
+            camera_id: Camera ID for the detections
+            outputs: What the caller consumes: detections, saved (Detection
+                rows, for a camera) and/or annotated (a drawn copy of the frame)
+            consensus: If False, bypass multi-frame voting even when the
+                detector tracks plates (e.g. for preview frames)
+
+        Returns:
+            FrameContext holding the requested outputs
+        """
+        context = FrameContext(frame, camera_id, consensus, outputs)
+        timer_camera = self.detector.camera_id
+        for stage in self.plan(outputs):
+            if stage.name in self.skip:
+                stage.bypass(context)
+                continue
+            with self.metrics.timed(timer_camera, f"{STAGE_TIMER_PREFIX}{stage.name}"):
+                stage.run(context)
+        return context
+
+
+def pipeline_summary(camera_stats):
+    """
+    Per-stage timings for one camera's PipelineMetrics snapshot
+
+    Returns:
+        Dictionary of stage -> {calls, mean_ms} in running order, or None if
+        no frame has been through the pipeline
+    """
+    stages = camera_stats['stages']
+    summary = {}
+    for stage in (SourceStage, ROIStage, DetectStage, QualityStage, OCRStage, MatchStage, PersistStage, AnnotateStage):
+        timing = stages.get(f"{STAGE_TIMER_PREFIX}{stage.name}")
+        if timing:
+            summary[stage.name] = {'calls': timing['calls'], 'mean_ms': timing['mean_ms']}
+    return summary or None
@@ -0,0 +1,253 @@
+"""
+Plate format grammars
+
+OCR output is checked against the plate formats of the camera's regions
+before it is blacklist-checked, written to disk or saved as a Detection.
+Fragments of one to three characters and impossible sequences are junk
+reads, not plates.
+
+A region is a list of formats. A format is either a template of one symbol
+per character position (L letter, D digit, A either, anything else
+literal) or a regular expression starting with ``^``. Templates also drive
+confusion correction: OCR regularly reads O for 0, B for 8, S for 5 and so
+on, so a read that fails a template only because of such characters at
+digit or letter positions is corrected to fit it, up to MAX_CORRECTIONS
+substitutions.
+
+Reads that fit no format are dropped, or with ACTION 'downgrade' kept at
+a reduced confidence. Every outcome is counted per camera and rule in
+PipelineMetrics.
+"""
+import re
+import logging
+from functools import lru_cache
+from django.conf import settings
+from anpr_alerts.blacklist_io import normalize_plate
+from .metrics import PipelineMetrics
+
+# Configure logger
+logger = logging.getLogger('anpr_detection')
+
+DEFAULT_PLATE_FORMAT_SETTINGS = {
+    'ACTION': 'drop',           # drop, downgrade or off
+    'REGIONS': ['GENERIC'],     # Used by cameras without plate_regions
+    'MAX_CORRECTIONS': 2,       # Confusion substitutions allowed per read
+    'DOWNGRADE_FACTOR': 0.5,    # Confidence multiplier for downgraded reads
+    'GRAMMARS': {},             # Extra or overriding regions: {name: [format, ...]}
+}
+
+PLATE_FORMAT_ACTIONS = ('drop', 'downgrade', 'off')
+
+PLATE_GRAMMARS = {
+    # Any 4-10 letters and digits with at least one of each
+    'GENERIC': [r'^(?=.*[A-Z])(?=.*[0-9])[A-Z0-9]{4,10}$'],
+    # Current, prefix and suffix styles
+    'GB': ['LLDDLLL', 'LDDDLLL', 'LDDLLL', 'LLLDDDL', 'LLLDDL'],
+    'FR': ['LLDDDLL'],
+    'IT': ['LLDDDLL'],
+    'ES': ['DDDDLLL'],
+    'NL': ['LLDDDL', 'DDLLLD', 'LDDDLL', 'LLDDLL', 'DDLLDD'],
+    'PL': ['LLDDDDD', 'LLLDDDD', 'LLDDDLL', 'LLLDDLL'],
+    'IN': ['LLDDLLDDDD', 'LLDDLDDDD'],
+    'US-CA': ['DLLLDDD'],
+    'US-NY': ['LLLDDDD'],
+    'US-TX': ['LLLDDDD'],
+}
+
+# Characters OCR reads for a digit, and for a letter
+TO_DIGIT = {'O': '0', 'Q': '0', 'D': '0', 'I': '1', 'Z': '2', 'A': '4', 'S': '5', 'G': '6', 'T': '7', 'B': '8'}
+TO_LETTER = {'0': 'O', '1': 'I', '2': 'Z', '4': 'A', '5': 'S', '6': 'G', '7': 'T', '8': 'B'}
+
+TEMPLATE_CLASSES = {'L': '[A-Z]', 'D': '[0-9]', 'A': '[A-Z0-9]'}
+
+FORMAT_VALID = 'valid'
+FORMAT_CORRECTED = 'corrected'
+FORMAT_INVALID = 'invalid'
+
+
+def get_plate_format_settings():
+    """Return ANPR_PLATE_FORMAT settings merged over the defaults"""
+    config = dict(DEFAULT_PLATE_FORMAT_SETTINGS)
+    config.update(getattr(settings, 'ANPR_PLATE_FORMAT', {}))
+    return config
+
+
+def available_regions(config=None):
+    """Names of all known regions, built in and configured"""
+    config = config or get_plate_format_settings()
+    return sorted(set(PLATE_GRAMMARS) | set(config['GRAMMARS']))
+
+
+def parse_regions(value):
+    """Region names from a comma-separated string such as Camera.plate_regions"""
+    return [region.strip().upper() for region in (value or '').split(',') if region.strip()]
+
+
+def _compile_format(spec):
+    """(compiled regex, template or None) for one format"""
+    if spec.startswith('^'):
+        return re.compile(spec), None
+    pattern = ''.join(TEMPLATE_CLASSES.get(symbol, re.escape(symbol)) for symbol in spec)
+    return re.compile(f'^{pattern}$'), spec
+
+
+@lru_cache(maxsize=64)
+def _compile_regions(regions, grammars):
+    formats = []
+    for region in regions:
+        for spec in dict(grammars).get(region, PLATE_GRAMMARS.get(region, ())):
+            formats.append((region, *_compile_format(spec)))
+    return tuple(formats)
+
+
+def correct_to_template(plate, template, max_corrections):
+    """
+    Substitute commonly confused characters so a read fits a template
+
+    Returns:
+        Tuple of (corrected plate, substitutions), or (None, None) when it
+        cannot fit within max_corrections
+    """
+    if len(plate) != len(template):
+        return None, None
+    corrected = []
+    substitutions = 0
+    for char, symbol in zip(plate, template):
+        if symbol == 'D' and not char.isdigit():
+            char, substitutions = TO_DIGIT.get(char), substitutions + 1
+        elif symbol == 'L' and not char.isalpha():
+            char, substitutions = TO_LETTER.get(char), substitutions + 1
+        elif symbol not in TEMPLATE_CLASSES and char != symbol:
+            char = None
+        if char is None or substitutions > max_corrections:
+            return None, None
+        corrected.append(char)
+    return ''.join(corrected), substitutions
+
+
+class PlateGrammar:
+    """
+    Compiled plate formats for a set of regions
+
+    Args:
+        regions: Region names (defaults to ANPR_PLATE_FORMAT['REGIONS'])
+        config: ANPR_PLATE_FORMAT settings
+    """
+    def __init__(self, regions=None, config=None):
+        self.config = config or get_plate_format_settings()
+        unknown = [region for region in regions or () if region not in available_regions(self.config)]
+        if unknown:
+            logger.warning(f"Unknown plate regions {', '.join(unknown)}, using {self.config['REGIONS']}")
+            regions = None
+        self.regions = tuple(regions or self.config['REGIONS'])
+        grammars = tuple((name, tuple(specs)) for name, specs in self.config['GRAMMARS'].items())
+        self.formats = _compile_regions(self.regions, grammars)
+
+    def check(self, text):
+        """
+        Validate, and if needed correct, an OCR read
+
+        Args:
+            text: Raw OCR text
+
+        Returns:
+            Tuple of (plate, status, rule): plate is the normalized or
+            corrected read (None when it cannot be normalized), status is
+            valid, corrected or invalid, and rule names the region that
+            matched or why none did (length or grammar)
+        """
+        plate = normalize_plate(text)
+        if plate is None:
+            return None, FORMAT_INVALID, 'length'
+
+        for region, pattern, _ in self.formats:
+            if pattern.match(plate):
+                return plate, FORMAT_VALID, region
+
+        best = None
+        for region, _, template in self.formats:
+            if template is None:
+                continue
+            corrected, substitutions = correct_to_template(plate, template, self.config['MAX_CORRECTIONS'])
+            if corrected is not None and (best is None or substitutions < best[1]):
+                best = (corrected, substitutions, region)
+        if best is not None:
+            return best[0], FORMAT_CORRECTED, best[2]
+        return plate, FORMAT_INVALID, 'grammar'
+
+    def is_valid(self, plate):
+        """Whether a plate fits one of the formats as it stands"""
+        return any(pattern.match(plate) for _, pattern, _ in self.formats)
+
+
+class PlateFormatStage:
+    """
+    Apply a camera's plate grammar to OCR reads and count the outcomes
+    """
+    def __init__(self, regions=None, config=None, camera_id=None):
+        self.config = config or get_plate_format_settings()
+        self.action = self.config['ACTION']
+        self.grammar = PlateGrammar(regions, self.config)
+        self.camera_id = camera_id
+        self.metrics = PipelineMetrics()
+
+    @classmethod
+    def for_camera(cls, camera):
+        """Stage using a camera's plate_regions (None uses ANPR_PLATE_FORMAT['REGIONS'])"""
+        if camera is None:
+            return cls()
+        return cls(parse_regions(camera.plate_regions), camera_id=camera.id)
+
+    @property
+    def enabled(self):
+        return self.action in ('drop', 'downgrade')
+
+    def apply(self, text, confidence):
+        """
+        Check one read
+
+        Returns:
+            Tuple of (plate, confidence, valid); plate is None when the read
+            is dropped
+        """
+        if not self.enabled:
+            return text, confidence, True
+
+        plate, status, rule = self.grammar.check(text)
+        camera_id = self.camera_id
+        if status == FORMAT_VALID:
+            self.metrics.increment(camera_id, f"format_matched_{rule}")
+            return plate, confidence, True
+        if status == FORMAT_CORRECTED:
+            self.metrics.increment(camera_id, f"format_corrected_{rule}")
+            return plate, confidence, True
+
+        self.metrics.increment(camera_id, f"format_rejected_{rule}")
+        if self.action == 'drop' or plate is None:
+            self.metrics.increment(camera_id, 'format_dropped')
+            return None, confidence, False
+        self.metrics.increment(camera_id, 'format_downgraded')
+        return plate, confidence * self.config['DOWNGRADE_FACTOR'], False
+
+
+def plate_format_summary(camera_stats):
+    """
+    Derived plate-format figures for one camera's PipelineMetrics snapshot
+
+    Returns:
+        Dictionary of counts per rule for matched, corrected and rejected
+        reads, plus reads dropped and downgraded, or None if the stage has
+        not run
+    """
+    counters = camera_stats['counters']
+    summary = {'matched': {}, 'corrected': {}, 'rejected': {}}
+    for name, count in counters.items():
+        for outcome in summary:
+            prefix = f"format_{outcome}_"
+            if name.startswith(prefix):
+                summary[outcome][name[len(prefix):]] = count
+    if not any(summary.values()):
+        return None
+    summary['dropped'] = counters.get('format_dropped', 0)
+    summary['downgraded'] = counters.get('format_downgraded', 0)
+    return summary
@@ -0,0 +1,271 @@
+"""
+Partial, prefix, suffix and wildcard plate number search
+
+Patterns use ``*`` (any run of characters) and ``?`` (one character), e.g.
+``MH12*``, ``*4521`` or ``MH*45?1``; a pattern without wildcards matches
+anywhere in the plate. On PostgreSQL matching runs against pg_trgm GIN
+indexes on the plate columns. On other databases a PlateTrigram side table
+maps trigrams of every distinct plate to the plate, so candidates are found
+with index lookups and only they are checked against the full pattern.
+"""
+import re
+import logging
+from django.db import connections, router, transaction
+from django.db.models import Count
+from django.db.models.constants import OnConflict
+from rest_framework.exceptions import ValidationError
+from rest_framework.filters import BaseFilterBackend
+from .models import Detection, PlateTrigram
+
+# Configure logger
+logger = logging.getLogger('anpr_detection')
+
+START, END = '^', '$'
+INDEX_BATCH_SIZE = 5000
+
+# Plate columns that get a pg_trgm index on PostgreSQL
+TRIGRAM_INDEXES = [
+    ('detection_plate_trgm_idx', 'anpr_detection_detection', 'plate_number'),
+    ('blacklist_plate_trgm_idx', 'anpr_alerts_blacklist', 'plate_number'),
+]
+
+
+class PlateSearchError(ValueError):
+    """Raised for patterns without any letters or digits"""
+
+
+def normalize_pattern(pattern):
+    """Uppercase a pattern and drop everything except A-Z, 0-9 and wildcards"""
+    pattern = re.sub(r'[^A-Z0-9*?]', '', (pattern or '').upper())
+    return re.sub(r'\*+', '*', pattern)
+
+
+def plate_trigrams(plate_number):
+    """Return the trigrams of a plate padded with start/end markers"""
+    padded = f"{START}{plate_number}{END}"
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+def compile_pattern(pattern):
+    """
+    Compile a search pattern
+
+    Returns:
+        Tuple of (anchored regex string, set of trigrams every match must contain)
+
+    Raises:
+        PlateSearchError: if the pattern has no letters or digits
+    """
+    pattern = normalize_pattern(pattern)
+    if not pattern.strip('*?'):
+        raise PlateSearchError("Search pattern must contain letters or digits")
+
+    if '*' not in pattern and '?' not in pattern:
+        pattern = f"*{pattern}*"
+
+    anchored = ('' if pattern.startswith('*') else START) + pattern + ('' if pattern.endswith('*') else END)
+
+    regex = ''.join(
+        '.*' if char == '*' else '.' if char == '?' else char
+        for char in anchored
+    )
+
+    grams = set()
+    for fragment in re.split(r'[*?]+', anchored):
+        grams.update(fragment[i:i + 3] for i in range(len(fragment) - 2))
+    return regex, grams
+
+
+def uses_native_index(model=Detection):
+    """Whether the database for `model` searches with pg_trgm instead of the side table"""
+    return connections[router.db_for_read(model)].vendor == 'postgresql'
+
+
+def matching_plates(pattern):
+    """
+    Distinct plate numbers in the side index that match a pattern
+
+    Candidates are plates holding every trigram of the pattern. Patterns with
+    no 3-character run (e.g. ``AB``) fall back to checking each distinct
+    plate, which is still far smaller than the detection table.
+
+    Returns:
+        Queryset of {'plate_number': ...} usable as a subquery
+    """
+    regex, grams = compile_pattern(pattern)
+    if not grams:
+        return PlateTrigram.objects.filter(plate_number__regex=regex).values('plate_number').distinct()
+    return PlateTrigram.objects.filter(
+        gram__in=grams,
+        plate_number__regex=regex,
+    ).values('plate_number').annotate(hits=Count('gram')).filter(hits=len(grams)).values('plate_number')
+
+
+def filter_plates(queryset, pattern, field='plate_number'):
+    """
+    Filter a queryset to rows whose plate field matches a search pattern
+
+    Args:
+        queryset: Queryset to filter
+        pattern: Search pattern (see module docstring)
+        field: Lookup path of the plate number field on the queryset's model
+
+    Raises:
+        PlateSearchError: for patterns without letters or digits
+    """
+    regex, _ = compile_pattern(pattern)
+    if uses_native_index(queryset.model):
+        return queryset.filter(**{f"{field}__regex": regex})
+    return queryset.filter(**{f"{field}__in": matching_plates(pattern)})
+
+
+def index_plates(plate_numbers):
+    """
+    Add plates to the trigram side index (no-op on PostgreSQL)
+
+    Call once per batch of new plates; plates already indexed are skipped.
+
+    Returns:
+        Number of plates written
+    """
+    if uses_native_index():
+        return 0
+
+    plates = {plate for plate in plate_numbers if plate}
+    if not plates:
+        return 0
+
+    # Repeat sightings are the common case; one indexed read avoids rewriting their trigrams
+    plates -= set(
+        PlateTrigram.objects.filter(plate_number__in=plates).values_list('plate_number', flat=True).distinct()
+    )
+    if not plates:
+        return 0
+
+    # Plain executemany rather than bulk_create: a 100k-plate import is ~1M
+    # trigram rows, and building model instances for them dominated the run
+    connection = connections[router.db_for_write(PlateTrigram)]
+    ops = connection.ops
+    fields = [PlateTrigram._meta.get_field('gram'), PlateTrigram._meta.get_field('plate_number')]
+    sql = (
+        f"{ops.insert_statement(on_conflict=OnConflict.IGNORE)} "
+        f"{ops.quote_name(PlateTrigram._meta.db_table)} "
+        f"({', '.join(ops.quote_name(field.column) for field in fields)}) VALUES (%s, %s) "
+        f"{ops.on_conflict_suffix_sql(fields, OnConflict.IGNORE, None, None)}"
+    )
+    # Insert in (gram, plate_number) index order for better B-tree locality
+    rows = sorted((gram, plate) for plate in plates for gram in plate_trigrams(plate))
+    with transaction.atomic(using=connection.alias), connection.cursor() as cursor:
+        for start in range(0, len(rows), INDEX_BATCH_SIZE):
+            cursor.executemany(sql, rows[start:start + INDEX_BATCH_SIZE])
+    return len(plates)
+
+
+def unindex_plates(plate_numbers):
+    """
+    Remove plates that no detection or blacklist entry holds any more from
+    the trigram side index (no-op on PostgreSQL)
+
+    Call after deleting the rows that held them, e.g. once per prune batch.
+
+    Returns:
+        Number of plates removed
+    """
+    if uses_native_index():
+        return 0
+
+    from anpr_alerts.models import Blacklist
+
+    plates = {plate for plate in plate_numbers if plate}
+    for model in (Detection, Blacklist):
+        if not plates:
+            return 0
+        plates -= set(model.objects.filter(plate_number__in=plates).values_list('plate_number', flat=True).distinct())
+    if not plates:
+        return 0
+
+    PlateTrigram.objects.filter(plate_number__in=plates).delete()
+    return len(plates)
+
+
+def index_blacklist_batch(sender, plates, **kwargs):
+    """blacklist_changed receiver: index a bulk-imported batch in one write"""
+    try:
+        index_plates(plates)
+    except Exception as e:
+        logger.error(f"Failed to index imported blacklist plates: {str(e)}")
+
+
+def _distinct_plates(queryset, batch_size=INDEX_BATCH_SIZE):
+    """Yield batches of distinct plate numbers, walking the plate_number index"""
+    last = None
+    while True:
+        page = queryset.order_by('plate_number')
+        if last is not None:
+            page = page.filter(plate_number__gt=last)
+        batch = list(page.values_list('plate_number', flat=True).distinct()[:batch_size])
+        if not batch:
+            return
+        yield batch
+        last = batch[-1]
+
+
+def rebuild_search_index():
+    """
+    Rebuild the side index from all detection and blacklist plates
+
+    On PostgreSQL this only makes sure the pg_trgm indexes exist.
+
+    Returns:
+        Number of plates indexed
+    """
+    if uses_native_index():
+        ensure_trigram_indexes()
+        return 0
+
+    from anpr_alerts.models import Blacklist
+
+    PlateTrigram.objects.all().delete()
+
+    indexed = 0
+    for queryset in (Detection.objects.all(), Blacklist.objects.all()):
+        for batch in _distinct_plates(queryset):
+            indexed += index_plates(batch)
+
+    logger.info(f"Rebuilt plate search index with {indexed} plates")
+    return indexed
+
+
+def ensure_trigram_indexes(using='default', **kwargs):
+    """Create the pg_trgm extension and GIN trigram indexes on PostgreSQL"""
+    connection = connections[using]
+    if connection.vendor != 'postgresql':
+        return
+
+    existing = set(connection.introspection.table_names())
+    with connection.cursor() as cursor:
+        cursor.execute("CREATE EXTENSION IF NOT EXISTS pg_trgm")
+        for name, table, column in TRIGRAM_INDEXES:
+            if table in existing:
+                cursor.execute(
+                    f"CREATE INDEX IF NOT EXISTS {name} ON {table} USING gin ({column} gin_trgm_ops)"
+                )
+
+
+class PlateSearchFilter(BaseFilterBackend):
+    """
+    Filter backend for plate search via the ``search`` query parameter
+
+    Views can set ``plate_search_field`` to search a related plate field.
+    """
+    search_param = 'search'
+
+    def filter_queryset(self, request, queryset, view):
+        pattern = request.query_params.get(self.search_param, '').strip()
+        if not pattern:
+            return queryset
+
+        try:
+            return filter_plates(queryset, pattern, getattr(view, 'plate_search_field', 'plate_number'))
+        except PlateSearchError as e:
+            raise ValidationError({self.search_param: str(e)})
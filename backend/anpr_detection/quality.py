@@ -0,0 +1,213 @@
+"""
+Plate crop quality gating ahead of OCR
+
+Motion-blurred, tiny, washed-out or implausibly shaped crops cost a full
+Tesseract call and come back empty or garbled. Each crop is scored on four
+cheap measures, all plain NumPy over the grey crop:
+
+- sharpness: variance of the 4-neighbour Laplacian
+- height: crop height in pixels
+- contrast: RMS contrast (standard deviation of grey levels)
+- aspect: width / height
+
+A crop below BORDERLINE times a threshold is not sent to OCR. A crop
+between that and the threshold is borderline: with ENHANCE it is deskewed
+and upscaled to RESCALE_HEIGHT before OCR, otherwise it goes to OCR as is.
+Skips are counted per camera and reason in PipelineMetrics.
+"""
+import math
+import logging
+import cv2
+import numpy as np
+from django.conf import settings
+from .metrics import PipelineMetrics
+from .ocr import ocr_ms_per_crop
+
+# Configure logger
+logger = logging.getLogger('anpr_detection')
+
+DEFAULT_QUALITY_SETTINGS = {
+    'ENABLED': True,
+    'MIN_SHARPNESS': 80.0,    # Laplacian variance
+    'MIN_HEIGHT': 16,         # Pixels
+    'MIN_CONTRAST': 25.0,     # Grey-level standard deviation
+    'MIN_ASPECT': 1.5,        # Plate width / height
+    'MAX_ASPECT': 8.0,
+    'BORDERLINE': 0.6,        # Fraction of a threshold below which a crop is rejected outright
+    'ENHANCE': True,          # Deskew and rescale borderline crops
+    'RESCALE_HEIGHT': 48,     # Borderline crops shorter than this are upscaled to it
+    'MAX_SKEW': 20.0,         # Degrees; larger estimates are left alone
+}
+
+QUALITY_OK = 'ok'
+QUALITY_BORDERLINE = 'borderline'
+QUALITY_REJECT = 'reject'
+
+
+def get_quality_settings():
+    """Return ANPR_QUALITY settings merged over the defaults"""
+    config = dict(DEFAULT_QUALITY_SETTINGS)
+    config.update(getattr(settings, 'ANPR_QUALITY', {}))
+    return config
+
+
+def _gray(crop):
+    return crop if crop.ndim == 2 else cv2.cvtColor(crop, cv2.COLOR_BGR2GRAY)
+
+
+def crop_scores(crop):
+    """
+    Quality measures for one plate crop
+
+    Args:
+        crop: BGR or greyscale crop
+
+    Returns:
+        Dictionary with sharpness, height, contrast and aspect
+    """
+    gray = _gray(crop).astype(np.float32)
+    height, width = gray.shape
+    if height < 3 or width < 3:
+        sharpness = 0.0
+    else:
+        laplacian = (
+            gray[:-2, 1:-1] + gray[2:, 1:-1] + gray[1:-1, :-2] + gray[1:-1, 2:] - 4.0 * gray[1:-1, 1:-1]
+        )
+        sharpness = float(laplacian.var())
+    return {
+        'sharpness': sharpness,
+        'height': height,
+        'contrast': float(gray.std()),
+        'aspect': width / float(height) if height else 0.0,
+    }
+
+
+def assess_crop(scores, config):
+    """
+    Classify a crop from its scores
+
+    Returns:
+        Tuple of (status, reasons) where status is ok, borderline or reject
+        and reasons lists the measures that fell short
+    """
+    if not config['MIN_ASPECT'] <= scores['aspect'] <= config['MAX_ASPECT']:
+        return QUALITY_REJECT, ['aspect']
+
+    borderline = config['BORDERLINE']
+    status, reasons = QUALITY_OK, []
+    for measure, threshold in (('sharpness', config['MIN_SHARPNESS']),
+                               ('height', config['MIN_HEIGHT']),
+                               ('contrast', config['MIN_CONTRAST'])):
+        value = scores[measure]
+        if value < threshold * borderline:
+            return QUALITY_REJECT, [measure]
+        if value < threshold:
+            status = QUALITY_BORDERLINE
+            reasons.append(measure)
+    return status, reasons
+
+
+def estimate_skew(crop):
+    """
+    Angle of the plate's text line in degrees, from the second-order
+    moments of its dark pixels (positive is clockwise in image coordinates)
+    """
+    gray = _gray(crop)
+    _, mask = cv2.threshold(gray, 0, 255, cv2.THRESH_BINARY_INV + cv2.THRESH_OTSU)
+    moments = cv2.moments(mask, binaryImage=True)
+    if not moments['m00']:
+        return 0.0
+    return math.degrees(0.5 * math.atan2(2 * moments['mu11'], moments['mu20'] - moments['mu02']))
+
+
+def enhance_crop(crop, config):
+    """
+    Deskew and upscale a borderline crop for OCR
+
+    Returns:
+        New BGR/greyscale crop (the input is not modified)
+    """
+    angle = estimate_skew(crop)
+    if 1.0 <= abs(angle) <= config['MAX_SKEW']:
+        height, width = crop.shape[:2]
+        rotation = cv2.getRotationMatrix2D((width / 2.0, height / 2.0), angle, 1.0)
+        crop = cv2.warpAffine(crop, rotation, (width, height), flags=cv2.INTER_LINEAR,
+                              borderMode=cv2.BORDER_REPLICATE)
+
+    height, width = crop.shape[:2]
+    if height < config['RESCALE_HEIGHT']:
+        scale = config['RESCALE_HEIGHT'] / float(height)
+        crop = cv2.resize(crop, (max(1, int(round(width * scale))), config['RESCALE_HEIGHT']),
+                          interpolation=cv2.INTER_CUBIC)
+    return crop
+
+
+class QualityGate:
+    """
+    Decide per crop whether OCR is worth running, and count the decisions
+
+    One gate per ANPRDetector, so counters are kept per camera.
+    """
+    def __init__(self, config=None, camera_id=None):
+        self.config = config or get_quality_settings()
+        self.enabled = self.config['ENABLED']
+        self.camera_id = camera_id
+        self.metrics = PipelineMetrics()
+
+    def prepare(self, crop):
+        """
+        Crop to send to OCR, or None to skip OCR
+
+        Args:
+            crop: BGR plate crop
+
+        Returns:
+            The crop (enhanced when borderline and ENHANCE is on) or None
+        """
+        camera_id = self.camera_id
+        self.metrics.increment(camera_id, 'ocr_crops')
+        if not self.enabled:
+            return crop
+
+        with self.metrics.timed(camera_id, 'quality'):
+            status, reasons = assess_crop(crop_scores(crop), self.config)
+            if status == QUALITY_BORDERLINE and self.config['ENHANCE']:
+                crop = enhance_crop(crop, self.config)
+
+        if status == QUALITY_REJECT:
+            self.metrics.increment(camera_id, 'ocr_skipped_quality')
+            self.metrics.increment(camera_id, f"quality_rejected_{reasons[0]}")
+            return None
+        if status == QUALITY_BORDERLINE:
+            self.metrics.increment(camera_id, 'quality_borderline')
+        return crop
+
+
+def quality_summary(camera_stats):
+    """
+    Derived quality-gate figures for one camera's PipelineMetrics snapshot
+
+    Returns:
+        Dictionary with crops seen, OCR calls skipped (total and by reason)
+        and the estimated OCR time saved, or None if no crops were gated
+    """
+    counters = camera_stats['counters']
+    stages = camera_stats['stages']
+    crops = counters.get('ocr_crops', 0)
+    if not crops:
+        return None
+
+    skipped = counters.get('ocr_skipped_quality', 0)
+    ocr_ms = ocr_ms_per_crop(camera_stats)
+    return {
+        'crops': crops,
+        'ocr_skipped': skipped,
+        'skip_rate': round(skipped / crops, 4),
+        'borderline': counters.get('quality_borderline', 0),
+        'rejected_by': {
+            name[len('quality_rejected_'):]: count
+            for name, count in counters.items() if name.startswith('quality_rejected_')
+        },
+        'mean_quality_ms': stages.get('quality', {}).get('mean_ms'),
+        'estimated_ocr_saved_ms': round(skipped * ocr_ms, 1) if ocr_ms is not None else None,
+    }
@@ -0,0 +1,294 @@
+"""
+Time-based retention for detections and their snapshot files
+
+Detections older than their camera's retention window (or the global
+ANPR_RETENTION['DAYS']) are archived to gzipped CSV files with a JSON
+manifest and then deleted in small batches, each in its own short
+transaction, so ingest is never blocked behind one large DELETE. Hourly
+rollups are kept, so dashboard history outlives the raw rows; plates no
+detection or blacklist entry holds any more leave the plate search index.
+"""
+import os
+import csv
+import json
+import gzip
+import time
+import hashlib
+import logging
+from datetime import timedelta
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Max
+from django.utils import timezone
+from anpr_alerts.models import Alert
+from anpr_cameras.models import Camera
+from .models import Detection
+from .plate_search import unindex_plates
+
+# Configure logger
+logger = logging.getLogger('anpr_detection')
+
+DEFAULT_RETENTION_SETTINGS = {
+    'DAYS': 90,
+    'ARCHIVE': True,
+    'ARCHIVE_DIR': os.path.join(settings.BASE_DIR, 'archive'),
+    'BATCH_SIZE': 5000,
+    'BATCH_PAUSE': 0.0,
+}
+
+ARCHIVE_COLUMNS = ['id', 'plate_number', 'timestamp', 'camera_id', 'camera_name', 'confidence',
+                   'blacklist_flag', 'processed', 'image_path', 'video_path']
+SNAPSHOT_DIRS = ('detections', 'images', 'videos')
+
+
+def get_retention_settings():
+    """Return ANPR_RETENTION settings merged over the defaults"""
+    config = dict(DEFAULT_RETENTION_SETTINGS)
+    config.update(getattr(settings, 'ANPR_RETENTION', {}))
+    return config
+
+
+def retention_days(camera, config=None):
+    """Days of detections kept for a camera (its own setting or the global one)"""
+    config = config or get_retention_settings()
+    return camera.retention_days if camera.retention_days is not None else config['DAYS']
+
+
+def expired_detections(camera, cutoff):
+    """Detections of `camera` older than `cutoff`, oldest first, via the (camera, timestamp) index"""
+    return Detection.objects.filter(camera_id=camera.id, timestamp__lt=cutoff).order_by('timestamp', 'id')
+
+
+class ArchiveWriter:
+    """
+    Gzipped CSV archive for one camera's expired detections
+
+    Rows are written before they are deleted. The file is written as .part
+    and renamed once closed, and its manifest entry records row count,
+    time span, size and SHA-256.
+    """
+    def __init__(self, archive_dir, camera, run_stamp):
+        self.camera = camera
+        self.filename = f"detections_camera{camera.id}_{run_stamp}.csv.gz"
+        self.path = os.path.join(archive_dir, self.filename)
+        self.tmp_path = f"{self.path}.part"
+        self.file = gzip.open(self.tmp_path, 'wt', newline='', encoding='utf-8')
+        self.writer = csv.writer(self.file)
+        self.writer.writerow(ARCHIVE_COLUMNS)
+        self.rows = 0
+        self.first_timestamp = None
+        self.last_timestamp = None
+
+    def write(self, rows):
+        for row in rows:
+            self.writer.writerow([
+                row['id'], row['plate_number'], row['timestamp'].isoformat(), row['camera_id'],
+                self.camera.name, row['confidence'], int(row['blacklist_flag']), int(row['processed']),
+                row['image_path'] or '', row['video_path'] or '',
+            ])
+        if rows:
+            self.rows += len(rows)
+            self.first_timestamp = self.first_timestamp or rows[0]['timestamp']
+            self.last_timestamp = rows[-1]['timestamp']
+        self.file.flush()
+
+    def close(self):
+        """Finish the file and return its manifest entry (None if nothing was written)"""
+        self.file.close()
+        if not self.rows:
+            os.remove(self.tmp_path)
+            return None
+
+        os.replace(self.tmp_path, self.path)
+        digest = hashlib.sha256()
+        with open(self.path, 'rb') as f:
+            for block in iter(lambda: f.read(1024 * 1024), b''):
+                digest.update(block)
+
+        return {
+            'file': self.filename,
+            'camera_id': self.camera.id,
+            'camera_name': self.camera.name,
+            'rows': self.rows,
+            'first_timestamp': self.first_timestamp.isoformat(),
+            'last_timestamp': self.last_timestamp.isoformat(),
+            'bytes': os.path.getsize(self.path),
+            'sha256': digest.hexdigest(),
+        }
+
+
+def _remove_snapshots(paths):
+    """Delete snapshot files under MEDIA_ROOT; returns (files removed, bytes freed)"""
+    media_root = os.path.realpath(settings.MEDIA_ROOT)
+    removed = freed = 0
+    for rel_path in paths:
+        full_path = os.path.realpath(os.path.join(media_root, rel_path))
+        if not full_path.startswith(media_root + os.sep):
+            continue
+        try:
+            size = os.path.getsize(full_path)
+            os.remove(full_path)
+            removed += 1
+            freed += size
+        except FileNotFoundError:
+            pass
+        except OSError as e:
+            logger.warning(f"Could not remove snapshot {rel_path}: {str(e)}")
+    return removed, freed
+
+
+def sweep_orphan_snapshots(older_than, dry_run=False):
+    """
+    Remove snapshot files last modified before `older_than`
+
+    Catches files whose rows were deleted by other means (e.g. a camera
+    being removed). Callers pass the longest retention window of any
+    camera, so any row still referencing such a file would have expired as
+    well.
+
+    Returns:
+        Tuple of (files removed, bytes freed)
+    """
+    cutoff = older_than.timestamp()
+    removed = freed = 0
+    for directory in SNAPSHOT_DIRS:
+        root = os.path.join(settings.MEDIA_ROOT, directory)
+        if not os.path.isdir(root):
+            continue
+        with os.scandir(root) as entries:
+            for entry in entries:
+                if not entry.is_file():
+                    continue
+                stat = entry.stat()
+                if stat.st_mtime >= cutoff:
+                    continue
+                if not dry_run:
+                    try:
+                        os.remove(entry.path)
+                    except OSError as e:
+                        logger.warning(f"Could not remove snapshot {entry.path}: {str(e)}")
+                        continue
+                removed += 1
+                freed += stat.st_size
+    return removed, freed
+
+
+def prune_detections(camera_ids=None, dry_run=False, archive=None, batch_size=None, now=None, progress=None):
+    """
+    Archive and delete expired detections and their snapshot files
+
+    Args:
+        camera_ids: Only prune these cameras (defaults to all)
+        dry_run: Only count what would be removed
+        archive: Write archives before deleting (defaults to ANPR_RETENTION['ARCHIVE'])
+        batch_size: Rows deleted per transaction (defaults to ANPR_RETENTION['BATCH_SIZE'])
+        now: Reference time for the retention windows
+        progress: Optional callable receiving (camera, rows deleted so far) after each batch
+
+    Returns:
+        Dictionary with per-camera results, totals, the manifest path and throughput
+    """
+    config = get_retention_settings()
+    archive = config['ARCHIVE'] if archive is None else archive
+    batch_size = batch_size or config['BATCH_SIZE']
+    now = now or timezone.now()
+    run_stamp = now.strftime('%Y%m%d_%H%M%S')
+
+    cameras = Camera.objects.order_by('id')
+    if camera_ids:
+        cameras = cameras.filter(id__in=camera_ids)
+
+    if archive and not dry_run:
+        os.makedirs(config['ARCHIVE_DIR'], exist_ok=True)
+
+    started = time.perf_counter()
+    results = []
+    manifest_files = []
+    for camera in cameras:
+        days = retention_days(camera, config)
+        cutoff = now - timedelta(days=days)
+        expired = expired_detections(camera, cutoff)
+        result = {'camera_id': camera.id, 'camera_name': camera.name, 'retention_days': days,
+                  'cutoff': cutoff, 'detections': 0, 'snapshots': 0, 'bytes_freed': 0}
+
+        if dry_run:
+            result['detections'] = expired.count()
+            results.append(result)
+            continue
+
+        writer = ArchiveWriter(config['ARCHIVE_DIR'], camera, run_stamp) if archive else None
+        try:
+            while True:
+                rows = list(expired.values(
+                    'id', 'plate_number', 'timestamp', 'camera_id', 'confidence',
+                    'blacklist_flag', 'processed', 'image_path', 'video_path',
+                )[:batch_size])
+                if not rows:
+                    break
+
+                # Archive first, so every deleted row is on disk
+                if writer:
+                    writer.write(rows)
+
+                ids = [row['id'] for row in rows]
+                with transaction.atomic():
+                    # Alerts first, in one DELETE, so the detections' cascade finds none
+                    Alert.objects.filter(detection_id__in=ids).delete()
+                    Detection.objects.filter(pk__in=ids).delete()
+                    # Plates no longer seen anywhere leave the search index
+                    unindex_plates(row['plate_number'] for row in rows)
+
+                # Files go only after the rows are committed
+                removed, freed = _remove_snapshots(
+                    path for row in rows for path in (row['image_path'], row['video_path']) if path
+                )
+                result['detections'] += len(rows)
+                result['snapshots'] += removed
+                result['bytes_freed'] += freed
+                if progress:
+                    progress(camera, result['detections'])
+
+                if len(rows) < batch_size:
+                    break
+                if config['BATCH_PAUSE']:
+                    time.sleep(config['BATCH_PAUSE'])
+        finally:
+            if writer:
+                entry = writer.close()
+                if entry:
+                    manifest_files.append(entry)
+
+        if result['detections']:
+            logger.info(f"Pruned {result['detections']} detections older than {days} days from camera {camera.name}")
+        results.append(result)
+
+    # Sweep files older than the longest window of any camera, not just those
+    # pruned: the snapshot directories are shared
+    longest_camera = Camera.objects.aggregate(longest=Max('retention_days'))['longest']
+    longest = max(config['DAYS'], longest_camera or 0)
+    orphans, orphan_bytes = sweep_orphan_snapshots(now - timedelta(days=longest), dry_run=dry_run)
+
+    manifest_path = None
+    if manifest_files:
+        manifest_path = os.path.join(config['ARCHIVE_DIR'], f"manifest_{run_stamp}.json")
+        with open(manifest_path, 'w') as f:
+            json.dump({
+                'created_at': now.isoformat(),
+                'columns': ARCHIVE_COLUMNS,
+                'format': 'csv.gz',
+                'files': manifest_files,
+            }, f, indent=2)
+
+    elapsed = time.perf_counter() - started
+    deleted = sum(result['detections'] for result in results)
+    return {
+        'dry_run': dry_run,
+        'cameras': results,
+        'detections': deleted,
+        'snapshots': sum(result['snapshots'] for result in results) + orphans,
+        'orphan_snapshots': orphans,
+        'bytes_freed': sum(result['bytes_freed'] for result in results) + orphan_bytes,
+        'manifest': manifest_path,
+        'elapsed_seconds': elapsed,
+        'rows_per_second': deleted / elapsed if elapsed and not dry_run else None,
+    }
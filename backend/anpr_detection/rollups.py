@@ -0,0 +1,196 @@
+"""
+Hourly detection rollups backing the dashboard statistics endpoint
+"""
+import logging
+from collections import defaultdict
+from datetime import timedelta
+from django.db import IntegrityError, transaction
+from django.db.models import Count, F, Q, Sum
+from django.db.models.functions import TruncHour
+from .models import Detection, DetectionRollup
+
+# Configure logger
+logger = logging.getLogger('anpr_detection')
+
+
+def hour_bucket(timestamp):
+    """Truncate a datetime to the start of its hour"""
+    return timestamp.replace(minute=0, second=0, microsecond=0)
+
+
+def record_detection(detection):
+    """
+    Add a newly saved detection to its camera's hourly rollup
+
+    Args:
+        detection: Saved Detection object
+    """
+    record_detections([detection])
+
+
+def record_detections(detections):
+    """
+    Add newly saved detections to their cameras' hourly rollups, with one
+    plate lookup and one rollup write per camera and hour
+
+    Args:
+        detections: Saved Detection objects
+    """
+    groups = defaultdict(list)
+    for detection in detections:
+        groups[(detection.camera_id, hour_bucket(detection.timestamp))].append(detection)
+
+    for (camera_id, hour), group in groups.items():
+        plates = {detection.plate_number for detection in group}
+
+        # Indexed lookup: which of these plates were already counted for this camera and hour?
+        seen_before = set(Detection.objects.filter(
+            camera_id=camera_id,
+            plate_number__in=plates,
+            timestamp__gte=hour,
+            timestamp__lt=hour + timedelta(hours=1),
+        ).exclude(pk__in=[detection.pk for detection in group]).values_list('plate_number', flat=True).distinct())
+
+        increments = {
+            'total_detections': len(group),
+            'unique_plates': len(plates - seen_before),
+            'blacklist_hits': sum(1 for detection in group if detection.blacklist_flag),
+            'confidence_sum': sum(detection.confidence for detection in group),
+        }
+
+        rollup = DetectionRollup.objects.filter(camera_id=camera_id, hour=hour)
+        if rollup.update(**{field: F(field) + value for field, value in increments.items()}):
+            continue
+
+        try:
+            with transaction.atomic():
+                DetectionRollup.objects.create(camera_id=camera_id, hour=hour, **increments)
+        except IntegrityError:
+            # Another writer created the row first
+            rollup.update(**{field: F(field) + value for field, value in increments.items()})
+
+
+def rebuild_rollups(start=None, end=None, step=timedelta(days=1)):
+    """
+    Recompute rollups from the raw Detection table
+
+    Used to backfill existing data and as a periodic compaction job that
+    corrects any drift (e.g. rows inserted with bulk_create, which bypasses
+    Detection.save). Works one `step` window at a time so memory stays
+    bounded on large tables.
+
+    Args:
+        start: Start of the range (defaults to the oldest detection)
+        end: End of the range (defaults to the newest detection)
+        step: Size of each recomputed window
+
+    Returns:
+        Number of rollup rows written
+    """
+    if start is None or end is None:
+        bounds = Detection.objects.order_by('timestamp').values_list('timestamp', flat=True)
+        first, last = bounds.first(), bounds.last()
+        if first is None:
+            return 0
+        start = start or first
+        end = end or last
+
+    window_start = hour_bucket(start)
+    end = hour_bucket(end) + timedelta(hours=1)
+    written = 0
+
+    while window_start < end:
+        window_end = min(window_start + step, end)
+
+        aggregates = Detection.objects.filter(
+            timestamp__gte=window_start,
+            timestamp__lt=window_end,
+        ).annotate(hour=TruncHour('timestamp')).values('camera_id', 'hour').annotate(
+            total=Count('id'),
+            unique=Count('plate_number', distinct=True),
+            hits=Count('id', filter=Q(blacklist_flag=True)),
+            confidence=Sum('confidence'),
+        ).order_by()
+
+        rollups = [
+            DetectionRollup(
+                camera_id=row['camera_id'],
+                hour=row['hour'],
+                total_detections=row['total'],
+                unique_plates=row['unique'],
+                blacklist_hits=row['hits'],
+                confidence_sum=row['confidence'] or 0.0,
+            )
+            for row in aggregates
+        ]
+
+        with transaction.atomic():
+            DetectionRollup.objects.filter(hour__gte=window_start, hour__lt=window_end).delete()
+            DetectionRollup.objects.bulk_create(rollups, batch_size=1000)
+
+        written += len(rollups)
+        window_start = window_end
+
+    logger.info(f"Rebuilt {written} detection rollups from {start} to {end}")
+    return written
+
+
+def dashboard_stats(since, camera_id=None):
+    """
+    Summarize rollups from `since` onwards
+
+    The cost depends only on cameras x hours in the window, never on the
+    size of the Detection table.
+
+    Returns:
+        Dict with totals, per-camera totals and an hourly series
+    """
+    rollups = DetectionRollup.objects.filter(hour__gte=hour_bucket(since))
+    if camera_id:
+        rollups = rollups.filter(camera_id=camera_id)
+
+    totals = rollups.aggregate(
+        detections=Sum('total_detections'),
+        unique_plates=Sum('unique_plates'),
+        blacklist_hits=Sum('blacklist_hits'),
+        confidence_sum=Sum('confidence_sum'),
+    )
+    detections = totals['detections'] or 0
+
+    per_camera = rollups.values('camera_id', 'camera__name').annotate(
+        detections=Sum('total_detections'),
+        blacklist_hits=Sum('blacklist_hits'),
+    ).order_by('-detections')
+
+    hourly = rollups.values('hour').annotate(
+        detections=Sum('total_detections'),
+        unique_plates=Sum('unique_plates'),
+        blacklist_hits=Sum('blacklist_hits'),
+        confidence_sum=Sum('confidence_sum'),
+    ).order_by('hour')
+
+    return {
+        'since': hour_bucket(since),
+        'detections': detections,
+        # Sum of per-camera hourly uniques; a plate seen in several hours counts once per hour
+        'unique_plates': totals['unique_plates'] or 0,
+        'blacklist_hits': totals['blacklist_hits'] or 0,
+        'average_confidence': round((totals['confidence_sum'] or 0.0) / detections, 3) if detections else 0.0,
+        'per_camera': [
+            {
+                'camera_id': row['camera_id'],
+                'camera_name': row['camera__name'],
+                'detections': row['detections'],
+                'blacklist_hits': row['blacklist_hits'],
+            } for row in per_camera
+        ],
+        'hourly': [
+            {
+                'hour': row['hour'],
+                'detections': row['detections'],
+                'unique_plates': row['unique_plates'],
+                'blacklist_hits': row['blacklist_hits'],
+                'average_confidence': round(row['confidence_sum'] / row['detections'], 3) if row['detections'] else 0.0,
+            } for row in hourly
+        ],
+    }
@@ -1,3 +1,5 @@
+from datetime import timedelta
+from django.utils import timezone
 from rest_framework import serializers
 from .models import Detection
 from anpr_cameras.serializers import CameraSerializer
@@ -10,4 +12,33 @@ class DetectionSerializer(serializers.ModelSerializer):
         model = Detection
         fields = ['id', 'plate_number', 'timestamp', 'camera', 'camera_details',
                   'image_path', 'video_path', 'confidence', 'blacklist_flag']
-        read_only_fields = ['blacklist_flag']
\ No newline at end of file
+        read_only_fields = ['blacklist_flag']
+
+class PlateHistoryQuerySerializer(serializers.Serializer):
+    """Query parameters for a plate's journey timeline"""
+    plate = serializers.CharField(max_length=20)
+    days = serializers.IntegerField(min_value=1, max_value=90, default=7)
+    limit = serializers.IntegerField(min_value=1, max_value=10000, default=1000)
+
+
+class CorrelationQuerySerializer(serializers.Serializer):
+    """Query parameters for a camera A -> camera B correlation"""
+    camera_a = serializers.IntegerField()
+    camera_b = serializers.IntegerField()
+    window = serializers.IntegerField(min_value=1, max_value=86400, default=600,
+                                      help_text='Maximum travel time in seconds')
+    start_date = serializers.DateTimeField(required=False)
+    end_date = serializers.DateTimeField(required=False)
+    pairs = serializers.IntegerField(min_value=0, max_value=1000, default=100)
+    
+    def validate(self, data):
+        if data['camera_a'] == data['camera_b']:
+            raise serializers.ValidationError("camera_a and camera_b must be different cameras")
+        
+        data.setdefault('end_date', timezone.now())
+        data.setdefault('start_date', data['end_date'] - timedelta(days=1))
+        if data['start_date'] >= data['end_date']:
+            raise serializers.ValidationError("start_date must be before end_date")
+        if data['end_date'] - data['start_date'] > timedelta(days=31):
+            raise serializers.ValidationError("Date range cannot exceed 31 days")
+        return data
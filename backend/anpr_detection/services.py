@@ -3,58 +3,85 @@ ANPR Detection Services
 """
 import os
 import cv2
-import numpy as np
 import logging
-import pytesseract
 from datetime import datetime
 from django.conf import settings
 from django.utils import timezone
 from anpr_cameras.models import Camera
-from anpr_alerts.models import Blacklist, Alert
+from anpr_alerts.models import Blacklist
 from .models import Detection
+from .backends import get_backend, get_detector, get_detector_settings
+from .tiling import InferenceProfile, detect_frame
+from .prefilter import CascadeGate
+from .quality import QualityGate
+from .ocr_cache import OCRResultCache, perceptual_hash
+from .ocr import get_ocr_settings, recognize_crops
+from .plate_format import PlateFormatStage
+from .consensus import ConsensusTracker, get_consensus_settings
+from .metrics import PipelineMetrics
+from .pipeline import Pipeline
 
 # Configure logger
 logger = logging.getLogger('anpr_detection')
 
 class ANPRDetector:
     """
-    Automatic Number Plate Recognition detector using YOLO and Tesseract OCR
+    Automatic Number Plate Recognition detector using a YOLO backend and Tesseract OCR
     """
-    def __init__(self, mock_mode=True):
+    def __init__(self, mock_mode=None, camera=None, consensus=False, **backend_overrides):
         """
         Initialize ANPR detector
         
         Args:
-            mock_mode: If True, use mock detection instead of actual models
+            mock_mode: If True, use mock detection instead of actual models.
+                If False, use the configured backend (OpenCV when none is
+                configured). Defaults to ANPR_DETECTOR['BACKEND'].
+            camera: Optional Camera whose inference size and tiling settings apply
+            consensus: Track plates across frames and vote on their reads
+                (for streams; ANPR_CONSENSUS['ENABLED'] can turn it off)
+            backend_overrides: ANPR_DETECTOR settings to override, e.g. BACKEND or MODEL
         """
-        self.mock_mode = mock_mode
-        self.confidence_threshold = 0.5
-        self.nms_threshold = 0.4
+        if mock_mode:
+            backend_overrides['BACKEND'] = 'mock'
+        elif mock_mode is False and get_detector_settings(**backend_overrides)['BACKEND'] == 'mock':
+            backend_overrides['BACKEND'] = 'opencv'
         
-        # Initialize YOLO model if not in mock mode
-        if not mock_mode:
-            try:
-                # Path to YOLO model files
-                model_dir = os.path.join(settings.BASE_DIR, 'anpr_detection', 'ml_models')
-                weights_path = os.path.join(model_dir, 'yolov4-plate.weights')
-                config_path = os.path.join(model_dir, 'yolov4-plate.cfg')
-                
-                # Check if model files exist
-                if os.path.exists(weights_path) and os.path.exists(config_path):
-                    self.net = cv2.dnn.readNet(weights_path, config_path)
-                    self.net.setPreferableBackend(cv2.dnn.DNN_BACKEND_OPENCV)
-                    self.net.setPreferableTarget(cv2.dnn.DNN_TARGET_CPU)
-                    logger.info("YOLO model loaded successfully")
-                else:
-                    logger.warning("YOLO model files not found, using mock mode")
-                    self.mock_mode = True
-            except Exception as e:
-                logger.error(f"Error loading YOLO model: {str(e)}")
-                self.mock_mode = True
+        # Models are loaded once per process and shared between detectors
+        self.backend = get_backend(**backend_overrides)
+        self.runner = get_detector(**backend_overrides)
+        self.mock_mode = self.backend.name == 'mock'
+        self.confidence_threshold = self.backend.confidence_threshold
+        self.nms_threshold = self.backend.nms_threshold
+        self.profile = InferenceProfile.for_camera(camera)
+        self.camera_id = camera.id if camera else None
+        self.metrics = PipelineMetrics()
+        # Classical candidate gate ahead of model backends (ANPR_PREFILTER['MODE'])
+        self.gate = CascadeGate(camera_id=self.camera_id)
+        if self.backend.name in ('mock', 'classical'):
+            self.gate.mode = 'off'
+        # Crop quality check ahead of OCR (ANPR_QUALITY); mock OCR ignores the crop
+        self.quality = QualityGate(camera_id=self.camera_id)
+        if self.mock_mode:
+            self.quality.enabled = False
+        # Near-duplicate crops reuse earlier OCR results (ANPR_OCR_CACHE)
+        self.ocr_cache = OCRResultCache()
+        self.ocr_config = get_ocr_settings()
+        # Reads must fit one of the camera's plate formats (ANPR_PLATE_FORMAT)
+        self.plate_format = PlateFormatStage.for_camera(camera)
+        # Multi-frame voting per tracked plate (ANPR_CONSENSUS)
+        self.consensus = None
+        consensus_config = get_consensus_settings()
+        if consensus and consensus_config['ENABLED']:
+            validate = self.plate_format.grammar.is_valid if self.plate_format.enabled else None
+            self.consensus = ConsensusTracker(consensus_config, self.camera_id, validate)
+        # Stages run per frame, per the camera's roi and skip_stages (ANPR_PIPELINE)
+        self.pipeline = Pipeline.for_camera(self, camera)
         
     def detect_plates(self, image):
         """
-        Detect license plates in an image using YOLO
+        Detect license plates in an image using the configured backend,
+        at the camera's inference size and tiled when the camera asks for
+        it, behind the classical prefilter when one is enabled
         
         Args:
             image: Input image (numpy array)
@@ -62,62 +89,20 @@ class ANPRDetector:
         Returns:
             List of detected plate regions (x, y, w, h, confidence)
         """
-        if self.mock_mode:
-            # Mock detection - return a fake plate in the center of the image
-            h, w = image.shape[:2]
-            plate_w = int(w * 0.2)
-            plate_h = int(h * 0.1)
-            x = int((w - plate_w) / 2)
-            y = int((h - plate_h) / 2)
-            return [(x, y, plate_w, plate_h, 0.95)]
-            
         try:
-            # Get image dimensions
-            height, width = image.shape[:2]
-            
-            # Create blob from image
-            blob = cv2.dnn.blobFromImage(image, 1/255.0, (416, 416), swapRB=True, crop=False)
-            
-            # Set input and get output
-            self.net.setInput(blob)
-            output_layers = self.net.getUnconnectedOutLayersNames()
-            layer_outputs = self.net.forward(output_layers)
-            
-            # Process outputs
-            boxes = []
-            confidences = []
-            
-            for output in layer_outputs:
-                for detection in output:
-                    scores = detection[5:]
-                    class_id = np.argmax(scores)
-                    confidence = scores[class_id]
-                    
-                    if confidence > self.confidence_threshold:
-                        # Scale bounding box coordinates back to original image size
-                        box = detection[0:4] * np.array([width, height, width, height])
-                        center_x, center_y, box_width, box_height = box.astype("int")
-                        
-                        # Get top-left corner coordinates
-                        x = int(center_x - (box_width / 2))
-                        y = int(center_y - (box_height / 2))
-                        
-                        boxes.append((x, y, int(box_width), int(box_height)))
-                        confidences.append(float(confidence))
-            
-            # Apply non-maximum suppression
-            indices = cv2.dnn.NMSBoxes(boxes, confidences, self.confidence_threshold, self.nms_threshold)
-            
-            # Get final detections
-            detections = []
-            if len(indices) > 0:
-                for i in indices.flatten():
-                    x, y, w, h = boxes[i]
-                    confidence = confidences[i]
-                    detections.append((x, y, w, h, confidence))
-                    
-            return detections
-            
+            self.metrics.increment(self.camera_id, 'frames')
+            if self.gate.enabled:
+                return self.gate.detect(
+                    self.runner, image, self.profile, self.nms_threshold,
+                    full_frame=self.backend.config['TILE_FULL_FRAME'],
+                    supports_tiling=self.backend.supports_tiling,
+                )
+            with self.metrics.timed(self.camera_id, 'detect'):
+                return detect_frame(
+                    self.runner, image, self.profile, self.nms_threshold,
+                    full_frame=self.backend.config['TILE_FULL_FRAME'],
+                    supports_tiling=self.backend.supports_tiling,
+                )
         except Exception as e:
             logger.error(f"Error detecting plates: {str(e)}")
             return []
@@ -132,95 +117,123 @@ class ANPRDetector:
         Returns:
             Recognized text and confidence
         """
+        return self.recognize_batch([plate_img])[0]
+    
+    def recognize_batch(self, plate_imgs):
+        """
+        Recognize text on several license plates, stacked into as few
+        Tesseract calls as ANPR_OCR allows
+        
+        Args:
+            plate_imgs: List of cropped license plate images
+            
+        Returns:
+            List of (text, confidence), one per crop
+        """
         if self.mock_mode:
-            # Mock OCR - return a fake plate number
+            # Mock OCR - return fake plate numbers
             import random
             letters = "ABCDEFGHIJKLMNOPQRSTUVWXYZ"
             numbers = "0123456789"
-            plate = ''.join(random.choice(letters) for _ in range(2))
-            plate += ''.join(random.choice(numbers) for _ in range(2))
-            plate += ''.join(random.choice(letters) for _ in range(2))
-            return plate, 0.9
+            results = []
+            for _ in plate_imgs:
+                plate = ''.join(random.choice(letters) for _ in range(2))
+                plate += ''.join(random.choice(numbers) for _ in range(2))
+                plate += ''.join(random.choice(letters) for _ in range(2))
+                results.append((plate, 0.9))
+            return results
+        
+        if not plate_imgs:
+            return []
             
         try:
-            # Preprocess image for OCR
-            gray = cv2.cvtColor(plate_img, cv2.COLOR_BGR2GRAY)
-            blur = cv2.GaussianBlur(gray, (5, 5), 0)
-            _, thresh = cv2.threshold(blur, 0, 255, cv2.THRESH_BINARY + cv2.THRESH_OTSU)
-            
-            # Apply OCR
-            config = '--psm 7 --oem 1 -c tessedit_char_whitelist=ABCDEFGHIJKLMNOPQRSTUVWXYZ0123456789'
-            text = pytesseract.image_to_string(thresh, config=config).strip()
-            
-            # Get confidence
-            data = pytesseract.image_to_data(thresh, config=config, output_type=pytesseract.Output.DICT)
-            confidences = [int(conf) for conf in data['conf'] if conf != '-1']
-            confidence = sum(confidences) / len(confidences) if confidences else 0
-            confidence = confidence / 100.0  # Convert to 0-1 range
-            
-            return text, confidence
+            results, calls = recognize_crops(plate_imgs, self.ocr_config)
+            self.metrics.increment(self.camera_id, 'ocr_engine_calls', calls)
+            return results
             
         except Exception as e:
             logger.error(f"Error recognizing text: {str(e)}")
-            return "", 0.0
+            return [("", 0.0)] * len(plate_imgs)
+    
+    def _recognize_cached(self, plate_imgs):
+        """
+        recognize_batch behind the per-camera perceptual-hash cache; only
+        crops the cache has not seen go to Tesseract (every crop when the
+        detector has no camera)
+        
+        Args:
+            plate_imgs: List of cropped license plate images
+            
+        Returns:
+            List of (text, confidence), one per crop
+        """
+        # Uploads without a camera are unrelated images, so they never share reads
+        use_cache = self.ocr_cache.enabled and not self.mock_mode and self.camera_id is not None
+        results = [None] * len(plate_imgs)
+        hashes = [None] * len(plate_imgs)
+        if use_cache:
+            for index, plate_img in enumerate(plate_imgs):
+                hashes[index] = perceptual_hash(plate_img)
+                results[index] = self.ocr_cache.lookup(self.camera_id, hashes[index])
+        
+        pending = [index for index, result in enumerate(results) if result is None]
+        if not pending:
+            return results
+        
+        with self.metrics.timed(self.camera_id, 'ocr'):
+            recognized = self.recognize_batch([plate_imgs[index] for index in pending])
+        self.metrics.increment(self.camera_id, 'ocr_recognized', len(pending))
+        for index, (plate_number, ocr_confidence) in zip(pending, recognized):
+            results[index] = (plate_number, ocr_confidence)
+            if use_cache:
+                self.ocr_cache.store(self.camera_id, hashes[index], plate_number, ocr_confidence)
+        return results
     
-    def process_frame(self, frame, camera_id=None):
+    def process_frame(self, frame, camera_id=None, annotate=True, consensus=True):
         """
         Process a video frame for license plate detection and recognition
+        through the detector's pipeline
         
         Args:
             frame: Input video frame
             camera_id: Optional camera ID
+            annotate: If False, skip copying the frame and drawing annotations
+            consensus: If False, bypass multi-frame voting even when the
+                detector tracks plates (e.g. for preview frames)
             
         Returns:
-            Annotated frame and list of detections
+            Annotated frame (None when annotate is False) and list of detections
         """
-        # Make a copy of the frame for annotations
-        result_frame = frame.copy()
-        
-        # Detect license plates
-        plate_detections = self.detect_plates(frame)
+        outputs = ('detections', 'annotated') if annotate else ('detections',)
+        context = self.pipeline.run(frame, camera_id, outputs, consensus)
+        return context.annotated, context.detections
+    
+    def flush_consensus(self, camera_id=None):
+        """
+        End all plate tracks, e.g. when a stream stops
         
-        # Process each detection
-        detections = []
-        for (x, y, w, h, confidence) in plate_detections:
-            # Extract plate region
-            plate_img = frame[max(0, y):min(y+h, frame.shape[0]), max(0, x):min(x+w, frame.shape[1])]
-            
-            if plate_img.size == 0:
-                continue
-                
-            # Recognize text
-            plate_number, ocr_confidence = self.recognize_text(plate_img)
-            
-            # Skip if no text recognized
-            if not plate_number:
-                continue
-                
-            # Calculate final confidence
-            final_confidence = confidence * ocr_confidence
-            
-            # Check if plate is in blacklist
-            is_blacklisted = self._check_blacklist(plate_number)
-            
-            # Add to detections
-            detections.append({
-                'plate_number': plate_number,
-                'confidence': final_confidence,
-                'box': (x, y, w, h),
-                'is_blacklisted': is_blacklisted,
-                'camera_id': camera_id
-            })
-            
-            # Draw bounding box
-            color = (0, 0, 255) if is_blacklisted else (0, 255, 0)
-            cv2.rectangle(result_frame, (x, y), (x+w, y+h), color, 2)
-            
-            # Draw text
-            text = f"{plate_number} ({final_confidence:.2f})"
-            cv2.putText(result_frame, text, (x, y-10), cv2.FONT_HERSHEY_SIMPLEX, 0.5, color, 2)
+        Args:
+            camera_id: Camera ID for the detections
             
-        return result_frame, detections
+        Returns:
+            Detections for tracks that had not reported yet
+        """
+        if self.consensus is None:
+            return []
+        return [self._track_detection(track, camera_id) for track in self.consensus.expire(flush=True)]
+    
+    def _track_detection(self, track, camera_id):
+        """Detection data for a track's consensus, with the frame of its best read"""
+        return {
+            'plate_number': track.text,
+            'confidence': track.confidence,
+            'box': track.best_box,
+            'is_blacklisted': self._check_blacklist(track.text),
+            'camera_id': camera_id,
+            'format_valid': track.valid,
+            'consensus': track.info(),
+            'snapshot': track.snapshot,
+        }
     
     def save_detection(self, detection_data, frame):
         """
@@ -234,6 +247,10 @@ class ANPRDetector:
             Detection object or None if failed
         """
         try:
+            # Consensus detections carry the frame of their best read
+            if detection_data.get('snapshot') is not None:
+                frame = detection_data['snapshot']
+            
             # Extract data
             plate_number = detection_data['plate_number']
             confidence = detection_data['confidence']
@@ -261,20 +278,19 @@ class ANPRDetector:
             rel_path = os.path.join('detections', f"{plate_number}_{date_str}.jpg")
             cv2.imwrite(img_path, frame)
             
-            # Create detection
-            detection = Detection.objects.create(
+            # Create detection; the pipeline has checked the blacklist unless
+            # the camera skips its match stage (is_blacklisted None)
+            detection = Detection(
                 plate_number=plate_number,
                 camera=camera,
                 confidence=confidence,
-                is_blacklisted=is_blacklisted,
+                blacklist_flag=bool(is_blacklisted),
                 image_path=rel_path,
                 processed=False
             )
+            detection.save(blacklist_checked=is_blacklisted is not None)
             
-            # Create alert if blacklisted
-            if is_blacklisted:
-                self._create_alert(detection)
-                
+            # Detection.save raises the alert for blacklisted plates
             logger.info(f"Saved detection: {plate_number} (Camera: {camera.name})")
             return detection
             
@@ -297,25 +313,3 @@ class ANPRDetector:
         except Exception as e:
             logger.error(f"Error checking blacklist: {str(e)}")
             return False
-    
-    def _create_alert(self, detection):
-        """
-        Create an alert for a blacklisted detection
-        
-        Args:
-            detection: Detection object
-        """
-        try:
-            # Get blacklist entry
-            blacklist = Blacklist.objects.filter(plate_number=detection.plate_number, is_active=True).first()
-            
-            if blacklist:
-                # Create alert
-                Alert.objects.create(
-                    detection=detection,
-                    blacklist=blacklist,
-                    notified=False
-                )
-                logger.info(f"Created alert for blacklisted plate: {detection.plate_number}")
-        except Exception as e:
-            logger.error(f"Error creating alert: {str(e)}")
\ No newline at end of file
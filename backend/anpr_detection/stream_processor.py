@@ -5,9 +5,11 @@ import cv2
 import threading
 import time
 import logging
-import queue
+import numpy as np
 from django.conf import settings
 from .services import ANPRDetector
+from .frame_buffer import FrameRing
+from .models import detection_batch
 
 # Configure logger
 logger = logging.getLogger('anpr_detection')
@@ -26,10 +28,13 @@ class StreamProcessor:
         self.camera = camera_obj
         self.rtsp_url = camera_obj.rtsp_url
         self.camera_id = camera_obj.id
-        self.detector = ANPRDetector()
+        self.detector = ANPRDetector(camera=camera_obj, consensus=True)
         self.is_running = False
         self.thread = None
-        self.frame_queue = queue.Queue(maxsize=10)
+        # Decoded frames live in a fixed set of reused buffers (ANPR_FRAME_BUFFER)
+        self.frames = FrameRing(camera_id=self.camera_id)
+        self.preview_sequence = 0
+        self.preview_frame = None
         self.detection_interval = 1.0  # Process every 1 second
         self.last_detection_time = 0
         
@@ -68,25 +73,23 @@ class StreamProcessor:
         
         # Process frames
         while self.is_running:
-            ret, frame = cap.read()
+            # Decode into a free buffer; if previews hold them all, skip the frame
+            slot, buffer = self.frames.acquire()
+            if slot is None:
+                if not cap.grab():
+                    time.sleep(1.0)  # Wait before retry
+                continue
+            ret, frame = cap.read(image=buffer)
             
             if not ret:
                 logger.warning(f"Failed to read frame from camera {self.camera.name}")
                 time.sleep(1.0)  # Wait before retry
                 continue
                 
-            # Put frame in queue (non-blocking)
-            try:
-                self.frame_queue.put(frame, block=False)
-            except queue.Full:
-                # Queue is full, remove oldest frame
-                try:
-                    self.frame_queue.get_nowait()
-                    self.frame_queue.put(frame, block=False)
-                except:
-                    pass
+            self.frames.commit(slot, frame)
                     
-            # Process frames at regular intervals
+            # Process frames at regular intervals; this thread is the only
+            # writer, so the buffer stays intact while it is processed
             current_time = time.time()
             if current_time - self.last_detection_time >= self.detection_interval:
                 self._process_detection(frame)
@@ -95,15 +98,17 @@ class StreamProcessor:
         # Release resources
         cap.release()
         
+        # Save plates still being voted on
+        with detection_batch():
+            for detection_data in self.detector.flush_consensus(self.camera_id):
+                self.detector.save_detection(detection_data, None)
+        
     def _process_detection(self, frame):
         """Process a frame for license plate detection"""
         try:
-            # Process frame with ANPR detector
-            result_frame, detections = self.detector.process_frame(frame, self.camera_id)
-            
-            # Save detections to database
-            for detection_data in detections:
-                self.detector.save_detection(detection_data, frame)
+            # Detect, read and save plates; nothing consumes an annotated
+            # frame here, so the frame is neither copied nor drawn on
+            self.detector.pipeline.run(frame, self.camera_id, outputs=('saved',))
                 
         except Exception as e:
             logger.error(f"Error processing detection for camera {self.camera.name}: {str(e)}")
@@ -111,15 +116,24 @@ class StreamProcessor:
     def get_latest_frame(self):
         """Get the latest processed frame with annotations"""
         try:
-            # Get the latest frame from the queue without removing it
-            latest_frame = self.frame_queue.queue[-1] if not self.frame_queue.empty() else None
-            
-            if latest_frame is not None:
-                # Process the frame to add annotations
-                result_frame, _ = self.detector.process_frame(latest_frame, self.camera_id)
-                return result_frame
-            else:
-                return None
+            # Pin the latest frame so the capture thread does not decode over it
+            with self.frames.latest() as (sequence, latest_frame):
+                if latest_frame is None:
+                    return None
+                
+                # The same frame was annotated for an earlier request
+                if sequence == self.preview_sequence:
+                    return self.preview_frame
+                    
+                # Process the frame to add annotations; previews do not vote.
+                # The annotated frame is a copy, unless the camera skips
+                # annotation, and must outlive the pin
+                result_frame, _ = self.detector.process_frame(latest_frame, self.camera_id, consensus=False)
+                if np.shares_memory(result_frame, latest_frame):
+                    result_frame = result_frame.copy()
+                    
+            self.preview_sequence, self.preview_frame = sequence, result_frame
+            return result_frame
         except Exception as e:
             logger.error(f"Error getting latest frame for camera {self.camera.name}: {str(e)}")
             return None
@@ -163,6 +177,10 @@ class StreamManager:
             return True
         return False
         
+    def buffer_stats(self):
+        """Frame buffer occupancy and memory of each running stream"""
+        return {camera_id: processor.frames.stats() for camera_id, processor in list(self.streams.items())}
+        
     def get_stream_frame(self, camera_id):
         """Get the latest frame from a camera stream"""
         if camera_id in self.streams:
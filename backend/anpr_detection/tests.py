@@ -1,3 +1,1382 @@
-from django.test import TestCase
+import os
+import asyncio
+import base64
+import csv
+import gzip
+import json
+import shutil
+import tempfile
+import threading
+import time
+import cv2
+import numpy as np
+from datetime import timedelta
+from asgiref.sync import sync_to_async
+from django.db import connection
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.test import AsyncClient, TestCase, TransactionTestCase
+from django.utils import timezone
+from django.test.utils import CaptureQueriesContext
+from anpr_backend.caching import invalidate
+from anpr_cameras.models import Camera
+from anpr_alerts.models import Alert, Blacklist
+from .models import Detection, DetectionRollup, PlateTrigram, detection_batch
+from .rollups import rebuild_rollups
+from .correlation import correlate_cameras
+from .retention import prune_detections
+from .events import Event, EventBroker, Subscription
+from .backends import decode_outputs, make_blob, postprocess, get_backend, BatchScheduler
+from .tiling import InferenceProfile, box_iou, tile_grid, detect_frame
+from .prefilter import CascadeGate, find_candidates, get_prefilter_settings
+from .quality import QualityGate, assess_crop, crop_scores, estimate_skew, get_quality_settings
+from .ocr_cache import OCRResultCache, get_ocr_cache_settings, perceptual_hash, hamming
+from .ocr import assign_words, compose_strip
+from .plate_format import PlateFormatStage, PlateGrammar, get_plate_format_settings
+from .consensus import ConsensusTracker, get_consensus_settings
+from .metrics import PipelineMetrics
+from .inference import InferenceExecutor, InferenceRejected, get_inference_settings
+from .pipeline import parse_roi
+from .frame_buffer import FrameRing, get_frame_buffer_settings
+from .stream_processor import StreamProcessor
+from .benchmarks import synthetic_frames
+from .services import ANPRDetector
+from . import views
 
-# Create your tests here.
+
+class DetectionListQueryCountTests(TestCase):
+    """Detection listings must not fetch cameras row by row"""
+
+    def setUp(self):
+        self.cameras = [
+            Camera.objects.create(name=f"Camera {i}", rtsp_url='rtsp://test/stream', location=f"Gate {i}")
+            for i in range(4)
+        ]
+        self.created = 0
+
+    def _create_detections(self, count, blacklisted=False):
+        detections = []
+        for _ in range(count):
+            self.created += 1
+            detections.append(Detection(
+                plate_number=f"CD{self.created:04d}",
+                camera=self.cameras[self.created % len(self.cameras)],
+                confidence=0.8,
+                blacklist_flag=blacklisted,
+                processed=True,
+            ))
+        Detection.objects.bulk_create(detections)
+        # bulk_create sends no post_save, so invalidate cached listings by hand
+        invalidate('detections')
+
+    def _count_queries(self, url):
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return len(context.captured_queries), response.json()
+
+    def test_recent_query_count_is_constant(self):
+        self._create_detections(2)
+        small_count, small = self._count_queries('/api/detections/recent/')
+        self.assertEqual(len(small), 2)
+
+        self._create_detections(10)
+        large_count, large = self._count_queries('/api/detections/recent/')
+        self.assertEqual(len(large), 10)
+        self.assertEqual(small_count, large_count)
+        self.assertIn('camera_details', large[0])
+
+    def test_blacklisted_query_count_is_constant(self):
+        self._create_detections(2, blacklisted=True)
+        small_count, _ = self._count_queries('/api/detections/blacklisted/')
+
+        self._create_detections(15, blacklisted=True)
+        large_count, large = self._count_queries('/api/detections/blacklisted/')
+        self.assertEqual(len(large['results']), 17)
+        self.assertEqual(small_count, large_count)
+
+    def test_list_query_count_is_constant(self):
+        self._create_detections(2)
+        small_count, _ = self._count_queries('/api/detections/')
+
+        self._create_detections(15)
+        large_count, large = self._count_queries('/api/detections/')
+        self.assertEqual(len(large['results']), 17)
+        self.assertEqual(small_count, large_count)
+
+
+class DetectionPaginationTests(TestCase):
+    """Detection listings page on (timestamp, id) without OFFSET or COUNT"""
+
+    def setUp(self):
+        camera = Camera.objects.create(name='Gate', rtsp_url='rtsp://test/stream', location='North')
+        moment = timezone.now()
+        # Pairs of detections share a timestamp, so pages must split ties by id
+        self.detections = [
+            Detection.objects.create(plate_number=f"PG{index:04d}", camera=camera, confidence=(index % 3) / 10,
+                                     timestamp=moment - timedelta(minutes=index // 2))
+            for index in range(7)
+        ]
+
+    def _walk(self, url, link='next'):
+        ids, sql = [], []
+        while url:
+            with CaptureQueriesContext(connection) as context:
+                page = self.client.get(url).json()
+            sql.extend(query['sql'] for query in context.captured_queries)
+            ids.extend(detection['id'] for detection in page['results'])
+            url = page[link]
+        return ids, page, sql
+
+    def test_cursor_pages_cover_every_row_once(self):
+        newest_first = [d.id for d in sorted(self.detections, key=lambda d: (d.timestamp, d.id), reverse=True)]
+        ids, last, sql = self._walk('/api/detections/?page_size=2')
+        self.assertEqual(ids, newest_first)
+        self.assertFalse(any('OFFSET' in query or 'COUNT(' in query for query in sql))
+
+        # Previous links walk back from the last page
+        backwards = []
+        url = last['previous']
+        while url:
+            page = self.client.get(url).json()
+            backwards[:0] = [detection['id'] for detection in page['results']]
+            url = page['previous']
+        self.assertEqual(backwards + [detection['id'] for detection in last['results']], newest_first)
+
+    def test_ordering_filter_pages_on_the_chosen_field(self):
+        ids, _, _ = self._walk('/api/detections/?page_size=3&ordering=confidence')
+        self.assertEqual(ids, [d.id for d in sorted(self.detections, key=lambda d: (d.confidence, d.id))])
+
+    def test_estimated_count_and_bad_cursor(self):
+        page = self.client.get('/api/detections/?count=estimated&page_size=2').json()
+        self.assertEqual((page['count'], page['count_is_estimate'], page['count_is_lower_bound']), (7, True, False))
+        self.assertNotIn('count', self.client.get('/api/detections/?page_size=2').json())
+
+        cursor = base64.b64encode(b'p=not-a-timestamp').decode()
+        self.assertEqual(self.client.get(f'/api/detections/?cursor={cursor}').status_code, 404)
+
+
+class DetectionFilterTests(TestCase):
+    """Detection list filters use model field names and reject invalid values"""
+
+    def setUp(self):
+        self.camera = Camera.objects.create(name='Gate', rtsp_url='rtsp://test/stream', location='North')
+        self.other_camera = Camera.objects.create(name='Exit', rtsp_url='rtsp://test/stream', location='South')
+        Detection.objects.bulk_create([
+            Detection(plate_number='MH12AB1234', camera=self.camera, blacklist_flag=True, processed=True),
+            Detection(plate_number='MH12AB1234', camera=self.other_camera, processed=True),
+            Detection(plate_number='KA01XY9999', camera=self.camera, processed=True),
+        ])
+
+    def _results(self, query):
+        response = self.client.get(f'/api/detections/?{query}')
+        self.assertEqual(response.status_code, 200)
+        return response.json()['results']
+
+    def test_filter_combinations(self):
+        self.assertEqual(len(self._results(f'camera={self.camera.id}')), 2)
+        self.assertEqual(len(self._results('plate_number=MH12AB1234')), 2)
+        self.assertEqual(len(self._results('blacklist_flag=true')), 1)
+        self.assertEqual(len(self._results(f'camera={self.camera.id}&start_date=2000-01-01')), 2)
+        self.assertEqual(len(self._results('plate_number=MH12AB1234&end_date=2000-01-01')), 0)
+
+    def test_invalid_values_are_rejected(self):
+        self.assertEqual(self.client.get('/api/detections/?start_date=yesterday').status_code, 400)
+        self.assertEqual(self.client.get('/api/detections/?camera=north').status_code, 400)
+
+
+class PlateSearchTests(TestCase):
+    """Partial plate search matches prefixes, suffixes, substrings and wildcards"""
+
+    def setUp(self):
+        camera = Camera.objects.create(name='Gate', rtsp_url='rtsp://test/stream', location='North')
+        for plate in ['MH12AB1234', 'MH14CD4521', 'KA01XY4521']:
+            Detection.objects.create(plate_number=plate, camera=camera, processed=True)
+
+    def _plates(self, pattern):
+        response = self.client.get('/api/detections/', {'plate_search': pattern})
+        self.assertEqual(response.status_code, 200)
+        return sorted(row['plate_number'] for row in response.json()['results'])
+
+    def test_patterns(self):
+        self.assertEqual(self._plates('MH*'), ['MH12AB1234', 'MH14CD4521'])
+        self.assertEqual(self._plates('*4521'), ['KA01XY4521', 'MH14CD4521'])
+        self.assertEqual(self._plates('ab12'), ['MH12AB1234'])
+        self.assertEqual(self._plates('MH1?CD*'), ['MH14CD4521'])
+        self.assertEqual(self._plates('MH12-AB-1234'), ['MH12AB1234'])
+        self.assertEqual(self._plates('52'), ['KA01XY4521', 'MH14CD4521'])
+        self.assertEqual(self._plates('ZZZ'), [])
+
+    def test_patterns_without_characters_are_rejected(self):
+        for pattern in ['*', '??', '--']:
+            response = self.client.get('/api/detections/', {'plate_search': pattern})
+            self.assertEqual(response.status_code, 400)
+
+
+class CorrelationTests(TestCase):
+    """Plate history and camera A -> camera B correlation"""
+
+    def setUp(self):
+        self.gate = Camera.objects.create(name='Gate', rtsp_url='rtsp://test/stream', location='North')
+        self.exit = Camera.objects.create(name='Exit', rtsp_url='rtsp://test/stream', location='South')
+        self.start = timezone.now() - timedelta(hours=2)
+        sightings = [
+            ('MH12AB1234', self.gate, 0), ('MH12AB1234', self.exit, 300), ('MH12AB1234', self.exit, 310),
+            ('KA01XY9999', self.gate, 60), ('KA01XY9999', self.exit, 2000),
+            ('DL05CD5555', self.exit, 100),
+        ]
+        Detection.objects.bulk_create([
+            Detection(plate_number=plate, camera=camera, timestamp=self.start + timedelta(seconds=offset),
+                      processed=True)
+            for plate, camera, offset in sightings
+        ])
+
+    def test_history_is_chronological(self):
+        response = self.client.get('/api/detections/history/', {'plate': 'mh12ab1234'})
+        self.assertEqual(response.status_code, 200)
+        data = response.json()
+        self.assertEqual(data['sightings'], 3)
+        self.assertEqual([row['camera_name'] for row in data['timeline']], ['Gate', 'Exit', 'Exit'])
+        self.assertEqual([stop['sightings'] for stop in data['cameras']], [1, 2])
+
+    def test_correlation_matches_within_window(self):
+        result = correlate_cameras(self.gate.id, self.exit.id, self.start, timezone.now(), timedelta(minutes=10))
+        self.assertEqual(result['matches'], 1)
+        self.assertEqual(result['pairs'][0]['plate_number'], 'MH12AB1234')
+        self.assertEqual(result['pairs'][0]['travel_seconds'], 300)
+        self.assertEqual(result['travel_time']['percentiles']['p50'], 300)
+
+    def test_correlate_endpoint_validates_parameters(self):
+        response = self.client.get('/api/detections/correlate/', {'camera_a': self.gate.id, 'camera_b': self.gate.id})
+        self.assertEqual(response.status_code, 400)
+        response = self.client.get('/api/detections/correlate/', {'camera_a': self.gate.id, 'camera_b': self.exit.id})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['matches'], 1)
+
+
+class RetentionTests(TestCase):
+    """Expired detections are archived, deleted and their snapshots removed"""
+
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmp)
+        self.media = os.path.join(self.tmp, 'media')
+        os.makedirs(os.path.join(self.media, 'detections'))
+
+        self.camera = Camera.objects.create(name='Gate', rtsp_url='rtsp://test/stream', location='North')
+        self.short = Camera.objects.create(name='Exit', rtsp_url='rtsp://test/stream', location='South',
+                                           retention_days=5)
+        now = timezone.now()
+        for camera in (self.camera, self.short):
+            for age in (1, 10, 100):
+                path = f"detections/{camera.id}_{age}.jpg"
+                with open(os.path.join(self.media, path), 'wb') as f:
+                    f.write(b'jpeg')
+                Detection.objects.create(plate_number=f"AB{age:04d}", camera=camera, processed=True,
+                                         timestamp=now - timedelta(days=age), image_path=path)
+
+    def _prune(self, **kwargs):
+        archive_dir = os.path.join(self.tmp, 'archive')
+        with self.settings(MEDIA_ROOT=self.media,
+                           ANPR_RETENTION={'DAYS': 30, 'ARCHIVE_DIR': archive_dir, 'BATCH_SIZE': 1}):
+            return prune_detections(**kwargs), archive_dir
+
+    def test_dry_run_changes_nothing(self):
+        result, _ = self._prune(dry_run=True)
+        self.assertEqual(result['detections'], 3)
+        self.assertEqual(Detection.objects.count(), 6)
+
+    def test_prune_archives_and_deletes(self):
+        entry = Blacklist.objects.create(plate_number='ZZ9999', reason='Stolen')
+        Alert.objects.create(detection=Detection.objects.get(camera=self.short, plate_number='AB0100'),
+                             blacklist_entry=entry)
+        result, archive_dir = self._prune()
+        self.assertEqual(result['detections'], 3)
+        self.assertEqual(
+            sorted(Detection.objects.values_list('camera__name', 'plate_number')),
+            [('Exit', 'AB0001'), ('Gate', 'AB0001'), ('Gate', 'AB0010')]
+        )
+        self.assertEqual(sorted(os.listdir(os.path.join(self.media, 'detections'))),
+                         sorted(f"{c.id}_{age}.jpg" for c, age in
+                                [(self.camera, 1), (self.camera, 10), (self.short, 1)]))
+        # AB0100 is gone from both cameras; AB0010 is still held by the 30-day
+        # camera and ZZ9999 by the blacklist
+        self.assertEqual(set(PlateTrigram.objects.values_list('plate_number', flat=True)),
+                         {'AB0001', 'AB0010', 'ZZ9999'})
+        self.assertFalse(Alert.objects.exists())
+
+        with open(result['manifest']) as f:
+            manifest = json.load(f)
+        self.assertEqual(sum(entry['rows'] for entry in manifest['files']), 3)
+        with gzip.open(os.path.join(archive_dir, manifest['files'][0]['file']), 'rt') as f:
+            self.assertEqual(len(list(csv.reader(f))), manifest['files'][0]['rows'] + 1)
+
+    def test_orphan_sweep_keeps_files_of_cameras_not_pruned(self):
+        archive = Camera.objects.create(name='Archive', rtsp_url='rtsp://test/stream', location='Yard',
+                                        retention_days=365)
+        path = f"detections/{archive.id}_100.jpg"
+        full_path = os.path.join(self.media, path)
+        with open(full_path, 'wb') as f:
+            f.write(b'jpeg')
+        aged = (timezone.now() - timedelta(days=100)).timestamp()
+        os.utime(full_path, (aged, aged))
+        Detection.objects.create(plate_number='AB0100', camera=archive, processed=True,
+                                 timestamp=timezone.now() - timedelta(days=100), image_path=path)
+
+        # Only the 5-day camera is pruned, but the 365-day camera's file is within its window
+        result, _ = self._prune(camera_ids=[self.short.id])
+        self.assertEqual((result['detections'], result['orphan_snapshots']), (2, 0))
+        self.assertTrue(os.path.exists(full_path))
+
+        # A file no camera's window covers is swept
+        stale = (timezone.now() - timedelta(days=400)).timestamp()
+        os.utime(full_path, (stale, stale))
+        result, _ = self._prune(camera_ids=[self.short.id])
+        self.assertEqual(result['orphan_snapshots'], 1)
+        self.assertFalse(os.path.exists(full_path))
+
+
+class EventStreamTests(TransactionTestCase):
+    """Committed detections and alerts are pushed to matching SSE subscribers"""
+
+    def setUp(self):
+        EventBroker._instance = None
+        self.addCleanup(setattr, EventBroker, '_instance', None)
+        self.gate = Camera.objects.create(name='Gate', rtsp_url='rtsp://test/stream', location='North')
+        self.exit = Camera.objects.create(name='Exit', rtsp_url='rtsp://test/stream', location='South')
+
+    async def _read_events(self, stream, count):
+        events = []
+        while len(events) < count:
+            chunk = (await asyncio.wait_for(anext(stream), 2)).decode()
+            if chunk.startswith('id:'):
+                lines = dict(line.split(': ', 1) for line in chunk.strip().split('\n'))
+                events.append((lines['event'], json.loads(lines['data'])))
+        return events
+
+    def test_subscribers_receive_filtered_events(self):
+        async def scenario():
+            response = await AsyncClient().get('/api/events/', {'camera': self.exit.id})
+            stream = aiter(response.streaming_content)
+            await asyncio.wait_for(anext(stream), 2)  # retry hint
+
+            await sync_to_async(Detection.objects.create)(plate_number='GATE0001', camera=self.gate)
+            await sync_to_async(Detection.objects.create)(plate_number='EXIT0001', camera=self.exit)
+            events = await self._read_events(stream, 1)
+            await stream.aclose()
+            return events
+
+        events = asyncio.run(scenario())
+        self.assertEqual([(kind, data['plate_number']) for kind, data in events], [('detection', 'EXIT0001')])
+
+    def test_list_filters_apply_to_pushed_detections(self):
+        async def scenario():
+            response = await AsyncClient().get('/api/events/', {
+                'types': 'detection', 'plate_search': 'MH12*', 'blacklist_flag': 'false',
+                'start_date': '2000-01-01T00:00:00',
+            })
+            stream = aiter(response.streaming_content)
+            await asyncio.wait_for(anext(stream), 2)  # retry hint
+
+            await sync_to_async(Detection.objects.create)(plate_number='KA011234', camera=self.gate)
+            await sync_to_async(Detection.objects.create)(plate_number='MH120001', camera=self.gate, blacklist_flag=True)
+            await sync_to_async(Detection.objects.create)(plate_number='MH120002', camera=self.gate)
+            events = await self._read_events(stream, 1)
+            await stream.aclose()
+            return events
+
+        events = asyncio.run(scenario())
+        self.assertEqual([data['plate_number'] for _, data in events], ['MH120002'])
+
+        # Pushed rows have the same shape as the list endpoint's
+        listed = self.client.get('/api/detections/', {'plate_number': 'MH120002'}).json()['results'][0]
+        self.assertEqual(events[0][1], listed)
+
+    def test_invalid_filters_are_rejected(self):
+        async def scenario():
+            client = AsyncClient()
+            return [
+                (await client.get('/api/events/', params)).status_code
+                for params in ({'start_date': 'yesterday'}, {'plate_search': '**'})
+            ]
+
+        self.assertEqual(asyncio.run(scenario()), [400, 400])
+
+    def test_resume_from_last_event_id(self):
+        Detection.objects.create(plate_number='FIRST001', camera=self.gate)
+        first_id = EventBroker().last_id
+        Detection.objects.create(plate_number='SECOND01', camera=self.gate)
+
+        async def scenario():
+            response = await AsyncClient().get('/api/events/', headers={'Last-Event-ID': str(first_id)})
+            stream = aiter(response.streaming_content)
+            events = await self._read_events(stream, 1)
+            await stream.aclose()
+            return events
+
+        events = asyncio.run(scenario())
+        self.assertEqual(events[0][1]['plate_number'], 'SECOND01')
+
+    def test_overflowing_subscriber_is_disconnected(self):
+        loop = asyncio.new_event_loop()
+        self.addCleanup(loop.close)
+        subscription = Subscription(loop, buffer_size=2)
+        EventBroker().subscribe(subscription)
+        for i in range(3):
+            subscription.offer(Event(i, 'detection', {}))
+        self.assertTrue(subscription.overflowed)
+        self.assertEqual(subscription.queue.qsize(), 2)
+
+
+class DetectorBackendTests(TestCase):
+    """Every output layout decodes to the same box in image pixels"""
+
+    def setUp(self):
+        # A 200x100 plate at (400, 300) in a 1280x720 frame
+        self.image = np.zeros((720, 1280, 3), dtype=np.uint8)
+        self.box = (400, 300, 200, 100)
+
+    def _detect(self, outputs, output_format):
+        _, transform = make_blob(self.image, 640, output_format)
+        boxes, scores = decode_outputs(outputs, output_format, 640)
+        return postprocess(boxes, scores, transform, self.image.shape, 0.5, 0.4)
+
+    def _input_box(self, output_format):
+        """Centre/size of self.box in model input pixels"""
+        x, y, w, h = self.box
+        if output_format == 'darknet':
+            sx, sy, px, py = 640 / 1280, 640 / 720, 0, 0
+        else:
+            sx = sy = 0.5
+            px, py = 0, (640 - 360) // 2
+        return [(x + w / 2) * sx + px, (y + h / 2) * sy + py, w * sx, h * sy]
+
+    def test_output_formats(self):
+        cx, cy, w, h = self._input_box('yolov5')
+        yolov5 = np.array([[[cx, cy, w, h, 0.9, 1.0], [10, 10, 5, 5, 0.1, 1.0]]], dtype=np.float32)
+        yolov8 = np.array([[[cx, 10], [cy, 10], [w, 5], [h, 5], [0.9, 0.1]]], dtype=np.float32)
+        darknet = np.array([[v / 640 for v in self._input_box('darknet')] + [0.9, 0.9]], dtype=np.float32)
+
+        for output_format, outputs in (('yolov5', [yolov5]), ('yolov8', [yolov8]), ('darknet', [darknet])):
+            detections = self._detect(outputs, output_format)
+            self.assertEqual(len(detections), 1, output_format)
+            for got, expected in zip(detections[0][:4], self.box):
+                self.assertAlmostEqual(got, expected, delta=2, msg=output_format)
+            self.assertAlmostEqual(detections[0][4], 0.9, places=5)
+
+    def test_missing_model_falls_back_to_classical(self):
+        backend = get_backend(BACKEND='opencv', MODEL='missing-model.onnx')
+        self.assertEqual(backend.name, 'classical')
+        detector = ANPRDetector(mock_mode=False, MODEL='missing-model.onnx')
+        self.assertFalse(detector.mock_mode)
+        # A blank frame has no plate-like regions
+        self.assertEqual(detector.detect_plates(self.image), [])
+
+
+class BrightBoxDetector:
+    """Stand-in backend that reports bright rectangles, so tiling sees real image content"""
+
+    def __init__(self):
+        self.batches = []
+
+    def detect_batch(self, images, input_size=None):
+        self.batches.append(len(images))
+        results = []
+        for image in images:
+            mask = (image[:, :, 0] > 200).astype(np.uint8)
+            count, _, stats, _ = cv2.connectedComponentsWithStats(mask)
+            results.append([(int(x), int(y), int(w), int(h), 0.9) for x, y, w, h, _ in stats[1:count]])
+        return results
+
+
+class TiledInferenceTests(TestCase):
+    """Large frames are tiled, inferred as one batch and merged across tiles"""
+
+    def test_tile_grid_covers_frame(self):
+        tiles = tile_grid(3840, 2160, 1280, 0.2)
+        self.assertEqual(tiles[0], (0, 0, 1280, 1280))
+        self.assertEqual(max(t[2] for t in tiles), 3840)
+        self.assertEqual(max(t[3] for t in tiles), 2160)
+        self.assertTrue(all(t[2] - t[0] == 1280 and t[3] - t[1] == 1280 for t in tiles))
+
+    def test_small_frames_are_not_tiled(self):
+        self.assertIsNone(InferenceProfile(tile_size=1280).tiles(1280, 720))
+        self.assertIsNone(InferenceProfile().tiles(3840, 2160))
+
+    def test_plate_across_tiles_is_reported_once(self):
+        frame = np.zeros((2160, 3840, 3), dtype=np.uint8)
+        # Straddles the boundary between the first two tile columns
+        frame[1000:1040, 1000:1150] = 255
+        detector = BrightBoxDetector()
+        detections = detect_frame(detector, frame, InferenceProfile(tile_size=1280, tile_overlap=0.2), 0.4)
+        self.assertEqual([d[:4] for d in detections], [(1000, 1000, 150, 40)])
+        # All tiles plus the full frame in one batch
+        self.assertEqual(detector.batches, [len(tile_grid(3840, 2160, 1280, 0.2)) + 1])
+
+    def test_scheduler_batches_concurrent_requests(self):
+        detector = BrightBoxDetector()
+        detector.resolve_input_size = lambda size=None: size or 416
+        scheduler = BatchScheduler(detector, window_ms=200, max_batch=8)
+        frame = np.zeros((100, 100, 3), dtype=np.uint8)
+        frame[10:20, 10:50] = 255
+        results = []
+        threads = [threading.Thread(target=lambda: results.append(scheduler.detect_batch([frame, frame])))
+                   for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(len(results), 4)
+        self.assertTrue(all(len(result) == 2 and result[0] == [(10, 10, 40, 10, 0.9)] for result in results))
+        self.assertEqual(sum(detector.batches), 8)
+        self.assertLess(len(detector.batches), 4)
+
+
+class PrefilterTests(TestCase):
+    """Classical candidates gate the detector and the savings are recorded"""
+
+    def setUp(self):
+        PipelineMetrics().reset()
+        self.frames = list(synthetic_frames(10, seed=7))
+        self.blank = np.full((720, 1280, 3), 90, dtype=np.uint8)
+
+    def _gate(self, mode, audit_every=0):
+        config = dict(get_prefilter_settings(), MODE=mode, AUDIT_EVERY=audit_every)
+        return CascadeGate(config, camera_id=1)
+
+    def test_finds_rendered_plates(self):
+        found = 0
+        for _, image, truth in self.frames:
+            if any(box_iou(truth[0], candidate[:4]) >= 0.5 for candidate in find_candidates(image)):
+                found += 1
+        self.assertGreaterEqual(found, 9)
+        self.assertEqual(find_candidates(self.blank), [])
+
+    def test_gate_skips_detector_without_candidates(self):
+        detector = BrightBoxDetector()
+        gate = self._gate('frame')
+        self.assertEqual(gate.detect(detector, self.blank, InferenceProfile(), 0.4), [])
+        self.assertEqual(detector.batches, [])
+        counters = PipelineMetrics().snapshot()['1']['counters']
+        self.assertEqual(counters['detector_skipped'], 1)
+        self.assertEqual(counters['prefilter_frames'], 1)
+
+    def test_regions_mode_maps_boxes_to_frame(self):
+        _, image, truth = self.frames[0]
+        detector = BrightBoxDetector()
+        detections = self._gate('regions').detect(detector, image, InferenceProfile(), 0.4)
+        # The plate background is the only region above the detector's threshold
+        self.assertTrue(any(box_iou(truth[0], d[:4]) >= 0.8 for d in detections))
+        self.assertEqual(len(detector.batches), 1)
+
+    def test_audit_counts_missed_plates(self):
+        detector = BrightBoxDetector()
+        frame = self.blank.copy()
+        # Bright but featureless: the detector sees it, the prefilter does not
+        frame[300:340, 500:660] = 255
+        self._gate('frame', audit_every=1).detect(detector, frame, InferenceProfile(), 0.4)
+        counters = PipelineMetrics().snapshot()['1']['counters']
+        self.assertEqual(counters['audit_plates'], 1)
+        self.assertEqual(counters['audit_missed_plates'], 1)
+
+    def test_audit_schedule_is_shared_per_camera(self):
+        # Uploads build a new detector, and so a new gate, per request
+        for _ in range(4):
+            self._gate('frame', audit_every=2).detect(BrightBoxDetector(), self.blank, InferenceProfile(), 0.4)
+        self.assertEqual(PipelineMetrics().snapshot()['1']['counters']['audit_frames'], 2)
+
+    def test_pipeline_stats_endpoint(self):
+        self._gate('frame', audit_every=1).detect(BrightBoxDetector(), self.blank, InferenceProfile(), 0.4)
+        response = self.client.get('/api/pipeline/stats/')
+        self.assertEqual(response.status_code, 200)
+        summary = response.json()['cameras']['1']['prefilter']
+        self.assertEqual(summary['frames'], 1)
+        self.assertEqual(summary['candidate_hit_rate'], 0.0)
+        self.assertIsNotNone(summary['estimated_cpu_saved_ms'])
+
+
+class CropQualityTests(TestCase):
+    """Unreadable crops skip OCR, borderline ones are enhanced first"""
+
+    def setUp(self):
+        PipelineMetrics().reset()
+        self.config = get_quality_settings()
+        self.plate = np.full((60, 240, 3), 235, dtype=np.uint8)
+        cv2.putText(self.plate, 'AB12CDE', (10, 45), cv2.FONT_HERSHEY_SIMPLEX, 1.4, (10, 10, 10), 3)
+
+    def test_scores_classify_crops(self):
+        self.assertEqual(assess_crop(crop_scores(self.plate), self.config), ('ok', []))
+        flat = np.full((60, 240, 3), 120, dtype=np.uint8)
+        self.assertEqual(assess_crop(crop_scores(flat), self.config)[0], 'reject')
+        tall = self.plate[:, :60]
+        self.assertEqual(assess_crop(crop_scores(tall), self.config), ('reject', ['aspect']))
+        small = cv2.resize(self.plate, (48, 12), interpolation=cv2.INTER_AREA)
+        self.assertEqual(assess_crop(crop_scores(small), self.config), ('borderline', ['height']))
+
+    def test_borderline_crop_is_deskewed_and_rescaled(self):
+        rotation = cv2.getRotationMatrix2D((120, 30), 8, 1.0)
+        skewed = cv2.warpAffine(self.plate, rotation, (240, 60), borderMode=cv2.BORDER_REPLICATE)
+        small = cv2.resize(skewed, (56, 14), interpolation=cv2.INTER_AREA)
+        prepared = QualityGate(self.config, camera_id=1).prepare(small)
+        self.assertEqual(prepared.shape[0], self.config['RESCALE_HEIGHT'])
+        self.assertLess(abs(estimate_skew(prepared)), abs(estimate_skew(small)))
+        self.assertEqual(PipelineMetrics().snapshot()['1']['counters']['quality_borderline'], 1)
+
+    def test_blurred_plate_skips_ocr(self):
+        frame = np.full((720, 1280, 3), 90, dtype=np.uint8)
+        frame[300:360, 400:640] = cv2.GaussianBlur(self.plate, (31, 31), 12)
+        detector = ANPRDetector(mock_mode=False, BACKEND='classical')
+        detector.detect_plates = lambda image: [(400, 300, 240, 60, 0.9)]
+        _, detections = detector.process_frame(frame, annotate=False)
+        self.assertEqual(detections, [])
+        stats = PipelineMetrics().snapshot()['unassigned']
+        self.assertEqual(stats['counters']['ocr_skipped_quality'], 1)
+        self.assertNotIn('ocr', stats['stages'])
+
+        summary = self.client.get('/api/pipeline/stats/').json()['cameras']['unassigned']['quality']
+        self.assertEqual(summary['skip_rate'], 1.0)
+        self.assertEqual(summary['rejected_by'], {'sharpness': 1})
+
+
+class OCRCacheTests(TestCase):
+    """Near-identical crops from one camera reuse the earlier OCR result"""
+
+    def setUp(self):
+        PipelineMetrics().reset()
+        self.cache = OCRResultCache()
+        self.cache.clear()
+        self.addCleanup(self.cache.clear)
+        self.frames = list(synthetic_frames(6, seed=3))
+
+    def _crop(self, index, dx=0, dy=0, noise_seed=None):
+        _, image, truth = self.frames[index]
+        x, y, w, h = truth[0]
+        crop = image[y + dy:y + h + dy, x + dx:x + w + dx]
+        if noise_seed is not None:
+            crop = cv2.add(crop, np.random.default_rng(noise_seed).integers(0, 10, crop.shape, dtype=np.uint8))
+        return crop
+
+    def test_hash_separates_plates_but_not_jitter(self):
+        max_distance = get_ocr_cache_settings()['MAX_DISTANCE']
+        for index in range(len(self.frames)):
+            same = hamming(perceptual_hash(self._crop(index)), perceptual_hash(self._crop(index, 1, 0, noise_seed=index)))
+            self.assertLessEqual(same, max_distance)
+        hashes = [perceptual_hash(self._crop(index)) for index in range(len(self.frames))]
+        for i in range(len(hashes)):
+            for j in range(i + 1, len(hashes)):
+                self.assertGreater(hamming(hashes[i], hashes[j]), max_distance)
+
+    def test_lookup_is_per_camera_and_expires(self):
+        image_hash = perceptual_hash(self._crop(0))
+        self.cache.store(1, image_hash, 'AB12CDE', 0.8)
+        self.assertEqual(self.cache.lookup(1, perceptual_hash(self._crop(0, 1, 0, noise_seed=1))), ('AB12CDE', 0.8))
+        self.assertIsNone(self.cache.lookup(2, image_hash))
+        self.assertIsNone(self.cache.lookup(1, perceptual_hash(self._crop(1))))
+
+        self.cache.clear(dict(get_ocr_cache_settings(), TTL=0))
+        self.cache.store(1, image_hash, 'AB12CDE', 0.8)
+        self.assertIsNone(self.cache.lookup(1, image_hash))
+
+    def test_lru_eviction(self):
+        self.cache.clear(dict(get_ocr_cache_settings(), MAX_ENTRIES=2, MAX_DISTANCE=0))
+        for value in (1, 2):
+            self.cache.store(1, value, str(value), 0.9)
+        self.cache.lookup(1, 1)
+        self.cache.store(1, 3, '3', 0.9)
+        self.assertIsNone(self.cache.lookup(1, 2))
+        self.assertEqual(self.cache.lookup(1, 1), ('1', 0.9))
+
+    def test_repeated_crops_skip_ocr(self):
+        camera = Camera.objects.create(name='Gate', rtsp_url='rtsp://x', location='North')
+        detector = ANPRDetector(mock_mode=False, camera=camera, BACKEND='classical')
+        calls = []
+        detector.recognize_batch = lambda crops: calls.append(len(crops)) or [('AB12CDE', 0.8)] * len(crops)
+        for dx in (0, 1, 0, -1):
+            self.assertEqual(detector._recognize_cached([self._crop(2, dx)]), [('AB12CDE', 0.8)])
+        self.assertEqual(calls, [1])
+
+        summary = self.client.get('/api/pipeline/stats/').json()['cameras'][str(camera.id)]['ocr_cache']
+        self.assertEqual((summary['hits'], summary['misses'], summary['hit_ratio']), (3, 1, 0.75))
+
+    def test_uploads_without_a_camera_are_always_read(self):
+        # Two unrelated uploads whose crops look alike must not share a plate
+        for plate, dx in (('AB12CDE', 0), ('XY34ZZZ', 1)):
+            detector = ANPRDetector(mock_mode=False, BACKEND='classical')
+            detector.recognize_batch = lambda crops, plate=plate: [(plate, 0.8)] * len(crops)
+            self.assertEqual(detector._recognize_cached([self._crop(2, dx)]), [(plate, 0.8)])
+        self.assertNotIn('ocr_cache_hits', PipelineMetrics().snapshot().get('unassigned', {}).get('counters', {}))
+
+
+class BatchedOCRTests(TestCase):
+    """All plates of a frame are read in one OCR call and mapped back to their boxes"""
+
+    def setUp(self):
+        PipelineMetrics().reset()
+        OCRResultCache().clear()
+        self.addCleanup(OCRResultCache().clear)
+
+    def _plate(self, text, width=240, height=60):
+        plate = np.full((height, width, 3), 235, dtype=np.uint8)
+        cv2.putText(plate, text, (10, int(height * 0.75)), cv2.FONT_HERSHEY_SIMPLEX, height / 42.0, (10, 10, 10), 3)
+        return plate
+
+    def test_strip_stacks_crops_at_line_height(self):
+        crops = [self._plate('AB12CDE'), self._plate('XY34ZZ', 160, 30), self._plate('LONG', 960, 60)]
+        strip, slots = compose_strip(crops, 48, 480)
+        self.assertEqual(strip.dtype, np.uint8)
+        self.assertEqual(len(slots), 3)
+        self.assertEqual([bottom - top for top, bottom in slots[:2]], [48, 48])
+        # The 16:1 crop hits the width cap instead
+        self.assertEqual(slots[2][1] - slots[2][0], 30)
+        self.assertLessEqual(strip.shape[1], 480 + 48)
+        # Lines do not touch
+        self.assertTrue(all(a[1] < b[0] for a, b in zip(slots, slots[1:])))
+        self.assertTrue(set(np.unique(strip)) <= {0, 255})
+
+    def test_words_map_back_to_their_slots(self):
+        slots = [(24, 72), (96, 144), (168, 216)]
+        data = {
+            'text': ['', 'CDE', 'AB12', 'XY34ZZ', '', 'noise'],
+            'conf': [-1, 80, 90, 70, -1, 10],
+            'left': [0, 120, 24, 24, 0, 24],
+            'top': [0, 30, 28, 100, 0, 2],
+            'height': [0, 40, 40, 40, 0, 8],
+        }
+        results = assign_words(data, slots)
+        self.assertEqual([text for text, _ in results], ['AB12CDE', 'XY34ZZ', ''])
+        self.assertAlmostEqual(results[0][1], 0.85)
+        self.assertEqual(results[2][1], 0.0)
+
+    def test_frame_plates_share_one_ocr_call(self):
+        frame = np.full((720, 1280, 3), 90, dtype=np.uint8)
+        boxes = []
+        for index, text in enumerate(('AB12CDE', 'XY34ZZZ', 'KL56MNO')):
+            x, y = 100 + index * 380, 300
+            frame[y:y + 60, x:x + 240] = self._plate(text)
+            boxes.append((x, y, 240, 60, 0.9))
+        detector = ANPRDetector(mock_mode=False, BACKEND='classical')
+        detector.detect_plates = lambda image: boxes
+        calls = []
+        detector.recognize_batch = lambda crops: calls.append(len(crops)) or [
+            (f"PLATE{index}", 0.8) for index in range(len(crops))
+        ]
+        _, detections = detector.process_frame(frame, annotate=False)
+        self.assertEqual(calls, [3])
+        self.assertEqual([(d['plate_number'], d['box']) for d in detections],
+                         [(f"PLATE{index}", box[:4]) for index, box in enumerate(boxes)])
+        ocr = PipelineMetrics().snapshot()['unassigned']
+        self.assertEqual(ocr['counters']['ocr_recognized'], 3)
+        self.assertEqual(ocr['stages']['ocr']['calls'], 1)
+
+
+class PlateFormatTests(TestCase):
+    """OCR reads are validated against regional formats before they are used"""
+
+    def setUp(self):
+        PipelineMetrics().reset()
+
+    def test_generic_grammar_rejects_fragments(self):
+        grammar = PlateGrammar(['GENERIC'])
+        self.assertEqual(grammar.check('ab 12 cd'), ('AB12CD', 'valid', 'GENERIC'))
+        self.assertEqual(grammar.check('A1'), (None, 'invalid', 'length'))
+        self.assertEqual(grammar.check('IIII'), ('IIII', 'invalid', 'grammar'))
+
+    def test_confusions_are_corrected_by_position(self):
+        grammar = PlateGrammar(['GB'])
+        self.assertEqual(grammar.check('AB12CDE'), ('AB12CDE', 'valid', 'GB'))
+        # O read for 0 at a digit position, 8 read for B at a letter position
+        self.assertEqual(grammar.check('AB1OCDE'), ('AB10CDE', 'corrected', 'GB'))
+        self.assertEqual(grammar.check('8B12CDE'), ('BB12CDE', 'corrected', 'GB'))
+        # The format needing the fewest substitutions wins (prefix style here)
+        self.assertEqual(grammar.check('A81OCDE'), ('A810CDE', 'corrected', 'GB'))
+        # Too many substitutions to trust
+        self.assertEqual(grammar.check('48IOCDE')[1], 'invalid')
+
+    def test_custom_regex_region(self):
+        config = dict(get_plate_format_settings(), GRAMMARS={'XX': [r'^CD[0-9]{4}$']})
+        grammar = PlateGrammar(['XX'], config)
+        self.assertEqual(grammar.check('CD1234')[1], 'valid')
+        self.assertEqual(grammar.check('CD12345')[1], 'invalid')
+
+    def test_drop_and_downgrade_are_counted(self):
+        config = dict(get_plate_format_settings(), REGIONS=['GB'])
+        stage = PlateFormatStage(config=config, camera_id=5)
+        self.assertEqual(stage.apply('AB12CDE', 0.8), ('AB12CDE', 0.8, True))
+        self.assertEqual(stage.apply('XYZ', 0.8), (None, 0.8, False))
+        downgrade = PlateFormatStage(config=dict(config, ACTION='downgrade'), camera_id=5)
+        self.assertEqual(downgrade.apply('ABCDEFG', 0.8), ('ABCDEFG', 0.4, False))
+
+        counters = PipelineMetrics().snapshot()['5']['counters']
+        self.assertEqual(counters['format_matched_GB'], 1)
+        self.assertEqual(counters['format_rejected_length'], 1)
+        self.assertEqual(counters['format_rejected_grammar'], 1)
+        self.assertEqual((counters['format_dropped'], counters['format_downgraded']), (1, 1))
+
+    def test_junk_reads_are_not_persisted(self):
+        camera = Camera.objects.create(name='Gate', rtsp_url='rtsp://x', location='North', plate_regions='GB')
+        detector = ANPRDetector(mock_mode=False, camera=camera, BACKEND='classical')
+        frame = np.full((720, 1280, 3), 90, dtype=np.uint8)
+        frame[300:360, 400:640] = 235
+        detector.detect_plates = lambda image: [(400, 300, 240, 60, 0.9), (700, 300, 240, 60, 0.9)]
+        detector.quality.enabled = False
+        detector.ocr_cache.clear(dict(get_ocr_cache_settings(), ENABLED=False))
+        self.addCleanup(detector.ocr_cache.clear)
+        detector.recognize_batch = lambda crops: [('AB12 CDE', 0.9), ('7', 0.9)]
+        _, detections = detector.process_frame(frame, camera.id, annotate=False)
+        self.assertEqual([d['plate_number'] for d in detections], ['AB12CDE'])
+
+    def test_camera_regions_are_validated(self):
+        response = self.client.post('/api/cameras/', {
+            'name': 'Gate', 'rtsp_url': 'rtsp://x', 'location': 'North', 'plate_regions': 'gb, zz',
+        })
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('ZZ', str(response.json()['plate_regions']))
+        response = self.client.post('/api/cameras/', {
+            'name': 'Gate', 'rtsp_url': 'rtsp://x', 'location': 'North', 'plate_regions': 'gb, fr',
+        })
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.json()['plate_regions'], 'GB,FR')
+
+
+class ConsensusTests(TestCase):
+    """Reads of one plate across frames vote and are reported once"""
+
+    def setUp(self):
+        PipelineMetrics().reset()
+        OCRResultCache().clear(dict(get_ocr_cache_settings(), ENABLED=False))
+        self.addCleanup(OCRResultCache().clear)
+        self.config = dict(get_consensus_settings(), WINDOW=5.0, MIN_READS=3, MIN_AGREEMENT=0.6)
+        self.box = (400, 300, 240, 60)
+
+    def test_votes_are_weighted_by_confidence(self):
+        tracker = ConsensusTracker(self.config, camera_id=1)
+        reads = [('AB12CDE', 0.9), ('A812CDE', 0.4), ('AB12CDE', 0.8)]
+        emitted = []
+        for now, (text, confidence) in enumerate(reads):
+            track = tracker.match([self.box], now=now)[0]
+            track, emit = tracker.observe(self.box, text, confidence, track=track, now=now)
+            emitted.append(emit)
+        self.assertEqual(emitted, [False, False, True])
+        self.assertEqual(track.text, 'AB12CDE')
+        self.assertEqual(track.reads, 3)
+        self.assertAlmostEqual(track.agreement, 1.7 / 2.1, places=3)
+
+    def test_moved_box_joins_by_text_and_tracks_expire(self):
+        tracker = ConsensusTracker(self.config, camera_id=1)
+        first, _ = tracker.observe(self.box, 'AB12CDE', 0.9, now=0)
+        # Far from the first box, one character off
+        second, _ = tracker.observe((900, 100, 240, 60), 'AB12C0E', 0.5, now=1)
+        self.assertIs(first, second)
+        other, _ = tracker.observe((100, 600, 240, 60), 'XY99ZZZ', 0.9, now=1)
+        self.assertIsNot(other, first)
+
+        self.assertEqual(tracker.expire(now=5), [])
+        expired = tracker.expire(now=6.5)
+        self.assertEqual([track.text for track in expired], ['AB12CDE', 'XY99ZZZ'])
+        self.assertEqual(tracker.tracks, [])
+
+    def test_stream_detector_reports_once_and_stops_ocr(self):
+        camera = Camera.objects.create(name='Gate', rtsp_url='rtsp://x', location='North', plate_regions='GB')
+        detector = ANPRDetector(mock_mode=False, camera=camera, consensus=True, BACKEND='classical')
+        detector.consensus.config = self.config
+        detector.quality.enabled = False
+        detector.detect_plates = lambda image: [(*self.box, 0.9)]
+        reads = iter(['AB12CDE', 'A812CDE', 'AB12CDE', 'AB12CDE'])
+        calls = []
+        detector.recognize_batch = lambda crops: calls.append(len(crops)) or [(next(reads), 0.9) for _ in crops]
+
+        frame = np.full((720, 1280, 3), 90, dtype=np.uint8)
+        reported = []
+        for _ in range(5):
+            _, detections = detector.process_frame(frame, camera.id, annotate=False)
+            reported.extend(detections)
+        self.assertEqual(calls, [1, 1, 1])
+        self.assertEqual([d['plate_number'] for d in reported], ['AB12CDE'])
+        self.assertEqual(reported[0]['consensus']['reads'], 3)
+
+        saved = detector.save_detection(reported[0], None)
+        self.assertEqual(saved.plate_number, 'AB12CDE')
+        self.assertEqual(detector.flush_consensus(camera.id), [])
+
+        summary = self.client.get('/api/pipeline/stats/').json()['cameras'][str(camera.id)]['consensus']
+        self.assertEqual(summary['ocr_calls_saved'], 2)
+        self.assertEqual(summary['emitted'], 1)
+        self.assertEqual(summary['duplicates_suppressed'], 2)
+
+
+    def test_new_plate_under_a_settled_box_is_read(self):
+        camera = Camera.objects.create(name='Gate', rtsp_url='rtsp://x', location='North', plate_regions='GB')
+        detector = ANPRDetector(mock_mode=False, camera=camera, consensus=True, BACKEND='classical')
+        detector.consensus.config = self.config
+        detector.quality.enabled = False
+        detector.detect_plates = lambda image: [(*self.box, 0.9)]
+        text = ['AB12CDE']
+        calls = []
+        detector.recognize_batch = lambda crops: calls.append(len(crops)) or [(text[0], 0.9) for _ in crops]
+
+        rng = np.random.default_rng(7)
+        first, second, third = (rng.integers(0, 256, (720, 1280, 3), dtype=np.uint8) for _ in range(3))
+        reported = []
+
+        def run(frame, frames=1):
+            for _ in range(frames):
+                _, detections = detector.process_frame(frame, camera.id, annotate=False)
+                reported.extend(detections)
+
+        run(first, 4)
+        self.assertEqual((len(calls), [d['plate_number'] for d in reported]), (3, ['AB12CDE']))
+
+        # A different crop of the same plate is read once and keeps the track
+        run(second, 2)
+        self.assertEqual((len(calls), len(reported)), (4, 1))
+
+        # Another plate in the same spot is read until it settles, and reported
+        text[0] = 'XY34ZZZ'
+        run(third, 4)
+        self.assertEqual(len(calls), 7)
+        self.assertEqual([d['plate_number'] for d in reported], ['AB12CDE', 'XY34ZZZ'])
+        self.assertNotEqual(reported[0]['consensus']['track_id'], reported[1]['consensus']['track_id'])
+
+        summary = self.client.get('/api/pipeline/stats/').json()['cameras'][str(camera.id)]['consensus']
+        self.assertEqual(summary['reopened'], 1)
+
+
+class PipelineTests(TestCase):
+    """Frames run only the stages their outputs need, per camera"""
+
+    def setUp(self):
+        PipelineMetrics().reset()
+        self.frame = np.full((720, 1280, 3), 90, dtype=np.uint8)
+        OCRResultCache().clear(dict(get_ocr_cache_settings(), ENABLED=False))
+        self.addCleanup(OCRResultCache().clear)
+
+    def _detector(self, camera=None, boxes=((400, 300, 240, 60, 0.9),)):
+        detector = ANPRDetector(mock_mode=False, camera=camera, BACKEND='classical')
+        detector.quality.enabled = False
+        self.images = []
+        detector.detect_plates = lambda image: self.images.append(image) or list(boxes)
+        detector.recognize_batch = lambda crops: [('AB12CDE', 0.9)] * len(crops)
+        return detector
+
+    def test_unconsumed_stages_are_not_planned(self):
+        pipeline = self._detector().pipeline
+        names = lambda outputs: [stage.name for stage in pipeline.plan(outputs)]
+        self.assertEqual(names(['detections']), ['source', 'roi', 'detect', 'quality', 'ocr', 'match'])
+        self.assertEqual(names(['saved'])[-1], 'persist')
+        self.assertNotIn('persist', names(['annotated']))
+        with self.assertRaises(ValueError):
+            pipeline.plan(['thumbnails'])
+
+    def test_annotation_copies_only_when_requested(self):
+        detector = self._detector()
+        annotated, detections = detector.process_frame(self.frame, annotate=False)
+        self.assertIsNone(annotated)
+        self.assertEqual([d['plate_number'] for d in detections], ['AB12CDE'])
+        self.assertIs(self.images[0], self.frame)
+
+        annotated, _ = detector.process_frame(self.frame)
+        self.assertFalse(np.shares_memory(annotated, self.frame))
+        self.assertTrue((annotated[300, 400:640] == (0, 255, 0)).all())
+        self.assertTrue((self.frame == 90).all())
+
+        stages = PipelineMetrics().snapshot()['unassigned']['stages']
+        self.assertEqual(stages['pipeline.detect']['calls'], 2)
+        self.assertEqual(stages['pipeline.annotate']['calls'], 1)
+        self.assertNotIn('pipeline.persist', stages)
+
+    def test_roi_is_a_view_and_boxes_map_back(self):
+        camera = Camera.objects.create(name='Gate', rtsp_url='rtsp://x', location='North', roi='0.25,0.5,0.5,0.5')
+        detector = self._detector(camera, boxes=((10, 20, 240, 60, 0.9),))
+        media = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media)
+        with self.settings(MEDIA_ROOT=media):
+            context = detector.pipeline.run(self.frame, camera.id, ['saved'])
+        self.assertEqual(self.images[0].shape, (360, 640, 3))
+        self.assertTrue(np.shares_memory(self.images[0], self.frame))
+        self.assertEqual(context.detections[0]['box'], (330, 380, 240, 60))
+        self.assertEqual([d.plate_number for d in context.saved], ['AB12CDE'])
+        self.assertEqual(Detection.objects.filter(camera=camera).count(), 1)
+
+    def test_camera_can_skip_optional_stages(self):
+        Blacklist.objects.create(plate_number='AB12CDE', reason='Stolen')
+        camera = Camera.objects.create(name='Gate', rtsp_url='rtsp://x', location='North', skip_stages='match')
+        _, detections = self._detector(camera).process_frame(self.frame, camera.id, annotate=False)
+        self.assertFalse(detections[0]['is_blacklisted'])
+        _, detections = self._detector().process_frame(self.frame, annotate=False)
+        self.assertTrue(detections[0]['is_blacklisted'])
+
+        summary = self.client.get('/api/pipeline/stats/').json()['cameras']
+        self.assertNotIn('match', summary[str(camera.id)]['pipeline'])
+        self.assertIn('match', summary['unassigned']['pipeline'])
+
+    def test_blacklist_is_checked_for_reported_and_drawn_reads(self):
+        Blacklist.objects.create(plate_number='AB12CDE', reason='Stolen')
+        camera = Camera.objects.create(name='Gate', rtsp_url='rtsp://x', location='North')
+        detector = ANPRDetector(mock_mode=False, camera=camera, consensus=True, BACKEND='classical')
+        detector.consensus.config = dict(get_consensus_settings(), MIN_READS=3)
+        detector.quality.enabled = False
+        detector.detect_plates = lambda image: [(400, 300, 240, 60, 0.9)]
+        detector.recognize_batch = lambda crops: [('AB12CDE', 0.9)] * len(crops)
+        checks = []
+        check_blacklist = detector._check_blacklist
+        detector._check_blacklist = lambda plate: checks.append(plate) or check_blacklist(plate)
+
+        reported = []
+        for _ in range(5):
+            _, detections = detector.process_frame(self.frame, camera.id, annotate=False)
+            reported.extend(detections)
+        # Only the read the track reports is checked, not its votes or settled boxes
+        self.assertEqual(checks, ['AB12CDE'])
+        self.assertTrue(reported[0]['is_blacklisted'])
+
+        # Drawn reads reuse the track's flag
+        annotated, _ = detector.process_frame(self.frame, camera.id)
+        self.assertEqual(checks, ['AB12CDE'])
+        self.assertTrue((annotated[300, 400:640] == (0, 0, 255)).all())
+
+    def test_camera_stage_settings_are_validated(self):
+        self.assertEqual(parse_roi(''), None)
+        self.assertEqual(parse_roi('0,0.4,1,0.6'), (0.0, 0.4, 1.0, 0.6))
+        with self.assertRaises(ValueError):
+            parse_roi('0.5,0,0.6,1')
+        camera = {'name': 'Gate', 'rtsp_url': 'rtsp://x', 'location': 'North'}
+        response = self.client.post('/api/cameras/', dict(camera, roi='0,0,2,1', skip_stages='detect'))
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(set(response.json()), {'roi', 'skip_stages'})
+        response = self.client.post('/api/cameras/', dict(camera, roi='0, .5, 1, .5', skip_stages='Annotate'))
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual((response.json()['roi'], response.json()['skip_stages']), ('0,0.5,1,0.5', 'annotate'))
+
+
+class FrameRingTests(TestCase):
+    """Stream frames are decoded into a bounded set of reused buffers"""
+
+    def setUp(self):
+        self.config = dict(get_frame_buffer_settings(), SLOTS=3)
+
+    def test_capture_decodes_into_reused_buffers(self):
+        tmp = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmp)
+        path = os.path.join(tmp, 'stream.avi')
+        writer = cv2.VideoWriter(path, cv2.VideoWriter_fourcc(*'MJPG'), 10, (64, 48))
+        for level in range(0, 250, 25):
+            writer.write(np.full((48, 64, 3), level, dtype=np.uint8))
+        writer.release()
+
+        ring = FrameRing(self.config)
+        cap = cv2.VideoCapture(path)
+        self.addCleanup(cap.release)
+        while True:
+            slot, buffer = ring.acquire()
+            ret, frame = cap.read(image=buffer)
+            if not ret:
+                break
+            ring.commit(slot, frame)
+
+        stats = ring.stats()
+        self.assertEqual(stats['sequence'], 10)
+        self.assertEqual(stats['bytes'], 3 * 48 * 64 * 3)
+        self.assertEqual(stats['reallocations'], 0)
+        with ring.latest() as (sequence, frame):
+            self.assertEqual(sequence, 10)
+            self.assertAlmostEqual(float(frame.mean()), 225, delta=3)
+
+    def test_pinned_and_latest_slots_are_not_overwritten(self):
+        ring = FrameRing(dict(self.config, SLOTS=2))
+        for level in range(2):
+            slot, _ = ring.acquire()
+            ring.commit(slot, np.full((4, 4, 3), level, dtype=np.uint8))
+
+        with ring.latest() as (sequence, frame):
+            self.assertEqual((sequence, frame[0, 0, 0]), (2, 1))
+            slot, buffer = ring.acquire()
+            buffer[:] = 7
+            ring.commit(slot, buffer)
+            # The pinned frame and the new latest are both off limits
+            self.assertEqual(ring.acquire(), (None, None))
+            self.assertEqual(frame[0, 0, 0], 1)
+        self.assertEqual(ring.stats()['dropped'], 1)
+        self.assertIsNotNone(ring.acquire()[0])
+
+    def test_memory_is_bounded(self):
+        ring = FrameRing(dict(self.config, MAX_BYTES=2 * 48 * 64 * 3))
+        for _ in range(5):
+            slot, buffer = ring.acquire()
+            ring.commit(slot, buffer if buffer is not None else np.zeros((48, 64, 3), dtype=np.uint8))
+        stats = ring.stats()
+        self.assertEqual((stats['slots'], stats['configured_slots']), (2, 3))
+        self.assertLessEqual(stats['bytes'], stats['max_bytes'])
+        self.assertEqual(stats['frame_shape'], [48, 64, 3])
+
+    def test_preview_is_reused_until_a_new_frame_arrives(self):
+        camera = Camera.objects.create(name='Gate', rtsp_url='rtsp://x', location='North')
+        processor = StreamProcessor(camera)
+        self.assertIsNone(processor.get_latest_frame())
+        calls = []
+        processor.detector.process_frame = lambda frame, *args, **kwargs: calls.append(1) or (frame.copy(), [])
+
+        slot, _ = processor.frames.acquire()
+        processor.frames.commit(slot, np.zeros((48, 64, 3), dtype=np.uint8))
+        first = processor.get_latest_frame()
+        self.assertIs(processor.get_latest_frame(), first)
+        self.assertFalse(np.shares_memory(first, processor.frames.buffers[slot]))
+        slot, _ = processor.frames.acquire()
+        processor.frames.commit(slot, np.ones((48, 64, 3), dtype=np.uint8))
+        self.assertEqual(processor.get_latest_frame()[0, 0, 0], 1)
+        self.assertEqual(len(calls), 2)
+
+
+def jpeg_upload(width=640, height=480, name='frame.jpg'):
+    """A JPEG upload of a grey frame with a light plate-sized patch in the middle"""
+    image = np.full((height, width, 3), 90, dtype=np.uint8)
+    image[height // 2 - 20:height // 2 + 20, width // 2 - 60:width // 2 + 60] = 235
+    _, buffer = cv2.imencode('.jpg', image)
+    return SimpleUploadedFile(name, buffer.tobytes(), content_type='image/jpeg')
+
+
+class ProcessImageViewTests(TestCase):
+    """process_image answers in the requested response mode and rejects bad uploads"""
+
+    def setUp(self):
+        self.media = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media)
+
+    def test_detections_only_is_the_default(self):
+        response = self.client.post('/api/process-image/', {'image': jpeg_upload()})
+        self.assertEqual(response.status_code, 200)
+        payload = response.json()
+        self.assertEqual(len(payload['detections']), 1)
+        self.assertEqual(payload['detections'][0]['box'], [256, 216, 128, 48])
+        self.assertNotIn('thumbnail', payload['detections'][0])
+        self.assertEqual(payload['saved_detections'], [])
+
+    def test_crop_thumbnails(self):
+        response = self.client.post('/api/process-image/?response=crop-thumbnails', {'image': jpeg_upload(width=1280)})
+        self.assertEqual(response.status_code, 200)
+        thumbnail = base64.b64decode(response.json()['detections'][0]['thumbnail'])
+        crop = cv2.imdecode(np.frombuffer(thumbnail, np.uint8), cv2.IMREAD_COLOR)
+        # Plate crops wider than THUMBNAIL_MAX_WIDTH are scaled down
+        self.assertEqual(crop.shape[1], 160)
+
+    def test_annotated_is_multipart(self):
+        response = self.client.post('/api/process-image/', {'image': jpeg_upload(), 'response': 'annotated'})
+        self.assertEqual(response.status_code, 200)
+        content_type, boundary = response['Content-Type'].split('; boundary=')
+        self.assertEqual(content_type, 'multipart/mixed')
+        parts = response.content.split(f'--{boundary}'.encode('ascii'))
+        self.assertEqual(parts[-1], b'--\r\n')
+        json_headers, json_body = parts[1].split(b'\r\n\r\n', 1)
+        self.assertIn(b'application/json', json_headers)
+        self.assertEqual(len(json.loads(json_body)['detections']), 1)
+        image_headers, image_body = parts[2].split(b'\r\n\r\n', 1)
+        self.assertIn(b'image/jpeg', image_headers)
+        annotated = cv2.imdecode(np.frombuffer(image_body[:-2], np.uint8), cv2.IMREAD_COLOR)
+        self.assertEqual(annotated.shape, (480, 640, 3))
+
+    def test_detections_are_saved_for_a_camera(self):
+        camera = Camera.objects.create(name='Gate', rtsp_url='rtsp://x', location='North')
+        with self.settings(MEDIA_ROOT=self.media):
+            response = self.client.post('/api/process-image/', {'image': jpeg_upload(), 'camera_id': camera.id})
+        saved = response.json()['saved_detections']
+        self.assertEqual(len(saved), 1)
+        self.assertEqual(Detection.objects.get(id=saved[0]['id']).camera, camera)
+
+    def test_bad_uploads_are_rejected(self):
+        response = self.client.post('/api/process-image/', {})
+        self.assertEqual((response.status_code, response.json()['error']), (400, 'No image provided'))
+        response = self.client.post('/api/process-image/', {
+            'image': SimpleUploadedFile('frame.jpg', b'not a jpeg', content_type='image/jpeg'),
+        })
+        self.assertEqual((response.status_code, response.json()['error']), (400, 'Invalid image format'))
+        response = self.client.post('/api/process-image/?response=raw', {'image': jpeg_upload()})
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('annotated', response.json()['error'])
+
+
+class InferenceAdmissionTests(TransactionTestCase):
+    """The async endpoint sheds load it cannot serve within its limits"""
+
+    def _executor(self, **config):
+        InferenceExecutor._instance = None
+        with self.settings(ANPR_INFERENCE=dict(get_inference_settings(), **config)):
+            executor = InferenceExecutor()
+        self.addCleanup(setattr, InferenceExecutor, '_instance', None)
+        self.addCleanup(executor.pool.shutdown)
+        return executor
+
+    def _record_decodes(self):
+        """Threads the async view decodes uploads on"""
+        threads = []
+        decode_image = views._decode_image
+        views._decode_image = lambda upload: threads.append(threading.current_thread()) or decode_image(upload)
+        self.addCleanup(setattr, views, '_decode_image', decode_image)
+        return threads
+
+    def _post_while_busy(self, executor, before=None):
+        """POST an image while a slow job occupies the only worker"""
+        release = threading.Event()
+
+        async def scenario():
+            busy = asyncio.ensure_future(executor.run(release.wait, 5))
+            await asyncio.sleep(0.05)
+            if before:
+                before()
+            response = await AsyncClient().post('/api/process-image/async/', {'image': jpeg_upload()})
+            release.set()
+            await busy
+            return response
+
+        return asyncio.run(scenario())
+
+    def test_over_in_flight_limit_gets_429(self):
+        executor = self._executor(WORKERS=1, MAX_IN_FLIGHT=1)
+        decodes = self._record_decodes()
+        response = self._post_while_busy(executor)
+        self.assertEqual(response.status_code, 429)
+        # Rejected before the upload was decoded
+        self.assertEqual(decodes, [])
+        self.assertEqual(response['Retry-After'], '1')
+        self.assertEqual(response.json()['load']['in_flight'], 1)
+        self.assertEqual(executor.stats()['rejected'], 1)
+
+    def test_estimated_wait_over_deadline_gets_503(self):
+        executor = self._executor(WORKERS=1, MAX_IN_FLIGHT=4, MAX_QUEUE_WAIT=1.0)
+        # As if each request had been taking three seconds
+        response = self._post_while_busy(executor, before=lambda: setattr(executor, 'avg_service_time', 3.0))
+        self.assertEqual(response.status_code, 503)
+        self.assertEqual(response['Retry-After'], '3')
+
+    def test_deadline_is_rechecked_in_the_worker(self):
+        executor = self._executor(WORKERS=1, MAX_IN_FLIGHT=4, MAX_QUEUE_WAIT=0.2)
+        calls = []
+
+        async def scenario():
+            busy = asyncio.ensure_future(executor.run(time.sleep, 0.5))
+            await asyncio.sleep(0.05)
+            # Admitted (no service time known yet), but queued past the deadline
+            try:
+                await executor.run(calls.append, 1)
+            except InferenceRejected as e:
+                return e
+            finally:
+                await busy
+
+        rejected = asyncio.run(scenario())
+        self.assertEqual(rejected.status, 503)
+        self.assertEqual(calls, [])
+        stats = executor.stats()
+        self.assertEqual((stats['rejected'], stats['completed'], stats['in_flight']), (1, 1, 0))
+
+    def test_response_reports_queue_wait_and_service_time(self):
+        executor = self._executor(WORKERS=1)
+        decodes = self._record_decodes()
+        response = asyncio.run(AsyncClient().post('/api/process-image/async/', {'image': jpeg_upload()}))
+        self.assertEqual(response.status_code, 200)
+        # Decoded on the inference pool, not the event loop's thread
+        self.assertEqual(len(decodes), 1)
+        self.assertIsNot(decodes[0], threading.current_thread())
+        timing = response.json()['timing']
+        self.assertEqual(set(timing), {'queue_wait_ms', 'service_ms'})
+        self.assertGreater(timing['service_ms'], 0)
+        self.assertTrue(response['Server-Timing'].startswith('queue;dur='))
+        self.assertIn('service;dur=', response['Server-Timing'])
+        self.assertEqual(executor.stats()['completed'], 1)
+
+    def test_invalid_upload_is_reported_after_decoding(self):
+        self._executor(WORKERS=1)
+        upload = SimpleUploadedFile('frame.jpg', b'not a jpeg', content_type='image/jpeg')
+        response = asyncio.run(AsyncClient().post('/api/process-image/async/', {'image': upload}))
+        self.assertEqual((response.status_code, response.json()['error']), (400, 'Invalid image format'))
+
+
+class RollupTests(TestCase):
+    """Hourly rollups kept on ingest match a rebuild from the raw table"""
+
+    def setUp(self):
+        self.gate = Camera.objects.create(name='Gate', rtsp_url='rtsp://test/stream', location='North')
+        self.exit = Camera.objects.create(name='Exit', rtsp_url='rtsp://test/stream', location='South')
+        Blacklist.objects.create(plate_number='STOLEN1', reason='Stolen')
+        self.hour = timezone.now().replace(minute=0, second=0, microsecond=0) - timedelta(hours=2)
+        for camera, plate, minutes, confidence in (
+                (self.gate, 'AB12CDE', 5, 0.9),
+                (self.gate, 'AB12CDE', 20, 0.7),    # Same plate, same hour
+                (self.gate, 'STOLEN1', 30, 0.8),
+                (self.gate, 'AB12CDE', 65, 0.6),    # Next hour
+                (self.exit, 'XY34ZZZ', 10, 0.5)):
+            Detection.objects.create(plate_number=plate, camera=camera, confidence=confidence,
+                                     timestamp=self.hour + timedelta(minutes=minutes))
+
+    def _rollups(self):
+        return [
+            (row['camera_id'], row['hour'], row['total_detections'], row['unique_plates'],
+             row['blacklist_hits'], round(row['confidence_sum'], 6))
+            for row in DetectionRollup.objects.order_by('camera_id', 'hour').values()
+        ]
+
+    def test_incremental_rollups_match_a_rebuild(self):
+        incremental = self._rollups()
+        self.assertEqual(incremental[0], (self.gate.id, self.hour, 3, 2, 1, 2.4))
+        self.assertEqual(len(incremental), 3)
+
+        DetectionRollup.objects.all().delete()
+        self.assertEqual(rebuild_rollups(), 3)
+        self.assertEqual(self._rollups(), incremental)
+
+    def test_stats_endpoint_is_answered_from_rollups(self):
+        response = self.client.get('/api/stats/', {'hours': 6})
+        self.assertEqual(response.status_code, 200)
+        recent = response.json()['recent']
+        self.assertEqual((recent['detections'], recent['unique_plates'], recent['blacklist_hits']), (5, 4, 1))
+        self.assertEqual(recent['average_confidence'], 0.7)
+        self.assertEqual([row['camera_name'] for row in recent['per_camera']], ['Gate', 'Exit'])
+        self.assertEqual([row['detections'] for row in recent['hourly']], [4, 1])
+        self.assertEqual(response.json()['cameras'], {'total': 2, 'active': 2})
+
+        response = self.client.get('/api/stats/', {'hours': 6, 'camera': self.exit.id})
+        self.assertEqual(response.json()['recent']['detections'], 1)
+        self.assertEqual(self.client.get('/api/stats/', {'hours': 'x'}).status_code, 400)
+
+
+class DetectionIngestTests(TestCase):
+    """Saving a detection does no more queries than it needs"""
+
+    def setUp(self):
+        self.camera = Camera.objects.create(name='Gate', rtsp_url='rtsp://test/stream', location='North')
+        self.entry = Blacklist.objects.create(plate_number='STOLEN1', reason='Stolen')
+
+    def _save(self, plate, **kwargs):
+        detection = Detection(plate_number=plate, camera=self.camera, blacklist_flag=plate == 'STOLEN1')
+        with CaptureQueriesContext(connection) as queries:
+            detection.save(**kwargs)
+        return detection, [query['sql'] for query in queries.captured_queries]
+
+    def test_pipeline_checked_flag_is_reused(self):
+        _, queries = self._save('AB12CDE', blacklist_checked=True)
+        self.assertFalse([sql for sql in queries if 'anpr_alerts_blacklist' in sql])
+        # Without the pipeline's check the model looks the plate up itself
+        detection, queries = self._save('STOLEN1')
+        self.assertEqual(len([sql for sql in queries if 'FROM "anpr_alerts_blacklist"' in sql]), 1)
+        self.assertTrue(detection.blacklist_flag)
+
+    def test_alert_is_raised_in_the_same_write(self):
+        detection, queries = self._save('STOLEN1', blacklist_checked=True)
+        detection.refresh_from_db()
+        self.assertTrue(detection.processed)
+        self.assertEqual(detection.alert_set.get().blacklist_entry, self.entry)
+        self.assertFalse([sql for sql in queries if sql.startswith('UPDATE "anpr_detection_detection"')])
+
+    def test_batch_writes_one_rollup_per_camera_hour(self):
+        hour = timezone.now().replace(minute=0, second=0, microsecond=0)
+        with CaptureQueriesContext(connection) as queries:
+            with detection_batch():
+                for minute, plate in ((1, 'AB12CDE'), (2, 'AB12CDE'), (3, 'XY34ZZZ')):
+                    Detection(plate_number=plate, camera=self.camera,
+                              timestamp=hour + timedelta(minutes=minute)).save(blacklist_checked=True)
+        rollup_writes = [
+            query['sql'] for query in queries.captured_queries
+            if query['sql'].startswith(('UPDATE "anpr_detection_detectionrollup"', 'INSERT INTO "anpr_detection_detectionrollup"'))
+        ]
+        # One update, which finds no row for the new hour, then one insert
+        self.assertEqual([sql.split()[0] for sql in rollup_writes], ['UPDATE', 'INSERT'])
+        rollup = DetectionRollup.objects.get(camera=self.camera, hour=hour)
+        self.assertEqual((rollup.total_detections, rollup.unique_plates), (3, 2))
+        self.assertLessEqual({'AB12CDE', 'XY34ZZZ'}, set(PlateTrigram.objects.values_list('plate_number', flat=True)))
@@ -0,0 +1,171 @@
+"""
+Per-camera inference resolution and tiled detection
+
+A detector input is a fixed square, so a 4K frame shrunk to 416 px leaves
+distant plates only a few pixels tall, while a small frame is upscaled for
+nothing. Each camera can set its own input size, and optionally split
+large frames into overlapping tiles that are each inferred at that size.
+All tiles of a frame (plus, with TILE_FULL_FRAME, the whole frame for
+plates larger than a tile's overlap) go through the detector as one batch,
+and the boxes are merged across tiles.
+
+Cost grows with the number of tiles, so tile size and overlap are the
+knobs for trading throughput against small-plate recall; benchmark_detector
+accepts the same settings to measure both.
+"""
+import logging
+
+# Configure logger
+logger = logging.getLogger('anpr_detection')
+
+DEFAULT_TILE_OVERLAP = 0.2
+# Boxes within this many pixels of a tile edge that lies inside the frame were cut by the tile
+EDGE_MARGIN = 2
+
+
+class InferenceProfile:
+    """How one camera's frames are fed to the detector"""
+    __slots__ = ('input_size', 'tile_size', 'tile_overlap')
+
+    def __init__(self, input_size=None, tile_size=None, tile_overlap=DEFAULT_TILE_OVERLAP):
+        self.input_size = input_size
+        self.tile_size = tile_size
+        self.tile_overlap = tile_overlap if tile_overlap is not None else DEFAULT_TILE_OVERLAP
+
+    @classmethod
+    def for_camera(cls, camera):
+        """Profile from a camera's inference_size / tile_size / tile_overlap (None uses the defaults)"""
+        if camera is None:
+            return cls()
+        return cls(camera.inference_size, camera.tile_size, camera.tile_overlap)
+
+    def tiles(self, width, height):
+        """Tile rectangles for a frame, or None when it is not tiled"""
+        if not self.tile_size or (width <= self.tile_size and height <= self.tile_size):
+            return None
+        return tile_grid(width, height, self.tile_size, self.tile_overlap)
+
+
+def _tile_starts(length, tile, step):
+    if length <= tile:
+        return [0]
+    starts = list(range(0, length - tile, step))
+    # Last tile flush with the edge instead of running past it
+    starts.append(length - tile)
+    return starts
+
+
+def tile_grid(width, height, tile_size, overlap):
+    """
+    Overlapping tiles covering a frame
+
+    Args:
+        width, height: Frame size
+        tile_size: Tile side in frame pixels
+        overlap: Fraction of a tile shared with its neighbour (0 to 0.5)
+
+    Returns:
+        List of (x0, y0, x1, y1)
+    """
+    overlap = min(max(overlap, 0.0), 0.5)
+    step = max(1, int(tile_size * (1 - overlap)))
+    tile_w, tile_h = min(tile_size, width), min(tile_size, height)
+    return [
+        (x, y, x + tile_w, y + tile_h)
+        for y in _tile_starts(height, tile_h, step)
+        for x in _tile_starts(width, tile_w, step)
+    ]
+
+
+def box_iou(a, b):
+    """Intersection over union of two (x, y, w, h) boxes"""
+    ix = max(0, min(a[0] + a[2], b[0] + b[2]) - max(a[0], b[0]))
+    iy = max(0, min(a[1] + a[3], b[1] + b[3]) - max(a[1], b[1]))
+    intersection = ix * iy
+    union = a[2] * a[3] + b[2] * b[3] - intersection
+    return intersection / union if union else 0.0
+
+
+def _cut_by_tile(box, tile, width, height):
+    """Whether a frame-space box touches a tile edge that is not also a frame edge"""
+    x, y, w, h = box
+    x0, y0, x1, y1 = tile
+    return (
+        (x0 > 0 and x - x0 <= EDGE_MARGIN) or
+        (y0 > 0 and y - y0 <= EDGE_MARGIN) or
+        (x1 < width and x1 - (x + w) <= EDGE_MARGIN) or
+        (y1 < height and y1 - (y + h) <= EDGE_MARGIN)
+    )
+
+
+def merge_detections(candidates, nms_threshold, containment_threshold=0.6):
+    """
+    Merge detections from overlapping tiles
+
+    A plate in an overlap is found by both tiles, and a plate cut by a tile
+    edge appears as a partial box inside the full one. Boxes are kept
+    greedily, complete ones before cut ones and then by confidence, and a
+    box is dropped when its IoU with a kept box exceeds `nms_threshold` or
+    when most of it (intersection over the smaller box) lies inside one.
+
+    Args:
+        candidates: List of ((x, y, w, h, confidence), cut) in frame pixels
+
+    Returns:
+        List of (x, y, w, h, confidence)
+    """
+    ordered = sorted(candidates, key=lambda c: (c[1], -c[0][4]))
+    kept = []
+    for detection, _ in ordered:
+        x, y, w, h, _ = detection
+        duplicate = False
+        for kx, ky, kw, kh, _ in kept:
+            ix = max(0, min(x + w, kx + kw) - max(x, kx))
+            iy = max(0, min(y + h, ky + kh) - max(y, ky))
+            intersection = ix * iy
+            if not intersection:
+                continue
+            union = w * h + kw * kh - intersection
+            if intersection / union > nms_threshold or intersection / min(w * h, kw * kh) > containment_threshold:
+                duplicate = True
+                break
+        if not duplicate:
+            kept.append(detection)
+    return kept
+
+
+def detect_frame(detector, image, profile, nms_threshold, full_frame=True, supports_tiling=True):
+    """
+    Detect plates in a frame according to a camera's inference profile
+
+    Args:
+        detector: Backend or BatchScheduler (anything with detect_batch)
+        image: BGR frame
+        profile: InferenceProfile
+        nms_threshold: IoU above which overlapping tile detections are merged
+        full_frame: Also infer the whole frame alongside its tiles
+        supports_tiling: False for backends whose boxes ignore image content
+
+    Returns:
+        List of (x, y, w, h, confidence) in frame pixels
+    """
+    height, width = image.shape[:2]
+    tiles = profile.tiles(width, height) if supports_tiling else None
+    if not tiles:
+        return detector.detect_batch([image], profile.input_size)[0]
+
+    # Tile crops are views into the frame; nothing is copied until blob creation
+    crops = [image[y0:y1, x0:x1] for x0, y0, x1, y1 in tiles]
+    if full_frame:
+        crops.append(image)
+    results = detector.detect_batch(crops, profile.input_size)
+
+    candidates = []
+    for tile, detections in zip(tiles, results):
+        x0, y0 = tile[0], tile[1]
+        for x, y, w, h, confidence in detections:
+            box = (x + x0, y + y0, w, h)
+            candidates.append(((*box, confidence), _cut_by_tile(box, tile, width, height)))
+    if full_frame:
+        candidates.extend((detection, False) for detection in results[-1])
+    return merge_detections(candidates, nms_threshold)
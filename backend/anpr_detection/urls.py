@@ -11,4 +11,9 @@ router.register(r'detections', views.DetectionViewSet)
 urlpatterns = [
     path('', include(router.urls)),
     path('process-image/', views.process_image, name='process-image'),
+    path('process-image/async/', views.process_image_async, name='process-image-async'),
+    path('events/', views.event_stream, name='events'),
+    path('events/stats/', views.event_stream_stats, name='events-stats'),
+    path('cache/stats/', views.cache_stats_view, name='cache-stats'),
+    path('pipeline/stats/', views.pipeline_stats, name='pipeline-stats'),
 ]
\ No newline at end of file
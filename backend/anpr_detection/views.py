@@ -3,19 +3,45 @@ Views for ANPR detection API
 """
 import os
 import cv2
+import asyncio
+import json
+import uuid
 import logging
 import base64
 import numpy as np
+from datetime import timedelta
 from django.conf import settings
-from django.http import JsonResponse
+from django.core.serializers.json import DjangoJSONEncoder
+from django.http import HttpResponse, JsonResponse, StreamingHttpResponse
+from django.utils import timezone
+from django.views.decorators.csrf import csrf_exempt
 from rest_framework import viewsets, filters
 from rest_framework.decorators import api_view, action, parser_classes
 from rest_framework.response import Response
+from rest_framework.views import APIView
 from rest_framework.parsers import MultiPartParser, FormParser
 from django_filters.rest_framework import DjangoFilterBackend
+from anpr_cameras.models import Camera
 from .models import Detection
-from .serializers import DetectionSerializer
+from .serializers import DetectionSerializer, PlateHistoryQuerySerializer, CorrelationQuerySerializer
+from .filters import DetectionFilter
 from .services import ANPRDetector
+from .pagination import TimestampCursorPagination
+from .inference import InferenceExecutor, InferenceRejected
+from .rollups import dashboard_stats
+from .correlation import plate_history, correlate_cameras
+from .events import EventBroker, Subscription, EVENT_TYPES
+from .plate_search import PlateSearchError
+from anpr_backend.caching import cached_response, cache_stats
+from .metrics import PipelineMetrics
+from .prefilter import prefilter_summary
+from .quality import quality_summary
+from .ocr_cache import ocr_cache_summary
+from .ocr import ocr_summary
+from .plate_format import plate_format_summary
+from .consensus import consensus_summary
+from .pipeline import pipeline_summary
+from .stream_processor import StreamManager
 
 # Configure logger
 logger = logging.getLogger('anpr_detection')
@@ -24,40 +50,236 @@ class DetectionViewSet(viewsets.ModelViewSet):
     """
     API endpoint for license plate detections
     """
-    queryset = Detection.objects.all().order_by('-timestamp')
+    queryset = Detection.objects.select_related('camera').order_by('-timestamp', '-id')
     serializer_class = DetectionSerializer
+    pagination_class = TimestampCursorPagination
     filter_backends = [DjangoFilterBackend, filters.OrderingFilter]
-    filterset_fields = ['plate_number', 'camera', 'is_blacklisted', 'processed']
+    filterset_class = DetectionFilter
     ordering_fields = ['timestamp', 'confidence']
     
-    def get_queryset(self):
-        """Filter queryset based on query parameters"""
-        queryset = super().get_queryset()
-        
-        # Filter by date range
-        start_date = self.request.query_params.get('start_date', None)
-        end_date = self.request.query_params.get('end_date', None)
-        
-        if start_date:
-            queryset = queryset.filter(timestamp__gte=start_date)
-        if end_date:
-            queryset = queryset.filter(timestamp__lte=end_date)
-            
-        return queryset
-    
     @action(detail=False, methods=['get'])
+    @cached_response('detections')
     def recent(self, request):
         """Get recent detections"""
-        recent_detections = Detection.objects.all().order_by('-timestamp')[:10]
+        recent_detections = Detection.objects.select_related('camera').order_by('-timestamp', '-id')[:10]
         serializer = self.get_serializer(recent_detections, many=True)
         return Response(serializer.data)
     
     @action(detail=False, methods=['get'])
     def blacklisted(self, request):
         """Get blacklisted detections"""
-        blacklisted = Detection.objects.filter(blacklist_flag=True).order_by('-timestamp')
-        serializer = self.get_serializer(blacklisted, many=True)
-        return Response(serializer.data)
+        blacklisted = Detection.objects.select_related('camera').filter(
+            blacklist_flag=True
+        ).order_by('-timestamp', '-id')
+        page = self.paginate_queryset(blacklisted)
+        serializer = self.get_serializer(page, many=True)
+        return self.get_paginated_response(serializer.data)
+    
+    @action(detail=False, methods=['get'])
+    def history(self, request):
+        """
+        Journey timeline of one plate: ?plate=MH12AB1234&days=7
+        """
+        params = PlateHistoryQuerySerializer(data=request.query_params)
+        params.is_valid(raise_exception=True)
+        
+        since = timezone.now() - timedelta(days=params.validated_data['days'])
+        return Response(plate_history(
+            params.validated_data['plate'].upper(), since, params.validated_data['limit']
+        ))
+    
+    @action(detail=False, methods=['get'])
+    def correlate(self, request):
+        """
+        Plates seen at camera_a then camera_b within `window` seconds, with
+        travel time statistics: ?camera_a=1&camera_b=2&window=600
+        """
+        params = CorrelationQuerySerializer(data=request.query_params)
+        params.is_valid(raise_exception=True)
+        data = params.validated_data
+        
+        return Response(correlate_cameras(
+            data['camera_a'], data['camera_b'], data['start_date'], data['end_date'],
+            timedelta(seconds=data['window']), max_pairs=data['pairs']
+        ))
+
+
+class StatsView(APIView):
+    """
+    API endpoint for dashboard statistics, answered from hourly rollups
+    
+    Query parameters:
+        hours: Size of the recent window (default 24, max 2160)
+        camera: Optional camera ID to restrict the statistics to
+    """
+    def get(self, request):
+        try:
+            hours = min(max(int(request.query_params.get('hours', 24)), 1), 2160)
+        except ValueError:
+            return Response({'error': 'hours must be an integer'}, status=400)
+        camera_id = request.query_params.get('camera', None)
+        
+        now = timezone.now()
+        today_start = timezone.localtime(now).replace(hour=0, minute=0, second=0, microsecond=0)
+        
+        return Response({
+            'today': dashboard_stats(today_start, camera_id),
+            'recent': dashboard_stats(now - timedelta(hours=hours), camera_id),
+            'cameras': {
+                'total': Camera.objects.count(),
+                'active': Camera.objects.filter(is_active=True).count(),
+            },
+        })
+
+
+# Supported values for the ``response`` option of process_image
+RESPONSE_MODES = ('detections-only', 'crop-thumbnails', 'annotated')
+THUMBNAIL_MAX_WIDTH = 160
+
+
+def _encode_jpeg(image, quality=90):
+    """Encode an image as JPEG bytes"""
+    success, buffer = cv2.imencode('.jpg', image, [cv2.IMWRITE_JPEG_QUALITY, quality])
+    if not success:
+        raise ValueError("Failed to encode image as JPEG")
+    return buffer.tobytes()
+
+
+def _encode_thumbnail(image, box):
+    """Encode a small base64 JPEG of a detected plate region"""
+    x, y, w, h = box
+    crop = image[max(0, y):min(y+h, image.shape[0]), max(0, x):min(x+w, image.shape[1])]
+    if crop.size == 0:
+        return None
+        
+    if crop.shape[1] > THUMBNAIL_MAX_WIDTH:
+        scale = THUMBNAIL_MAX_WIDTH / crop.shape[1]
+        crop = cv2.resize(crop, (THUMBNAIL_MAX_WIDTH, max(1, int(crop.shape[0] * scale))),
+                          interpolation=cv2.INTER_AREA)
+    return base64.b64encode(_encode_jpeg(crop, quality=80)).decode('ascii')
+
+
+def _multipart_response(payload, image_bytes):
+    """
+    Build a multipart/mixed response with a JSON part and a binary JPEG part
+    """
+    boundary = uuid.uuid4().hex
+    json_part = json.dumps(payload, cls=DjangoJSONEncoder).encode('utf-8')
+    body = b''.join([
+        f'--{boundary}\r\nContent-Type: application/json\r\n\r\n'.encode('ascii'),
+        json_part,
+        f'\r\n--{boundary}\r\nContent-Type: image/jpeg\r\n'
+        f'Content-Disposition: attachment; filename="annotated.jpg"\r\n\r\n'.encode('ascii'),
+        image_bytes,
+        f'\r\n--{boundary}--\r\n'.encode('ascii'),
+    ])
+    return HttpResponse(body, content_type=f'multipart/mixed; boundary={boundary}')
+
+
+def _parse_image_request(files, params):
+    """
+    Validate an image upload request without reading the image, so an async
+    view can leave the upload's decode to its inference job
+    
+    Args:
+        files: Uploaded files (request.FILES)
+        params: Query/form parameters, checked in order
+        
+    Returns:
+        Tuple of (upload, camera_id, response_mode, error_response)
+    """
+    if 'image' not in files:
+        return None, None, None, JsonResponse({'error': 'No image provided'}, status=400)
+    
+    response_mode = next((p.get('response') for p in params if p.get('response')), 'detections-only')
+    if response_mode not in RESPONSE_MODES:
+        error = f"Invalid response mode, expected one of: {', '.join(RESPONSE_MODES)}"
+        return None, None, None, JsonResponse({'error': error}, status=400)
+    
+    # Get camera ID (optional)
+    camera_id = next((p.get('camera_id') for p in params if p.get('camera_id')), None)
+    
+    return files['image'], camera_id, response_mode, None
+
+
+def _decode_image(upload):
+    """Read and decode an uploaded image; None if it is not a valid image"""
+    nparr = np.frombuffer(upload.read(), np.uint8)
+    return cv2.imdecode(nparr, cv2.IMREAD_COLOR)
+
+
+def _detect_upload(upload, camera_id, response_mode):
+    """
+    Decode an upload and run detection on it
+    
+    Returns:
+        Tuple of (payload dict, annotated JPEG bytes or None), or None if the
+        upload is not a valid image
+    """
+    image = _decode_image(upload)
+    if image is None:
+        return None
+    return _run_detection(image, camera_id, response_mode)
+
+
+def _invalid_image_response():
+    return JsonResponse({'error': 'Invalid image format'}, status=400)
+
+
+def _run_detection(image, camera_id, response_mode):
+    """
+    Run the ANPR pipeline on an image and build the response payload
+    
+    Returns:
+        Tuple of (payload dict, annotated JPEG bytes or None)
+    """
+    # Process image with ANPR detector, drawing annotations only when requested;
+    # the camera's inference size and tiling apply when it is known
+    camera = Camera.objects.filter(id=camera_id).first() if camera_id else None
+    detector = ANPRDetector(camera=camera)
+    annotate = response_mode == 'annotated'
+    
+    # Save detections if camera_id is provided
+    outputs = ['detections']
+    if camera_id:
+        outputs.append('saved')
+    if annotate:
+        outputs.append('annotated')
+    context = detector.pipeline.run(image, camera_id, outputs)
+    detections = context.detections
+    saved_detections = [
+        {
+            'id': detection_obj.id,
+            'plate_number': detection_obj.plate_number,
+            'confidence': detection_obj.confidence,
+            'blacklist_flag': detection_obj.blacklist_flag
+        } for detection_obj in context.saved
+    ]
+    
+    payload = {
+        'detections': [
+            {
+                'plate_number': d['plate_number'],
+                'confidence': d['confidence'],
+                'box': d['box']
+            } for d in detections
+        ],
+        'saved_detections': saved_detections,
+    }
+    
+    if response_mode == 'crop-thumbnails':
+        for entry, d in zip(payload['detections'], detections):
+            entry['thumbnail'] = _encode_thumbnail(image, d['box'])
+    
+    annotated_bytes = _encode_jpeg(context.annotated) if annotate else None
+    return payload, annotated_bytes
+
+
+def _detection_response(payload, annotated_bytes):
+    """Return the detection payload as JSON, or multipart when an annotated image is included"""
+    if annotated_bytes is not None:
+        return _multipart_response(payload, annotated_bytes)
+    return JsonResponse(payload)
 
 
 @api_view(['POST'])
@@ -65,59 +287,183 @@ class DetectionViewSet(viewsets.ModelViewSet):
 def process_image(request):
     """
     Process an uploaded image for license plate detection
-    """
-    if 'image' not in request.FILES:
-        return JsonResponse({'error': 'No image provided'}, status=400)
     
+    The ``response`` option selects what is returned alongside the detections:
+    ``detections-only`` (default), ``crop-thumbnails`` (small base64 JPEG per
+    plate) or ``annotated`` (multipart/mixed with the annotated frame as a
+    binary image/jpeg part).
+    """
     try:
-        # Get image file
-        image_file = request.FILES['image']
-        
-        # Read image
-        image_bytes = image_file.read()
-        nparr = np.frombuffer(image_bytes, np.uint8)
-        image = cv2.imdecode(nparr, cv2.IMREAD_COLOR)
-        
-        if image is None:
-            return JsonResponse({'error': 'Invalid image format'}, status=400)
+        upload, camera_id, response_mode, error = _parse_image_request(
+            request.FILES, [request.query_params, request.data]
+        )
+        if error:
+            return error
         
-        # Get camera ID (optional)
-        camera_id = request.data.get('camera_id', None)
+        result = _detect_upload(upload, camera_id, response_mode)
+        if result is None:
+            return _invalid_image_response()
+        return _detection_response(*result)
         
-        # Process image with ANPR detector
-        detector = ANPRDetector()
-        result_image, detections = detector.process_frame(image, camera_id)
-        
-        # Save detections if camera_id is provided
-        saved_detections = []
-        if camera_id:
-            for detection_data in detections:
-                detection_obj = detector.save_detection(detection_data, image)
-                if detection_obj:
-                    saved_detections.append({
-                        'id': detection_obj.id,
-                        'plate_number': detection_obj.plate_number,
-                        'confidence': detection_obj.confidence,
-                        'is_blacklisted': detection_obj.is_blacklisted
-                    })
-        
-        # Encode result image to base64
-        _, buffer = cv2.imencode('.jpg', result_image)
-        result_image_b64 = base64.b64encode(buffer).decode('utf-8')
+    except Exception as e:
+        logger.error(f"Error processing image: {str(e)}")
+        return JsonResponse({'error': str(e)}, status=500)
+
+
+@csrf_exempt
+async def process_image_async(request):
+    """
+    Async variant of process_image for ASGI deployments
+    
+    Decoding and inference run on the bounded InferenceExecutor pool so the
+    event loop (shared with the event streams) stays free; only parameters
+    are checked before admission, so a rejected request costs no decode. Requests over the in-flight limit get 429 and requests that
+    would miss the queue-wait deadline get 503, both with Retry-After.
+    Queue wait and service time are reported separately in the ``timing``
+    field and the Server-Timing header.
+    """
+    if request.method != 'POST':
+        return JsonResponse({'error': 'Method not allowed'}, status=405)
+    
+    try:
+        upload, camera_id, response_mode, error = _parse_image_request(
+            request.FILES, [request.GET, request.POST]
+        )
+        if error:
+            return error
         
-        # Return results
-        return JsonResponse({
-            'detections': [
-                {
-                    'plate_number': d['plate_number'],
-                    'confidence': d['confidence'],
-                    'box': d['box']
-                } for d in detections
-            ],
-            'saved_detections': saved_detections,
-            'result_image': result_image_b64
-        })
+        executor = InferenceExecutor()
+        result, queue_wait, service_time = await executor.run(
+            _detect_upload, upload, camera_id, response_mode
+        )
+        if result is None:
+            return _invalid_image_response()
+        payload, annotated_bytes = result
         
+    except InferenceRejected as e:
+        response = JsonResponse({'error': str(e), 'load': InferenceExecutor().stats()}, status=e.status)
+        response['Retry-After'] = str(e.retry_after)
+        return response
     except Exception as e:
         logger.error(f"Error processing image: {str(e)}")
         return JsonResponse({'error': str(e)}, status=500)
+    
+    payload['timing'] = {
+        'queue_wait_ms': round(queue_wait * 1000, 1),
+        'service_ms': round(service_time * 1000, 1),
+    }
+    response = _detection_response(payload, annotated_bytes)
+    response['Server-Timing'] = (
+        f"queue;dur={queue_wait * 1000:.1f}, service;dur={service_time * 1000:.1f}"
+    )
+    return response
+
+
+# Seconds between keepalive comments on idle event streams
+EVENT_STREAM_HEARTBEAT = 15
+EVENT_STREAM_FILTERS = ('plate_search', 'blacklist_flag', 'start_date', 'end_date')
+
+
+async def event_stream(request):
+    """
+    Server-Sent Events stream of new detections and alerts (ASGI only)
+    
+    Query parameters:
+        camera: Camera ID(s) to follow, repeatable or comma-separated (default all)
+        blacklist_only: Only blacklisted detections and alerts
+        types: Comma-separated event types (default "detection,alert")
+        plate_search, blacklist_flag, start_date, end_date: As for the
+            detection list, so a page only receives rows matching its filters
+    
+    Reconnecting clients send Last-Event-ID (EventSource does this
+    automatically) and receive the events they missed, or a ``reset`` event
+    when those are no longer held and the client should reload.
+    """
+    if request.method != 'GET':
+        return JsonResponse({'error': 'Method not allowed'}, status=405)
+    
+    try:
+        camera_ids = {
+            int(value) for param in request.GET.getlist('camera')
+            for value in param.split(',') if value.strip()
+        }
+        last_event_id = request.headers.get('Last-Event-ID') or request.GET.get('last_event_id')
+        last_event_id = int(last_event_id) if last_event_id else None
+    except ValueError:
+        return JsonResponse({'error': 'camera and Last-Event-ID must be integers'}, status=400)
+    
+    types = {t.strip() for t in request.GET.get('types', ','.join(EVENT_TYPES)).split(',') if t.strip()}
+    if not types or not types <= set(EVENT_TYPES):
+        return JsonResponse({'error': f"types must be a subset of {', '.join(EVENT_TYPES)}"}, status=400)
+    
+    # Validate the list filters with the list's own filter schema
+    filterset = DetectionFilter(
+        {key: request.GET[key] for key in EVENT_STREAM_FILTERS if key in request.GET},
+        queryset=Detection.objects.none(),
+    )
+    if not filterset.is_valid():
+        return JsonResponse(filterset.errors, status=400)
+    
+    broker = EventBroker()
+    try:
+        subscription = Subscription(
+            asyncio.get_running_loop(),
+            camera_ids=camera_ids,
+            blacklist_only=request.GET.get('blacklist_only', '').lower() in ('1', 'true'),
+            types=types,
+            **{key: filterset.form.cleaned_data[key] for key in EVENT_STREAM_FILTERS},
+        )
+    except PlateSearchError as e:
+        return JsonResponse({'plate_search': [str(e)]}, status=400)
+    replay, reset = broker.subscribe(subscription, last_event_id)
+    
+    async def stream():
+        try:
+            yield b"retry: 3000\n\n"
+            if reset:
+                yield f"id: {broker.last_id}\nevent: reset\ndata: {{}}\n\n".encode('utf-8')
+            for event in replay:
+                yield event.encode()
+                
+            while not (subscription.overflowed and subscription.queue.empty()):
+                try:
+                    event = await asyncio.wait_for(subscription.queue.get(), EVENT_STREAM_HEARTBEAT)
+                except asyncio.TimeoutError:
+                    yield b": keepalive\n\n"
+                    continue
+                yield event.encode()
+            
+            # Fell behind: close so the client resumes from its last event id
+            logger.warning("Closing event stream whose buffer overflowed")
+        finally:
+            broker.unsubscribe(subscription)
+    
+    response = StreamingHttpResponse(stream(), content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    response['X-Accel-Buffering'] = 'no'
+    return response
+
+
+def event_stream_stats(request):
+    """Live event broker statistics (subscribers, published and dropped events)"""
+    return JsonResponse(EventBroker().stats())
+
+
+def pipeline_stats(request):
+    """Per-camera pipeline counters and stage timings since startup"""
+    cameras = PipelineMetrics().snapshot()
+    for stats in cameras.values():
+        stats['prefilter'] = prefilter_summary(stats)
+        stats['quality'] = quality_summary(stats)
+        stats['ocr_cache'] = ocr_cache_summary(stats)
+        stats['ocr'] = ocr_summary(stats)
+        stats['plate_format'] = plate_format_summary(stats)
+        stats['consensus'] = consensus_summary(stats)
+        stats['pipeline'] = pipeline_summary(stats)
+    frame_buffers = {str(camera_id): stats for camera_id, stats in StreamManager().buffer_stats().items()}
+    return JsonResponse({'cameras': cameras, 'frame_buffers': frame_buffers})
+
+
+def cache_stats_view(request):
+    """API response cache statistics (hits, misses, 304s, invalidations)"""
+    return JsonResponse(cache_stats())
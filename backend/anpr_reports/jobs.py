@@ -0,0 +1,176 @@
+"""
+Background report generation jobs
+"""
+import os
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from django.conf import settings
+from django.db import close_old_connections
+from django.utils import timezone
+from anpr_detection.models import Detection
+from .models import Report, get_report_path
+from .exports import CSV_HEADER, date_range_bounds, detection_rows, iter_csv
+
+logger = logging.getLogger(__name__)
+
+# Formats that can be materialized by a background job, with their file extension
+SUPPORTED_FORMATS = {
+    'csv': 'csv',
+    'excel': 'xlsx',
+}
+
+PROGRESS_UPDATE_ROWS = 10000
+
+
+def write_csv(path, rows):
+    """Write report rows to a CSV file"""
+    with open(path, 'wb') as f:
+        for chunk in iter_csv(rows):
+            f.write(chunk)
+
+
+def write_excel(path, rows):
+    """Write report rows to an .xlsx file using openpyxl's streaming write-only mode"""
+    try:
+        from openpyxl import Workbook
+    except ImportError:
+        raise RuntimeError("Excel reports require the openpyxl package")
+
+    workbook = Workbook(write_only=True)
+    sheet = workbook.create_sheet('Detections')
+    sheet.append(CSV_HEADER)
+    for row in rows:
+        sheet.append(row)
+    workbook.save(path)
+
+
+WRITERS = {
+    'csv': write_csv,
+    'excel': write_excel,
+}
+
+
+class ReportJobManager:
+    """
+    Run report generation on a local thread pool and store the results in
+    MEDIA_ROOT/reports
+
+    Requests for a report that already has a queued or running job, or for
+    a closed date range that already has a finished file, reuse that report
+    instead of starting a new job. A report's status alone does not count as
+    a job: rows created through the plain API stay 'pending', as do jobs
+    cut short by a restart.
+    """
+    _instance = None
+    _instance_lock = threading.Lock()
+
+    def __new__(cls):
+        with cls._instance_lock:
+            if cls._instance is None:
+                instance = super(ReportJobManager, cls).__new__(cls)
+                workers = getattr(settings, 'ANPR_REPORTS', {}).get('WORKERS', 2)
+                instance.pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='anpr-report')
+                instance.lock = threading.RLock()
+                instance.jobs = {}  # Report ID -> Future
+                cls._instance = instance
+        return cls._instance
+
+    def submit(self, report_type, format_type, start_date, end_date, generated_by=None):
+        """
+        Queue a report job, deduplicating identical requests
+
+        Returns:
+            Tuple of (Report, created) where created is False when an
+            existing report was reused
+        """
+        if format_type not in SUPPORTED_FORMATS:
+            raise ValueError(f"Unsupported report format: {format_type}")
+
+        with self.lock:
+            matching = Report.objects.filter(
+                report_type=report_type,
+                format_type=format_type,
+                start_date=start_date,
+                end_date=end_date,
+            )
+
+            existing = matching.filter(id__in=list(self.jobs)).first()
+            if existing:
+                return existing, False
+
+            # Ranges that have ended can't gain new detections, so their files stay valid
+            if end_date < timezone.localdate():
+                completed = matching.filter(status='completed').exclude(file_path='').exclude(
+                    file_path__isnull=True).first()
+                if completed and os.path.exists(completed.file_path.path):
+                    return completed, False
+
+            report = Report.objects.create(
+                title=f"{report_type.capitalize()} Report {start_date:%Y-%m-%d} to {end_date:%Y-%m-%d}",
+                description=f"Auto-generated {report_type} report",
+                report_type=report_type,
+                format_type=format_type,
+                start_date=start_date,
+                end_date=end_date,
+                generated_by=generated_by,
+                status='pending',
+            )
+            self._enqueue(report.id)
+            return report, True
+
+    def _enqueue(self, report_id):
+        future = self.pool.submit(self._run, report_id)
+        self.jobs[report_id] = future
+        future.add_done_callback(lambda _: self._forget(report_id))
+
+    def _forget(self, report_id):
+        with self.lock:
+            self.jobs.pop(report_id, None)
+
+    def _run(self, report_id):
+        """Generate the file for a report inside a worker thread"""
+        close_old_connections()
+        tmp_path = None
+        try:
+            report = Report.objects.get(id=report_id)
+            Report.objects.filter(id=report_id).update(status='running', progress=0)
+
+            start, end = date_range_bounds(report.start_date, report.end_date)
+            total = Detection.objects.filter(timestamp__gte=start, timestamp__lte=end).count()
+
+            rel_path = get_report_path(report, f"report.{SUPPORTED_FORMATS[report.format_type]}")
+            abs_path = os.path.join(settings.MEDIA_ROOT, rel_path)
+            os.makedirs(os.path.dirname(abs_path), exist_ok=True)
+            tmp_path = f"{abs_path}.part"
+
+            counter = {'rows': 0}
+            rows = self._track_progress(report_id, detection_rows(start, end), total, counter)
+            WRITERS[report.format_type](tmp_path, rows)
+            os.replace(tmp_path, abs_path)
+
+            Report.objects.filter(id=report_id).update(
+                status='completed',
+                progress=100,
+                row_count=counter['rows'],
+                file_path=rel_path,
+                completed_at=timezone.now(),
+            )
+            logger.info(f"Report {report_id} written to {rel_path} ({counter['rows']} rows)")
+
+        except Exception as e:
+            logger.error(f"Report job {report_id} failed: {str(e)}")
+            Report.objects.filter(id=report_id).update(status='failed', error_message=str(e))
+            if tmp_path and os.path.exists(tmp_path):
+                os.remove(tmp_path)
+        finally:
+            close_old_connections()
+
+    def _track_progress(self, report_id, rows, total, counter):
+        """Pass rows through while periodically recording progress on the Report row"""
+        for row in rows:
+            counter['rows'] += 1
+            if counter['rows'] % PROGRESS_UPDATE_ROWS == 0 and total:
+                progress = min(99, int(counter['rows'] * 100 / total))
+                Report.objects.filter(id=report_id).update(progress=progress, row_count=counter['rows'])
+            yield row
@@ -0,0 +1,67 @@
+"""
+Management command to benchmark streaming CSV report export
+"""
+import time
+import tracemalloc
+from datetime import timedelta
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+from anpr_detection.benchmarks import seed_detections, clear_benchmark_data
+from anpr_reports.exports import detection_rows, iter_csv, iter_gzip
+
+
+class Command(BaseCommand):
+    help = 'Benchmark streaming CSV report export (rows/sec) on seeded detections'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, default=1000000, help='Detections to seed (default 1,000,000)')
+        parser.add_argument('--cameras', type=int, default=20, help='Benchmark cameras to spread rows over')
+        parser.add_argument('--days', type=int, default=30, help='Days of history to spread rows over')
+        parser.add_argument('--no-seed', action='store_true', help='Reuse previously seeded data')
+        parser.add_argument('--gzip', action='store_true', help='Also benchmark gzip-compressed export')
+        parser.add_argument('--trace-memory', action='store_true',
+                            help='Report peak Python memory during export (slower)')
+        parser.add_argument('--cleanup', action='store_true', help='Delete benchmark data afterwards')
+
+    def handle(self, *args, **options):
+        if not options['no_seed']:
+            self.stdout.write(f"Seeding {options['rows']} detections...")
+            started = time.perf_counter()
+            seed_detections(options['rows'], cameras=options['cameras'], days=options['days'])
+            self.stdout.write(f"Seeded in {time.perf_counter() - started:.1f}s")
+
+        end_date = timezone.now()
+        start_date = end_date - timedelta(days=options['days'])
+
+        self._run("csv", iter_csv(detection_rows(start_date, end_date)), options['trace_memory'])
+        if options['gzip']:
+            self._run("csv.gz", iter_gzip(iter_csv(detection_rows(start_date, end_date))), options['trace_memory'])
+
+        if options['cleanup']:
+            clear_benchmark_data()
+            self.stdout.write("Benchmark data removed")
+
+    def _run(self, label, chunks, trace_memory):
+        if trace_memory:
+            tracemalloc.start()
+
+        rows = -1  # Header line
+        total_bytes = 0
+        started = time.perf_counter()
+        for chunk in chunks:
+            total_bytes += len(chunk)
+            if label == 'csv':
+                rows += chunk.count(b'\n')
+        elapsed = time.perf_counter() - started
+
+        peak = None
+        if trace_memory:
+            _, peak = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+
+        summary = f"{label}: {total_bytes / 1e6:.1f} MB in {elapsed:.2f}s ({total_bytes / 1e6 / elapsed:.1f} MB/s)"
+        if rows >= 0:
+            summary += f", {rows} rows, {rows / elapsed:,.0f} rows/sec"
+        if peak is not None:
+            summary += f", peak memory {peak / 1e6:.1f} MB"
+        self.stdout.write(self.style.SUCCESS(summary))
@@ -27,6 +27,13 @@ class Report(models.Model):
         ('excel', 'Excel'),
     )
     
+    STATUS_CHOICES = (
+        ('pending', 'Pending'),
+        ('running', 'Running'),
+        ('completed', 'Completed'),
+        ('failed', 'Failed'),
+    )
+    
     title = models.CharField(max_length=100)
     description = models.TextField(blank=True, null=True)
     report_type = models.CharField(max_length=20, choices=REPORT_TYPES)
@@ -36,6 +43,11 @@ class Report(models.Model):
     start_date = models.DateField()
     end_date = models.DateField()
     generated_by = models.CharField(max_length=100, blank=True, null=True)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='pending')
+    progress = models.PositiveSmallIntegerField(default=0)  # Percent complete
+    row_count = models.PositiveIntegerField(default=0)
+    error_message = models.TextField(blank=True, null=True)
+    completed_at = models.DateTimeField(blank=True, null=True)
     
     def __str__(self):
         return f"{self.title} ({self.get_report_type_display()})"
@@ -49,3 +61,6 @@ class Report(models.Model):
     
     class Meta:
         ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['report_type', 'format_type', 'start_date', 'end_date', 'status']),
+        ]
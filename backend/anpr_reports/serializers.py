@@ -5,10 +5,13 @@ class ReportSerializer(serializers.ModelSerializer):
     """Serializer for Report model"""
     report_type_display = serializers.CharField(source='get_report_type_display', read_only=True)
     format_type_display = serializers.CharField(source='get_format_type_display', read_only=True)
+    status_display = serializers.CharField(source='get_status_display', read_only=True)
     
     class Meta:
         model = Report
         fields = ['id', 'title', 'description', 'report_type', 'report_type_display',
                   'format_type', 'format_type_display', 'file_path', 'created_at',
-                  'start_date', 'end_date', 'generated_by']
-        read_only_fields = ['created_at', 'file_path']
\ No newline at end of file
+                  'start_date', 'end_date', 'generated_by', 'status', 'status_display',
+                  'progress', 'row_count', 'error_message', 'completed_at']
+        read_only_fields = ['created_at', 'file_path', 'status', 'progress', 'row_count',
+                            'error_message', 'completed_at']
\ No newline at end of file
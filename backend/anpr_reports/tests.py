@@ -1,3 +1,148 @@
-from django.test import TestCase
+import csv
+import gzip
+import io
+import os
+import shutil
+import tempfile
+import threading
+import time
+from datetime import date, datetime
+from django.test import TransactionTestCase
+from django.utils import timezone
+from anpr_cameras.models import Camera
+from anpr_detection.models import Detection
+from .models import Report
+from .jobs import ReportJobManager
 
-# Create your tests here.
+
+def wait_for_report(report_id, timeout=5.0):
+    """Poll a background report until its job has finished"""
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        report = Report.objects.get(id=report_id)
+        if report.status not in ('pending', 'running'):
+            return report
+        time.sleep(0.02)
+    raise AssertionError(f"Report {report_id} did not finish within {timeout}s")
+
+
+def csv_plates(content):
+    """Plate numbers of a report CSV, header skipped"""
+    return [row[0] for row in list(csv.reader(io.StringIO(content.decode('utf-8'))))[1:]]
+
+
+class ExportRangeTests(TransactionTestCase):
+    """Streamed exports and report jobs select the same rows for a range"""
+
+    def setUp(self):
+        self.media = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media)
+        camera = Camera.objects.create(name='Gate', rtsp_url='rtsp://test/stream', location='North')
+        for plate, moment in (('BEFORE01', datetime(2024, 5, 1, 23, 59, 59)),
+                              ('FIRST001', datetime(2024, 5, 2, 0, 0)),
+                              ('LASTDAY1', datetime(2024, 5, 3, 15, 30)),
+                              ('AFTER001', datetime(2024, 5, 4, 0, 0))):
+            Detection.objects.create(plate_number=plate, camera=camera, timestamp=timezone.make_aware(moment))
+        self.dates = {'start_date': '2024-05-02', 'end_date': '2024-05-03'}
+
+    def test_end_date_is_inclusive_for_every_export(self):
+        response = self.client.get('/api/reports/generate_csv/', self.dates)
+        streamed = b''.join(response.streaming_content)
+        self.assertEqual(sorted(csv_plates(streamed)), ['FIRST001', 'LASTDAY1'])
+
+        response = self.client.get('/api/reports/generate_csv/', dict(self.dates, compress='gzip'))
+        self.assertEqual(response['Content-Type'], 'application/gzip')
+        self.assertEqual(gzip.decompress(b''.join(response.streaming_content)), streamed)
+
+        with self.settings(MEDIA_ROOT=self.media):
+            response = self.client.post('/api/reports/generate/', dict(self.dates, report_type='custom'))
+            self.assertEqual(response.status_code, 202)
+            report = wait_for_report(response.json()['id'])
+            with open(report.file_path.path, 'rb') as f:
+                self.assertEqual(f.read(), streamed)
+        self.assertEqual(report.row_count, 2)
+
+
+class ReportJobTests(TransactionTestCase):
+    """Report jobs are deduplicated, written atomically and served when ready"""
+
+    def setUp(self):
+        self.media = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media)
+        camera = Camera.objects.create(name='Gate', rtsp_url='rtsp://test/stream', location='North')
+        Detection.objects.create(plate_number='AB12CDE', camera=camera,
+                                 timestamp=timezone.make_aware(datetime(2024, 5, 2, 12, 0)))
+        self.range = ('custom', 'csv', date(2024, 5, 2), date(2024, 5, 3))
+
+        ReportJobManager._instance = None
+        with self.settings(ANPR_REPORTS={'WORKERS': 1}):
+            self.manager = ReportJobManager()
+        self.addCleanup(setattr, ReportJobManager, '_instance', None)
+        self.addCleanup(self.manager.pool.shutdown)
+
+    def test_identical_requests_share_one_job(self):
+        # Hold the only worker so the job stays queued
+        release = threading.Event()
+        self.manager.pool.submit(release.wait, 5)
+        with self.settings(MEDIA_ROOT=self.media):
+            report, created = self.manager.submit(*self.range)
+            again, created_again = self.manager.submit(*self.range)
+            self.assertEqual((created, created_again), (True, False))
+            self.assertEqual(again.id, report.id)
+            self.assertEqual(list(self.manager.jobs), [report.id])
+
+            release.set()
+            report = wait_for_report(report.id)
+            self.assertEqual((report.status, report.progress, report.row_count), ('completed', 100, 1))
+            # Written to a .part file and renamed into place
+            self.assertEqual(os.listdir(os.path.join(self.media, 'reports')), [os.path.basename(report.file_path.name)])
+
+            # The range has ended, so its file is reused
+            reused, created = self.manager.submit(*self.range)
+            self.assertEqual((reused.id, created), (report.id, False))
+
+    def test_reports_without_a_job_are_not_reused(self):
+        # Created through POST /api/reports/, so pending but never queued
+        response = self.client.post('/api/reports/', {
+            'title': 'Manual', 'report_type': 'custom', 'format_type': 'csv',
+            'start_date': '2024-05-02', 'end_date': '2024-05-03',
+        })
+        self.assertEqual((response.status_code, response.json()['status']), (201, 'pending'))
+
+        with self.settings(MEDIA_ROOT=self.media):
+            report, created = self.manager.submit(*self.range)
+            self.assertTrue(created)
+            self.assertNotEqual(report.id, response.json()['id'])
+            self.assertEqual(wait_for_report(report.id).status, 'completed')
+
+    def test_failed_job_is_reported(self):
+        # MEDIA_ROOT is a file, so the reports directory cannot be created
+        media_file = os.path.join(self.media, 'not-a-directory')
+        open(media_file, 'w').close()
+        with self.settings(MEDIA_ROOT=media_file):
+            report, _ = self.manager.submit(*self.range)
+            report = wait_for_report(report.id)
+        self.assertEqual(report.status, 'failed')
+        self.assertTrue(report.error_message)
+
+        response = self.client.get(f'/api/reports/{report.id}/download/')
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(response.json()['status'], 'failed')
+
+    def test_download_waits_for_the_file_and_notices_it_is_gone(self):
+        with self.settings(MEDIA_ROOT=self.media):
+            pending = Report.objects.create(title='Pending', report_type='custom', format_type='excel',
+                                            start_date=date(2024, 5, 2), end_date=date(2024, 5, 3))
+            response = self.client.get(f'/api/reports/{pending.id}/download/')
+            self.assertEqual((response.status_code, response.json()['status']), (409, 'pending'))
+
+            report, _ = self.manager.submit(*self.range)
+            report = wait_for_report(report.id)
+            response = self.client.get(f'/api/reports/{report.id}/download/')
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(csv_plates(b''.join(response.streaming_content)), ['AB12CDE'])
+            response.close()
+
+            os.remove(report.file_path.path)
+            response = self.client.get(f'/api/reports/{report.id}/download/')
+            self.assertEqual(response.status_code, 410)
@@ -2,12 +2,12 @@ from rest_framework import viewsets, status
 from rest_framework.decorators import action
 from rest_framework.response import Response
 import logging
-import csv
 import os
-from django.http import HttpResponse
+from django.http import FileResponse, StreamingHttpResponse
 from .models import Report
 from .serializers import ReportSerializer
-from anpr_detection.models import Detection
+from .exports import date_range_bounds, detection_rows, iter_csv, iter_gzip
+from .jobs import ReportJobManager, SUPPORTED_FORMATS
 from django.utils import timezone
 from datetime import timedelta
 
@@ -20,56 +20,29 @@ class ReportViewSet(viewsets.ModelViewSet):
     
     @action(detail=False, methods=['get'])
     def generate_csv(self, request):
-        """Generate a CSV report of detections"""
-        # Get query parameters
-        start_date = request.query_params.get('start_date', None)
-        end_date = request.query_params.get('end_date', None)
+        """Stream a CSV report of detections (pass compress=gzip for a .csv.gz)"""
         report_type = request.query_params.get('report_type', 'daily')
+        try:
+            start_date, end_date = _resolve_date_range(request.query_params, report_type)
+        except ValueError:
+            return Response({'error': 'Dates must be in YYYY-MM-DD format'}, status=status.HTTP_400_BAD_REQUEST)
         
-        # Set default dates if not provided
-        if not end_date:
-            end_date = timezone.now()
-        else:
-            end_date = timezone.datetime.strptime(end_date, '%Y-%m-%d')
-            
-        if not start_date:
-            if report_type == 'daily':
-                start_date = end_date - timedelta(days=1)
-            elif report_type == 'weekly':
-                start_date = end_date - timedelta(days=7)
-            elif report_type == 'monthly':
-                start_date = end_date - timedelta(days=30)
-            else:
-                start_date = end_date - timedelta(days=1)
-        else:
-            start_date = timezone.datetime.strptime(start_date, '%Y-%m-%d')
-        
-        # Query detections
-        detections = Detection.objects.filter(
-            timestamp__gte=start_date,
-            timestamp__lte=end_date
-        ).order_by('-timestamp')
+        # Stream rows straight from a chunked query instead of building the file in memory;
+        # end_date is inclusive, as for report jobs
+        compress = request.query_params.get('compress', '').lower() == 'gzip'
+        start, end = date_range_bounds(start_date.date(), end_date.date())
+        chunks = iter_csv(detection_rows(start, end))
+        filename = f"{report_type}_report_{timezone.now().strftime('%Y%m%d')}.csv"
         
-        # Create the HttpResponse object with CSV header
-        response = HttpResponse(content_type='text/csv')
-        response['Content-Disposition'] = f'attachment; filename="{report_type}_report_{timezone.now().strftime("%Y%m%d")}.csv"'
-        
-        # Create CSV writer
-        writer = csv.writer(response)
-        writer.writerow(['Plate Number', 'Timestamp', 'Camera', 'Location', 'Blacklisted'])
-        
-        # Add detection data
-        for detection in detections:
-            writer.writerow([
-                detection.plate_number,
-                detection.timestamp.strftime('%Y-%m-%d %H:%M:%S'),
-                detection.camera.name,
-                detection.camera.location,
-                'Yes' if detection.blacklist_flag else 'No'
-            ])
+        if compress:
+            response = StreamingHttpResponse(iter_gzip(chunks), content_type='application/gzip')
+            filename += '.gz'
+        else:
+            response = StreamingHttpResponse(chunks, content_type='text/csv')
+        response['Content-Disposition'] = f'attachment; filename="{filename}"'
         
         # Log report generation
-        logger.info(f"Generated {report_type} CSV report from {start_date} to {end_date}")
+        logger.info(f"Streaming {report_type} CSV report from {start_date} to {end_date}")
         
         # Create report record in database
         title = f"{report_type.capitalize()} Report {start_date.strftime('%Y-%m-%d')} to {end_date.strftime('%Y-%m-%d')}"
@@ -80,7 +53,88 @@ class ReportViewSet(viewsets.ModelViewSet):
             format_type='csv',
             start_date=start_date.date(),
             end_date=end_date.date(),
-            generated_by=request.user.username if request.user.is_authenticated else 'API'
+            generated_by=request.user.username if request.user.is_authenticated else 'API',
+            status='completed',
+            progress=100
         )
         
         return response
+    
+    @action(detail=False, methods=['post'])
+    def generate(self, request):
+        """
+        Queue a background job that writes a report file to MEDIA_ROOT/reports
+        
+        Identical requests are deduplicated: an already queued or running job,
+        or a finished file for a closed date range, is returned instead.
+        """
+        report_type = request.data.get('report_type', 'daily')
+        format_type = request.data.get('format_type', 'csv')
+        
+        if report_type not in dict(Report.REPORT_TYPES):
+            return Response({'error': f"Invalid report type: {report_type}"}, status=status.HTTP_400_BAD_REQUEST)
+        if format_type not in SUPPORTED_FORMATS:
+            return Response({'error': f"Unsupported report format: {format_type}"},
+                            status=status.HTTP_400_BAD_REQUEST)
+        try:
+            start_date, end_date = _resolve_date_range(request.data, report_type)
+        except ValueError:
+            return Response({'error': 'Dates must be in YYYY-MM-DD format'}, status=status.HTTP_400_BAD_REQUEST)
+        
+        report, created = ReportJobManager().submit(
+            report_type,
+            format_type,
+            start_date.date(),
+            end_date.date(),
+            generated_by=request.user.username if request.user.is_authenticated else 'API'
+        )
+        
+        serializer = self.get_serializer(report)
+        if created or report.status != 'completed':
+            return Response(serializer.data, status=status.HTTP_202_ACCEPTED)
+        return Response(serializer.data)
+    
+    @action(detail=True, methods=['get'])
+    def download(self, request, pk=None):
+        """Serve a finished report file from storage"""
+        report = self.get_object()
+        
+        if report.status != 'completed' or not report.file_path:
+            return Response({'status': report.status, 'progress': report.progress,
+                             'error': report.error_message},
+                            status=status.HTTP_409_CONFLICT)
+        
+        if not os.path.exists(report.file_path.path):
+            return Response({'error': 'Report file is missing'}, status=status.HTTP_410_GONE)
+        
+        return FileResponse(open(report.file_path.path, 'rb'), as_attachment=True,
+                            filename=os.path.basename(report.file_path.name))
+
+
+def _resolve_date_range(params, report_type):
+    """
+    Resolve start/end datetimes from YYYY-MM-DD parameters, defaulting the
+    start from the report type when it is not given
+    """
+    start_date = params.get('start_date', None)
+    end_date = params.get('end_date', None)
+    
+    # Set default dates if not provided
+    if not end_date:
+        end_date = timezone.now()
+    else:
+        end_date = timezone.datetime.strptime(end_date, '%Y-%m-%d')
+        
+    if not start_date:
+        if report_type == 'daily':
+            start_date = end_date - timedelta(days=1)
+        elif report_type == 'weekly':
+            start_date = end_date - timedelta(days=7)
+        elif report_type == 'monthly':
+            start_date = end_date - timedelta(days=30)
+        else:
+            start_date = end_date - timedelta(days=1)
+    else:
+        start_date = timezone.datetime.strptime(start_date, '%Y-%m-%d')
+        
+    return start_date, end_date
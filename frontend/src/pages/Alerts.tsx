@@ -25,7 +25,7 @@ import {
   CheckCircle as CheckCircleIcon,
   Refresh as RefreshIcon,
 } from '@mui/icons-material';
-import { alertAPI, Alert } from '../services/api';
+import { alertAPI, Alert, subscribeEvents } from '../services/api';
 
 const Alerts: React.FC = () => {
   const [alerts, setAlerts] = useState<Alert[]>([]);
@@ -34,6 +34,12 @@ const Alerts: React.FC = () => {
 
   useEffect(() => {
     fetchAlerts();
+
+    // New alerts are pushed instead of re-fetching the list
+    return subscribeEvents({
+      alert: (alert) => setAlerts((current) => [alert, ...current]),
+      reset: () => fetchAlerts(),
+    });
   }, []);
 
   const fetchAlerts = async () => {
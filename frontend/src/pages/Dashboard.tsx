@@ -19,7 +19,7 @@ import {
   Warning as WarningIcon,
   Block as BlockIcon,
 } from '@mui/icons-material';
-import { detectionAPI, cameraAPI, alertAPI, Detection, Camera, Alert } from '../services/api';
+import { detectionAPI, alertAPI, Detection } from '../services/api';
 
 interface StatCard {
   title: string;
@@ -46,26 +46,23 @@ const Dashboard: React.FC = () => {
     try {
       setLoading(true);
       
-      // Fetch cameras
-      const camerasResponse = await cameraAPI.getAll();
-      const cameras = camerasResponse.data;
+      // Counters come from the hourly rollups behind /api/stats/
+      const statsResponse = await detectionAPI.getStats();
+      const summary = statsResponse.data;
       
       // Fetch recent detections
       const detectionsResponse = await detectionAPI.getAll({ limit: 10 });
-      const detections = detectionsResponse.data;
+      const detections = detectionsResponse.data.results;
       
       // Fetch alerts
       const alertsResponse = await alertAPI.getAll({ is_resolved: false });
       const alerts = alertsResponse.data;
       
-      // Calculate stats
-      const blacklistedCount = detections.filter(d => d.is_blacklisted).length;
-      
       setStats({
-        totalCameras: cameras.length,
-        totalDetections: detections.length,
+        totalCameras: summary.cameras.total,
+        totalDetections: summary.today.detections,
         activeAlerts: alerts.length,
-        blacklistedDetections: blacklistedCount,
+        blacklistedDetections: summary.today.blacklist_hits,
       });
       
       setRecentDetections(detections.slice(0, 5));
@@ -24,7 +24,7 @@ import {
   Search as SearchIcon,
   FilterList as FilterIcon,
 } from '@mui/icons-material';
-import { detectionAPI, Detection } from '../services/api';
+import { detectionAPI, Detection, DetectionFilters, subscribeEvents } from '../services/api';
 
 const Detections: React.FC = () => {
   const [detections, setDetections] = useState<Detection[]>([]);
@@ -34,33 +34,24 @@ const Detections: React.FC = () => {
   const [dateFrom, setDateFrom] = useState('');
   const [dateTo, setDateTo] = useState('');
 
+  // Filters last applied with Filter/Reset; the list and the live stream both follow them
+  const [appliedFilters, setAppliedFilters] = useState<DetectionFilters>({});
+
   useEffect(() => {
-    fetchDetections();
-  }, []);
+    fetchDetections(appliedFilters);
+
+    // New detections matching the filters are pushed instead of re-fetching the list
+    return subscribeEvents({
+      detection: (detection) => setDetections((current) => [detection, ...current]),
+      reset: () => fetchDetections(appliedFilters),
+    }, appliedFilters);
+  }, [appliedFilters]);
 
-  const fetchDetections = async () => {
+  const fetchDetections = async (filters: DetectionFilters) => {
     try {
       setLoading(true);
-      const params: any = {};
-      
-      if (searchTerm) {
-        params.plate_number = searchTerm;
-      }
-      
-      if (filterStatus !== 'all') {
-        params.blacklist_flag = filterStatus === 'blacklisted';
-      }
-      
-      if (dateFrom) {
-        params.date_from = dateFrom;
-      }
-      
-      if (dateTo) {
-        params.date_to = dateTo;
-      }
-
-      const response = await detectionAPI.getAll(params);
-      setDetections(response.data);
+      const response = await detectionAPI.getAll(filters);
+      setDetections(response.data.results);
     } catch (error) {
       console.error('Error fetching detections:', error);
     } finally {
@@ -69,7 +60,25 @@ const Detections: React.FC = () => {
   };
 
   const handleSearch = () => {
-    fetchDetections();
+    const filters: DetectionFilters = {};
+    
+    if (searchTerm) {
+      filters.plate_search = searchTerm;
+    }
+    
+    if (filterStatus !== 'all') {
+      filters.blacklist_flag = filterStatus === 'blacklisted';
+    }
+    
+    if (dateFrom) {
+      filters.start_date = dateFrom;
+    }
+    
+    if (dateTo) {
+      filters.end_date = dateTo;
+    }
+
+    setAppliedFilters(filters);
   };
 
   const handleReset = () => {
@@ -77,7 +86,7 @@ const Detections: React.FC = () => {
     setFilterStatus('all');
     setDateFrom('');
     setDateTo('');
-    fetchDetections();
+    setAppliedFilters({});
   };
 
   if (loading) {
@@ -205,7 +214,7 @@ const Detections: React.FC = () => {
                         {detection.plate_number}
                       </Typography>
                     </TableCell>
-                    <TableCell>Camera {detection.camera}</TableCell>
+                    <TableCell>{detection.camera_details?.name ?? `Camera ${detection.camera}`}</TableCell>
                     <TableCell>
                       <Chip
                         label={`${(detection.confidence * 100).toFixed(1)}%`}
@@ -218,8 +227,8 @@ const Detections: React.FC = () => {
                     </TableCell>
                     <TableCell>
                       <Chip
-                        label={detection.is_blacklisted ? 'Blacklisted' : 'Normal'}
-                        color={detection.is_blacklisted ? 'error' : 'success'}
+                        label={detection.blacklist_flag ? 'Blacklisted' : 'Normal'}
+                        color={detection.blacklist_flag ? 'error' : 'success'}
                         size="small"
                       />
                     </TableCell>
@@ -16,19 +16,43 @@ export interface Camera {
   location: string;
   rtsp_url: string;
   is_active: boolean;
+  retention_days?: number | null;
+  inference_size?: number | null;
+  tile_size?: number | null;
+  tile_overlap?: number;
+  plate_regions?: string;
+  roi?: string;
+  skip_stages?: string;
   created_at: string;
 }
 
 export interface Detection {
   id: number;
   camera: number;
+  camera_details?: Camera;
   plate_number: string;
   confidence: number;
   timestamp: string;
-  image_path?: string;
+  image_path?: string | null;
+  video_path?: string | null;
   blacklist_flag: boolean;
 }
 
+// One page of a cursor-paginated list
+export interface CursorPage<T> {
+  next: string | null;
+  previous: string | null;
+  results: T[];
+}
+
+// Detection list filters; the event stream accepts the same ones
+export interface DetectionFilters {
+  plate_search?: string;
+  blacklist_flag?: boolean;
+  start_date?: string;
+  end_date?: string;
+}
+
 export interface BlacklistEntry {
   id: number;
   plate_number: string;
@@ -55,9 +79,9 @@ export const cameraAPI = {
 };
 
 export const detectionAPI = {
-  getAll: (params?: any) => api.get<Detection[]>('/detections/', { params }),
+  getAll: (params?: any) => api.get<CursorPage<Detection>>('/detections/', { params }),
   getById: (id: number) => api.get<Detection>(`/detections/${id}/`),
-  getStats: () => api.get('/detections/stats/'),
+  getStats: (params?: any) => api.get('/stats/', { params }),
 };
 
 export const blacklistAPI = {
@@ -74,6 +98,46 @@ export const alertAPI = {
   resolve: (id: number) => api.patch(`/alerts/${id}/`, { is_resolved: true }),
 };
 
+// Live detection/alert push (Server-Sent Events). Returns a function that closes the stream.
+export const subscribeEvents = (
+  handlers: { detection?: (detection: Detection) => void; alert?: (alert: Alert) => void; reset?: () => void },
+  params: { camera?: number[]; blacklist_only?: boolean } & DetectionFilters = {}
+) => {
+  const query = new URLSearchParams();
+  query.set('types', Object.keys(handlers).filter((type) => type !== 'reset').join(','));
+  if (params.camera && params.camera.length) {
+    query.set('camera', params.camera.join(','));
+  }
+  if (params.blacklist_only) {
+    query.set('blacklist_only', 'true');
+  }
+  if (params.plate_search) {
+    query.set('plate_search', params.plate_search);
+  }
+  if (params.blacklist_flag !== undefined) {
+    query.set('blacklist_flag', String(params.blacklist_flag));
+  }
+  if (params.start_date) {
+    query.set('start_date', params.start_date);
+  }
+  if (params.end_date) {
+    query.set('end_date', params.end_date);
+  }
+
+  // EventSource reconnects on its own and resumes with Last-Event-ID
+  const source = new EventSource(`${API_BASE_URL}/events/?${query.toString()}`);
+  if (handlers.detection) {
+    source.addEventListener('detection', (event) => handlers.detection!(JSON.parse((event as MessageEvent).data)));
+  }
+  if (handlers.alert) {
+    source.addEventListener('alert', (event) => handlers.alert!(JSON.parse((event as MessageEvent).data)));
+  }
+  if (handlers.reset) {
+    source.addEventListener('reset', () => handlers.reset!());
+  }
+  return () => source.close();
+};
+
 export const reportAPI = {
   generate: (params: any) => api.get('/reports/', { params }),
 };